@@ -0,0 +1,102 @@
+"""
+Micro-benchmark of the iterations of the proximal methods (DR, P-PDS and PF-PDS).
+
+For each method, it reports the running time of one iteration and the memory allocated
+by one iteration, in vectors of size d. The allocations are measured with tracemalloc :
+at each line executed in classo, the growth of the traced memory since the previous line
+is added up (so the temporaries that are freed within a line are counted once).
+Both are computed from the difference between two runs with different numbers
+of iterations, so the set-up of the problem (products and factorizations) is not counted.
+"""
+import sys
+import tracemalloc
+from time import time
+
+from classo import random_data
+from classo.misc_functions import solver_budget
+from classo.solve_R1 import problem_R1, Classo_R1
+from classo.solve_R2 import problem_R2, Classo_R2
+from classo.solve_R3 import problem_R3, Classo_R3
+from classo.solve_R4 import problem_R4, Classo_R4
+
+SIZES = [(100, 1000), (500, 500), (1000, 200)]
+N1, N2 = 20, 220
+lam = 0.1
+
+METHODS = [
+    ("R1", "DR", problem_R1, Classo_R1),
+    ("R1", "P-PDS", problem_R1, Classo_R1),
+    ("R1", "PF-PDS", problem_R1, Classo_R1),
+    ("R2", "DR", problem_R2, Classo_R2),
+    ("R2", "P-PDS", problem_R2, Classo_R2),
+    ("R2", "PF-PDS", problem_R2, Classo_R2),
+    ("R3", "DR", problem_R3, Classo_R3),
+    ("R4", "DR", problem_R4, Classo_R4),
+]
+
+
+def run(typ, meth, problem, solve, matrices, N):
+    if typ in ["R1", "R3"]:
+        pb = problem(matrices, meth)
+    else:
+        pb = problem(matrices, meth, 1.345)
+    pb.tol = 0.0  # so that the iterations do not stop before the budget
+    pb.budget = solver_budget(max_iter=N)
+    solve(pb, lam)
+    return pb.budget.iterations
+
+
+def timed(*args):
+    t0 = time()
+    iterations = run(*args)
+    return time() - t0, iterations
+
+
+# growth of the traced memory, added up over the lines executed in classo
+allocated = [0, 0]
+
+
+def trace_lines(frame, event, arg):
+    if event == "line":
+        current, peak = tracemalloc.get_traced_memory()
+        allocated[0] += max(peak - allocated[1], 0)
+        tracemalloc.reset_peak()
+        allocated[1] = tracemalloc.get_traced_memory()[0]
+    return trace_lines
+
+
+def trace_calls(frame, event, arg):
+    if "classo" in frame.f_code.co_filename:
+        return trace_lines
+    return None
+
+
+def traced(*args):
+    allocated[0] = 0
+    tracemalloc.start()
+    allocated[1] = tracemalloc.get_traced_memory()[0]
+    sys.settrace(trace_calls)
+    iterations = run(*args)
+    sys.settrace(None)
+    tracemalloc.stop()
+    return allocated[0], iterations
+
+
+print(
+    "{:>5} {:>5} | {:>3} {:>7} | {:>16} {:>20}".format(
+        "n", "d", "", "method", "time / iter (us)", "alloc / iter (x 8d B)"
+    )
+)
+for n, d in SIZES:
+    (X, C, y), sol = random_data(n, d, 5, 1, 0.5, zerosum=True, seed=0)
+    for typ, meth, problem, solve in METHODS:
+        args = (typ, meth, problem, solve, (X, C, y))
+        (t1, i1), (t2, i2) = [timed(*args, N) for N in [N1, N2]]
+        (a1, j1), (a2, j2) = [traced(*args, N) for N in [N1, N2]]
+        time_iter = 1e6 * (t2 - t1) / (i2 - i1)
+        alloc_iter = (a2 - a1) / (j2 - j1) / (8 * d)
+        print(
+            "{:>5} {:>5} | {:>3} {:>7} | {:>16.1f} {:>20.1f}".format(
+                n, d, typ, meth, time_iter, alloc_iter
+            )
+        )
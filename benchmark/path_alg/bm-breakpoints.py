@@ -0,0 +1,92 @@
+"""
+Micro-benchmark of the search of the next breaking point in the path algorithm.
+
+It compares, for one breaking point, the former loops over the d parameters and over the n samples
+with the array computation now done in classo.path_alg (activity_steps and first_switch).
+"""
+import numpy as np
+from classo.path_alg import activity_steps, first_switch
+from time import time
+
+N_repeat = 5
+SIZES = [(100, 1000), (1000, 10000), (5000, 50000)]
+
+
+def loop_activity_steps(activity, beta, beta_dot, lam_s_dot, s, lam, lambdamax):
+    L = [lam] * len(beta)
+    for i in range(len(beta)):
+        bi, di, e, s0 = beta[i], beta_dot[i], lam_s_dot[i], s[i]
+        if activity[i]:
+            if abs(bi * di) > 1e-10 and bi * di > 0:
+                L[i] = bi / (di * lambdamax)
+        else:
+            if abs(e - s0) < 1e-10 or abs(s0) > 1:
+                continue
+            if e > s0:
+                dl = (1 + s0) / (1 + e)
+            else:
+                dl = (1 - s0) / (1 - e)
+            L[i] = dl * lam
+    return L
+
+
+def loop_switch(r, yADl, rho, dlamb):
+    j_switch = None
+    for j in range(len(r)):
+        if yADl[j] != 0.0:
+            dlmax = (1 - r[j]) / yADl[j]
+            dlhuber = (rho - r[j]) / yADl[j]
+        else:
+            dlmax, dlhuber = dlamb + 1, dlamb + 1
+        if dlmax <= 0.0 or abs(r[j] - 1) < 1e-10:
+            dlmax = dlamb + 1
+        if dlhuber <= 0.0 or abs(r[j] - rho) < 1e-10:
+            dlhuber = dlamb + 1
+        dl = min(dlhuber, dlmax)
+        if dl < dlamb:
+            j_switch, dlamb = j, dl
+    return j_switch, dlamb
+
+
+def vect_switch(r, yADl, rho, dlamb):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dlmax = (1 - r) / yADl
+        dlhuber = (rho - r) / yADl
+    dlmax[(yADl == 0.0) | ~(dlmax > 0.0) | (abs(r - 1) < 1e-10)] = np.inf
+    dlhuber[(yADl == 0.0) | ~(dlhuber > 0.0) | (abs(r - rho) < 1e-10)] = np.inf
+    return first_switch(np.minimum(dlhuber, dlmax), dlamb)
+
+
+rng = np.random.RandomState(0)
+print("{:>7} {:>7} | {:>12} {:>12} {:>8} | {:>12} {:>12} {:>8}".format(
+    "n", "d", "loop d (s)", "vect d (s)", "speedup", "loop n (s)", "vect n (s)", "speedup"))
+for n, d in SIZES:
+    activity = list(rng.rand(d) < 0.05)
+    beta = rng.randn(d) * np.array(activity)
+    beta_dot = rng.randn(d) * np.array(activity)
+    lam_s_dot = rng.uniform(-2, 2, d)
+    s = np.clip(rng.uniform(-1.2, 1.2, d), -1, 1)
+    lam, lambdamax, rho = 0.5, 10.0, -1.0
+    r, yADl = rng.uniform(-2, 2, n), rng.randn(n)
+
+    t0 = time()
+    for _ in range(N_repeat):
+        L_loop = loop_activity_steps(activity, beta, beta_dot, lam_s_dot, s, lam, lambdamax)
+    t1 = time()
+    skip = (abs(lam_s_dot - s) < 1e-10) | (abs(s) > 1)
+    for _ in range(N_repeat):
+        L_vect = activity_steps(activity, beta, beta_dot, lam_s_dot, s, lam, lambdamax, skip)
+    t2 = time()
+    dlamb = min(np.min(L_vect), lam)
+    for _ in range(N_repeat):
+        sw_loop = loop_switch(r, yADl, rho, dlamb)
+    t3 = time()
+    for _ in range(N_repeat):
+        sw_vect = vect_switch(r, yADl, rho, dlamb)
+    t4 = time()
+
+    assert np.allclose(L_loop, L_vect) and sw_loop == sw_vect
+
+    T = [(t1 - t0) / N_repeat, (t2 - t1) / N_repeat, (t3 - t2) / N_repeat, (t4 - t3) / N_repeat]
+    print("{:>7} {:>7} | {:>12.2e} {:>12.2e} {:>8.1f} | {:>12.2e} {:>12.2e} {:>8.1f}".format(
+        n, d, T[0], T[1], T[0] / T[1], T[2], T[3], T[2] / T[3]))
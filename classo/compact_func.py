@@ -2,10 +2,34 @@ import numpy as np
 import numpy.linalg as LA
 
 from .solve_R1 import problem_R1, Classo_R1, pathlasso_R1
-from .solve_R2 import problem_R2, Classo_R2, pathlasso_R2
+from .solve_R2 import problem_R2, Classo_R2, pathlasso_R2, h_prime as h_prime_R2
 from .solve_R3 import problem_R3, Classo_R3, pathlasso_R3
-from .solve_R4 import problem_R4, Classo_R4, pathlasso_R4
-from .path_alg import solve_path, pathalgo_general, h_lambdamax
+from .solve_R4 import (
+    problem_R4,
+    Classo_R4,
+    pathlasso_R4,
+    find_sigmax,
+    h_prime as h_prime_R4,
+)
+from .path_alg import (
+    parameters_for_update,
+    solve_path,
+    pathalgo_general,
+    h_lambdamax,
+    sparse_path,
+    to_sparse_path,
+)
+from .coordinate_descent import coordinate_descent, pathlasso_CD
+from .misc_functions import duality_gap, solver_budget
+from .screening import (
+    loss_residual,
+    active_set,
+    kkt_correlations,
+    strong_rule,
+    gap_safe_R1,
+    kkt_violations,
+    restrict_constraint,
+)
 
 
 """
@@ -14,7 +38,7 @@ they can call every algorithm acording
 to the method and formulation required
 """
 
-# can be 'Path-Alg', 'P-PDS' , 'PF-PDS' or 'DR'
+# can be 'Path-Alg', 'P-PDS' , 'PF-PDS', 'DR' or 'CD' (R1, R2 and C1 only)
 
 
 def Classo(
@@ -30,7 +54,21 @@ def Classo(
     w=None,
     intercept=False,
     return_sigm=True,
+    anderson=0,
+    gap=None,
+    budget=None,
 ):
+    """
+    If anderson > 0, the iterations of DR, P-PDS and PF-PDS are accelerated with an
+    Anderson acceleration of memory anderson (see misc_functions.anderson).
+    The method 'CD' is the coordinate descent (see coordinate_descent), for R1, R2 and C1.
+    If gap is given, the iterative methods stop when the relative duality gap is smaller than gap
+    (see misc_functions.duality_gap), instead of the step criterion.
+    budget is a misc_functions.solver_budget with the iteration and time budgets of the iterative methods,
+    which receives the diagnostics of their convergence. When a budget runs out, the last iterate is returned.
+    """
+    if budget is None:
+        budget = solver_budget()
 
     if w is not None:
         matrices = (matrix[0] / w, matrix[1] / w, matrix[2])
@@ -57,6 +95,7 @@ def Classo(
         else:
             r = np.sqrt(2 * e / len(matrices[0]))
             pb = problem_R3((matrices[0] * r, matrices[1], matrices[2] * r), meth)
+        pb.anderson, pb.gap_tol, pb.budget = anderson, gap, budget
         lambdamax = pb.lambdamax
         if true_lam:
             beta, s = Classo_R3(pb, lam / lambdamax)
@@ -84,6 +123,7 @@ def Classo(
                 intercept=intercept,
             )
 
+        pb.anderson, pb.gap_tol, pb.budget = anderson, gap, budget
         lambdamax = pb.lambdamax
         if true_lam:
             beta, s = Classo_R4(pb, lam / lambdamax)
@@ -92,9 +132,10 @@ def Classo(
 
     elif typ == "R2":
 
-        if meth not in ["Path-Alg", "P-PDS", "PF-PDS", "DR"]:
+        if meth not in ["Path-Alg", "P-PDS", "PF-PDS", "DR", "CD"]:
             meth = "ODE"
         pb = problem_R2(matrices, meth, rho, intercept=intercept)
+        pb.anderson, pb.gap_tol, pb.budget = anderson, gap, budget
         lambdamax = pb.lambdamax
         if true_lam:
             beta = Classo_R2(pb, lam / lambdamax)
@@ -105,22 +146,22 @@ def Classo(
 
         assert set(matrices[2]).issubset({1, -1})
 
-        lambdamax = h_lambdamax(
-            matrices, rho_classification, typ="C2", intercept=intercept
+        # the state of the path algorithm gives lambdamax, and is then used to compute the path
+        param = parameters_for_update(
+            matrices, 0.0, rho_classification, "C2", intercept=intercept
         )
+        lambdamax = param.lambdamax
         if true_lam:
-            out = solve_path(
-                matrices,
-                lam / lambdamax,
-                False,
-                rho_classification,
-                "C2",
-                intercept=intercept,
-            )
-        else:
-            out = solve_path(
-                matrices, lam, False, rho_classification, "C2", intercept=intercept
-            )
+            lam = lam / lambdamax
+        out = solve_path(
+            matrices,
+            lam,
+            False,
+            rho_classification,
+            "C2",
+            intercept=intercept,
+            param=param,
+        )
         if intercept:
             beta0, beta = out[0][-1], out[1][-1]
             beta = np.array([beta0] + list(beta))
@@ -131,18 +172,25 @@ def Classo(
 
         assert set(matrices[2]).issubset({1, -1})
 
-        lambdamax = h_lambdamax(matrices, 0, typ="C1", intercept=intercept)
-        if true_lam:
+        if meth == "CD":
+            lambdamax = h_lambdamax(matrices, 0, "C1", intercept=intercept)
+            if true_lam:
+                lam = lam / lambdamax
+            cd = classification_CD(matrices, intercept, gap, budget)
+            beta = cd.solve(lam * lambdamax)
+        else:
+            param = parameters_for_update(matrices, 0.0, 0, "C1", intercept=intercept)
+            lambdamax = param.lambdamax
+            if true_lam:
+                lam = lam / lambdamax
             out = solve_path(
-                matrices, lam / lambdamax, False, 0, "C1", intercept=intercept
+                matrices, lam, False, 0, "C1", intercept=intercept, param=param
             )
-        else:
-            out = solve_path(matrices, lam, False, 0, "C1", intercept=intercept)
-        if intercept:
-            beta0, beta = out[0][-1], out[1][-1]
-            beta = np.array([beta0] + list(beta))
-        else:
-            beta = out[0][-1]
+            if intercept:
+                beta0, beta = out[0][-1], out[1][-1]
+                beta = np.array([beta0] + list(beta))
+            else:
+                beta = out[0][-1]
 
     else:  # LS
         if intercept:
@@ -153,9 +201,10 @@ def Classo(
             Xbar, ybar = np.mean(X, axis=0), np.mean(y)
             matrices = (X - Xbar, C, y - ybar)
 
-        if meth not in ["Path-Alg", "P-PDS", "PF-PDS", "DR"]:
+        if meth not in ["Path-Alg", "P-PDS", "PF-PDS", "DR", "CD"]:
             meth = "DR"
         pb = problem_R1(matrices, meth)
+        pb.anderson, pb.gap_tol, pb.budget = anderson, gap, budget
         lambdamax = pb.lambdamax
         if true_lam:
             beta = Classo_R1(pb, lam / lambdamax)
@@ -197,7 +246,35 @@ def pathlasso(
     rho_classification=-1.0,
     w=None,
     intercept=False,
+    sparse=False,
+    screening=False,
+    anderson=0,
+    working_set=False,
+    init=None,
+    gap=None,
+    budget=None,
+    products=None,
+    guide=None,
+    states=None,
 ):
+    """
+    If sparse, the solution path is returned as a sparse_path (with the real lambdas) instead of the array BETA.
+    With Path-Alg, it stores only the breaking points of the path.
+    If screening, each lambda is solved on the features kept by the screening rules (see pathlasso_screening).
+    If working_set, each lambda is solved on a growing working set of features (see pathlasso_working_set).
+    If anderson > 0, the iterations of DR, P-PDS and PF-PDS are accelerated (see Classo).
+    init is a solution (with the intercept first if intercept) used to warm start the iterative methods.
+    If gap is given, the iterative methods stop on the duality gap (see Classo).
+    budget has the iteration and time budgets of the iterative methods, for the whole path (see Classo).
+    products are the gram_products of matrix, if they are already computed (for example downdated
+    from the products of a larger data set) : for R1 and R3, the solvers then use them instead of
+    the products of the matrices (see misc_functions.gram_products).
+    With the iterative methods of R1 to R4, the states of the iterations after each lambda are appended
+    to the list states if it is given, and the warm starts follow guide, the states of the path on related data,
+    if it is given (see misc_functions.guided_state).
+    """
+    if budget is None:
+        budget = solver_budget()
 
     Nactive = n_active
     if Nactive == 0:
@@ -214,18 +291,61 @@ def pathlasso(
 
     if w is not None:
         matrices = (matrix[0] / w, matrix[1] / w, matrix[2])
+        if products is not None:
+            products = products.scaled(w=w)
     else:
         matrices = matrix
 
     X, C, y = matrices
+    if intercept and products is not None:
+        products = products.centered()
 
-    if typ == "R2":
+    if screening or working_set:
+
+        lambdamax = lambda_max(
+            matrices,
+            typ=typ,
+            rho=rho,
+            e=e,
+            rho_classification=rho_classification,
+            intercept=intercept,
+        )
+        if true_lam:
+            lambdass = [lamb / lambdamax for lamb in lambdass]
+        reduced = pathlasso_working_set if working_set else pathlasso_screening
+        BETA, S = reduced(
+            matrices,
+            lambdass,
+            lambdamax,
+            typ=typ,
+            meth=meth,
+            rho=rho,
+            e=e,
+            rho_classification=rho_classification,
+            intercept=intercept,
+            n_active=Nactive,
+            anderson=anderson,
+            gap=gap,
+            budget=budget,
+        )
+
+    elif typ == "R2":
 
         pb = problem_R2(matrices, meth, rho, intercept=intercept)
+        pb.anderson, pb.gap_tol, pb.budget = anderson, gap, budget
+        if init is not None:
+            pb.warm_start(init)
         lambdamax = pb.lambdamax
         if true_lam:
             lambdass = [lamb / lambdamax for lamb in lambdass]
-        BETA = pathlasso_R2(pb, lambdass, n_active=Nactive)
+        BETA = pathlasso_R2(
+            pb,
+            lambdass,
+            n_active=Nactive,
+            sparse=sparse,
+            guide=guide,
+            states=states,
+        )
 
     elif typ == "R3":
         if intercept:
@@ -234,18 +354,29 @@ def pathlasso(
             matrices = (X - Xbar, C, y - ybar)
         if e is None or e == len(matrices[0]) / 2:
             r = 1.0
-            pb = problem_R3(matrices, meth)
+            pb = problem_R3(matrices, meth, products=products)
         else:
             r = np.sqrt(2 * e / len(matrices[0]))
-            pb = problem_R3((matrices[0] * r, matrices[1], matrices[2] * r), meth)
+            if products is not None:
+                products = products.scaled(r=r)
+            pb = problem_R3(
+                (matrices[0] * r, matrices[1], matrices[2] * r),
+                meth,
+                products=products,
+            )
+        pb.anderson, pb.gap_tol, pb.budget = anderson, gap, budget
+        if init is not None:
+            pb.warm_start(init[1:] if intercept else init)
         lambdamax = pb.lambdamax
         if true_lam:
             lambdass = [lamb / lambdamax for lamb in lambdass]
-        BETA, S = pathlasso_R3(pb, lambdass, n_active=Nactive)
+        BETA, S = pathlasso_R3(
+            pb, lambdass, n_active=Nactive, guide=guide, states=states
+        )
         S = np.array(S) / r ** 2
         BETA = np.array(BETA)
         if intercept:
-            BETA = np.array([[ybar - Xbar.dot(beta)] + list(beta) for beta in BETA])
+            BETA = add_intercept(BETA, ybar, Xbar)
 
     elif typ == "R4":
 
@@ -261,10 +392,15 @@ def pathlasso(
                 intercept=intercept,
             )
 
+        pb.anderson, pb.gap_tol, pb.budget = anderson, gap, budget
+        if init is not None:
+            pb.warm_start(init)
         lambdamax = pb.lambdamax
         if true_lam:
             lambdass = [lamb / lambdamax for lamb in lambdass]
-        BETA, S = pathlasso_R4(pb, lambdass, n_active=Nactive)
+        BETA, S = pathlasso_R4(
+            pb, lambdass, n_active=Nactive, guide=guide, states=states
+        )
         S = np.array(S) / r ** 2
         BETA = np.array(BETA)
 
@@ -272,9 +408,10 @@ def pathlasso(
 
         assert set(matrices[2]).issubset({1, -1})
 
-        lambdamax = h_lambdamax(
-            matrices, rho_classification, typ="C2", intercept=intercept
+        param = parameters_for_update(
+            matrices, 0.0, rho_classification, "C2", intercept=intercept
         )
+        lambdamax = param.lambdamax
         if true_lam:
             lambdass = [lamb / lambdamax for lamb in lambdass]
         BETA = pathalgo_general(
@@ -284,18 +421,39 @@ def pathlasso(
             n_active=Nactive,
             rho=rho_classification,
             intercept=intercept,
+            sparse=sparse,
+            param=param,
         )
 
     elif typ == "C1":
 
         assert set(matrices[2]).issubset({1, -1})
 
-        lambdamax = h_lambdamax(matrices, 0, typ="C1", intercept=intercept)
-        if true_lam:
-            lambdass = [lamb / lambdamax for lamb in lambdass]
-        BETA = pathalgo_general(
-            matrices, lambdass, "C1", n_active=Nactive, intercept=intercept
-        )
+        if meth == "CD":
+            lambdamax = h_lambdamax(matrices, 0, "C1", intercept=intercept)
+            if true_lam:
+                lambdass = [lamb / lambdamax for lamb in lambdass]
+            BETA = pathlasso_CD(
+                classification_CD(matrices, intercept, gap, budget),
+                lambdass,
+                lambdamax,
+                n_active=Nactive,
+                beta=init,
+            )
+        else:
+            param = parameters_for_update(matrices, 0.0, 0, "C1", intercept=intercept)
+            lambdamax = param.lambdamax
+            if true_lam:
+                lambdass = [lamb / lambdamax for lamb in lambdass]
+            BETA = pathalgo_general(
+                matrices,
+                lambdass,
+                "C1",
+                n_active=Nactive,
+                intercept=intercept,
+                sparse=sparse,
+                param=param,
+            )
 
     else:  # R1
         if intercept:
@@ -305,25 +463,342 @@ def pathlasso(
             #  we can solve standard problem
             Xbar, ybar = np.mean(X, axis=0), np.mean(y)
             matrices = (X - Xbar, C, y - ybar)
-        pb = problem_R1(matrices, meth)
+        pb = problem_R1(matrices, meth, products=products)
+        pb.anderson, pb.gap_tol, pb.budget = anderson, gap, budget
+        if init is not None:
+            pb.warm_start(init[1:] if intercept else init)
         lambdamax = pb.lambdamax
         if true_lam:
             lambdass = [lamb / lambdamax for lamb in lambdass]
-        BETA = pathlasso_R1(pb, lambdass, n_active=n_active)
+        BETA = pathlasso_R1(
+            pb,
+            lambdass,
+            n_active=n_active,
+            sparse=sparse,
+            guide=guide,
+            states=states,
+        )
 
-        if intercept:
-            BETA = np.array([[ybar - Xbar.dot(beta)] + list(beta) for beta in BETA])
+        if intercept and type(BETA) == sparse_path:
+            BETA.add_intercept(ybar, Xbar)
+        elif intercept:
+            BETA = add_intercept(BETA, ybar, Xbar)
 
     real_path = [lam * lambdamax for lam in lambdass]
 
+    if sparse:
+        if type(BETA) == sparse_path:
+            BETA.lambdas = BETA.lambdas * lambdamax
+        else:
+            BETA = to_sparse_path(BETA, real_path, intercept=intercept)
+        if w is not None:
+            BETA.scale(w)
+        if typ in ["R3", "R4"] and return_sigm:
+            return (BETA, real_path, S)
+        return (BETA, real_path)
+
     if w is not None:
         if intercept:
             ww = np.array([1] + list(w))
         else:
             ww = w
 
-        BETA = np.array([beta / ww for beta in BETA])
+        BETA = np.asarray(BETA) / ww
 
     if typ in ["R3", "R4"] and return_sigm:
         return (np.array(BETA), real_path, S)
     return (np.array(BETA), real_path)
+
+
+def lambda_max(
+    matrices, typ="R1", rho=1.345, e=None, rho_classification=-1.0, intercept=False
+):
+    """
+    Compute the lambdamax of the problem, with the same scalings as Classo and pathlasso,
+    from A^t h'(r) at beta = 0 only : neither the problem classes nor the state of the
+    path algorithm are built.
+    """
+    X, C, y = matrices
+    m = len(y)
+    if typ == "C2":
+        return h_lambdamax(matrices, rho_classification, typ="C2", intercept=intercept)
+    elif typ == "C1":
+        return h_lambdamax(matrices, 0, typ="C1", intercept=intercept)
+
+    if intercept:
+        # centering y is enough, as X^t.(y - ybar) = (X - Xbar)^t.(y - ybar)
+        y = y - np.mean(y)
+    if typ == "R2":
+        return 2 * LA.norm(X.T.dot(h_prime_R2(y, rho)), np.inf)
+    elif typ == "R3":
+        r = 1.0 if e is None else np.sqrt(2 * e / m)
+        sigmax = LA.norm(y * r) / np.sqrt(m / 2)
+        return 2 * LA.norm(X.T.dot(y) * r ** 2, np.inf) / sigmax
+    elif typ == "R4":
+        r = 1.0 if e is None else np.sqrt(e / m)
+        sigmax = find_sigmax(y * r, rho / r, m)
+        return 2 * r * LA.norm(X.T.dot(h_prime_R4(y * r / sigmax, rho / r)), np.inf)
+    return 2 * LA.norm(X.T.dot(y), np.inf)
+
+
+def solution_gap(
+    matrices,
+    beta,
+    lamb,
+    typ="R1",
+    rho=1.345,
+    e=None,
+    rho_classification=-1.0,
+    w=None,
+    intercept=False,
+):
+    """
+    Relative duality gap (see misc_functions.duality_gap) of a solution beta of Classo or pathlasso,
+    for the real lambda lamb, with the same scalings (w, e, and the centering for the intercept of R1 and R3).
+    """
+    X, C, y = matrices
+    m = len(y)
+    beta = np.array(beta, dtype=float)
+    start = 1 if intercept else 0
+    if w is not None:
+        X, C = X / w, C / w
+        beta[start:] = beta[start:] * w
+    if typ in ["R1", "R3"] and intercept:
+        X, y, beta, intercept = X - np.mean(X, axis=0), y - np.mean(y), beta[1:], False
+    if typ == "R3" and e is not None:
+        r = np.sqrt(2 * e / m)
+        X, y = X * r, y * r
+    elif typ == "R4" and e is not None:
+        r = np.sqrt(e / m)
+        X, y, rho = X * r, y * r, rho / r
+    elif typ == "C2":
+        rho = rho_classification
+    return duality_gap((X, C, y), beta, lamb, typ, rho, intercept=intercept)
+
+
+def pathlasso_screening(
+    matrices,
+    lambdass,
+    lambdamax,
+    typ="R1",
+    meth="DR",
+    rho=1.345,
+    e=None,
+    rho_classification=-1.0,
+    intercept=False,
+    n_active=False,
+    anderson=0,
+    gap=None,
+    budget=None,
+):
+    """
+    Compute the solutions for the (decreasing, rescaled) lambdas of lambdass,
+    each of them on the problem reduced to the features kept by the sequential strong rule
+    (and the gap-safe rule for R1), so AtA, Proj and the iterations of the solvers
+    only involve the kept features. The features that violate the optimality conditions
+    of the whole problem are added back until there is none.
+    The reduced problems are solved with pathlasso, on one lambda.
+    Returns the list of solutions, and the list of sigmas (None if not R3 or R4).
+    """
+    A, C, y = matrices
+    m, d = A.shape
+    scaled, rho_r = matrices, rho
+    if typ == "R4" and e is not None:
+        r = np.sqrt(e / m)
+        scaled, rho_r = (A * r, C, y * r), rho / r
+
+    if typ == "R1" and intercept:
+        centered = (A - np.mean(A, axis=0), C, y - np.mean(y))
+    else:
+        centered = matrices
+
+    start = 1 if intercept else 0
+    beta, s = np.zeros(d + start), None
+    if intercept:
+        beta[0] = np.mean(scaled[2])
+    if type(n_active) == int and n_active > 0:
+        n_act = n_active
+    else:
+        n_act = d + 1
+
+    BETA, S, lam_prev = [], [], 1.0
+    for lam in lambdass:
+        u = loss_residual(scaled, beta, typ, rho_r, rho_classification, intercept)
+        c, lamb = kkt_correlations(scaled, u, beta, intercept)
+        if not np.any(active_set(beta[start:])):
+            lam_prev = 1.0
+        kept = strong_rule(c, lamb, lam, lam_prev, beta, intercept)
+        if typ == "R1":
+            kept &= gap_safe_R1(
+                centered, beta[start:], 2 * c, lam * lambdamax
+            ) | active_set(beta[start:])
+        kept[np.argmax(abs(c))] = True
+
+        while True:
+            out = pathlasso(
+                (A[:, kept], restrict_constraint(C, kept), y),
+                lambdas=[lam * lambdamax],
+                typ=typ,
+                meth=meth,
+                rho=rho,
+                true_lam=True,
+                e=e,
+                return_sigm=True,
+                rho_classification=rho_classification,
+                intercept=intercept,
+                anderson=anderson,
+                gap=gap,
+                budget=budget,
+            )
+            sol = out[0][0]
+            if typ in ["R3", "R4"]:
+                s = out[2][0]
+            beta = np.zeros(d + start)
+            if intercept:
+                beta[0] = sol[0]
+            beta[start:][kept] = sol[start:]
+
+            u = loss_residual(scaled, beta, typ, rho_r, rho_classification, intercept)
+            c, lamb = kkt_correlations(scaled, u, beta, intercept)
+            if not np.any(active_set(beta[start:])):
+                lamb = lamb * lam
+            violations = kkt_violations(c, lamb, kept)
+            if not np.any(violations):
+                break
+            kept |= violations
+
+        BETA.append(beta)
+        S.append(s)
+        lam_prev = lam
+        if np.sum(abs(beta[start:]) > 1e-5) >= n_act:
+            BETA.extend([beta] * (len(lambdass) - len(BETA)))
+            S.extend([s] * (len(lambdass) - len(S)))
+            break
+
+    return BETA, S
+
+
+def pathlasso_working_set(
+    matrices,
+    lambdass,
+    lambdamax,
+    typ="R1",
+    meth="DR",
+    rho=1.345,
+    e=None,
+    rho_classification=-1.0,
+    intercept=False,
+    n_active=False,
+    anderson=0,
+    gap=None,
+    budget=None,
+    size=10,
+):
+    """
+    Compute the solutions for the (decreasing, rescaled) lambdas of lambdass, each of them
+    on a working set of features : the problem reduced to the working set is solved, then the
+    optimality conditions of the whole problem (with the multiplier of the constraint, see kkt_correlations)
+    are checked on the other features, and the largest violators are added to the working set,
+    which at most doubles, until there is none.
+    The working set starts with the active set of the previous lambda and the size features of largest
+    correlations, and the reduced problems are warm started with the last solution, along the path too.
+    Returns the list of solutions, and the list of sigmas (None if not R3 or R4).
+    """
+    A, C, y = matrices
+    m, d = A.shape
+    scaled, rho_r = matrices, rho
+    if typ == "R4" and e is not None:
+        r = np.sqrt(e / m)
+        scaled, rho_r = (A * r, C, y * r), rho / r
+
+    start = 1 if intercept else 0
+    beta, s = np.zeros(d + start), None
+    if intercept:
+        beta[0] = np.mean(scaled[2])
+    if type(n_active) == int and n_active > 0:
+        n_act = n_active
+    else:
+        n_act = d + 1
+
+    BETA, S = [], []
+    for lam in lambdass:
+        u = loss_residual(scaled, beta, typ, rho_r, rho_classification, intercept)
+        c = kkt_correlations(scaled, u, beta, intercept)[0]
+        kept = active_set(beta[start:])
+        candidates = np.nonzero(~kept)[0]
+        kept[candidates[np.argsort(-abs(c[candidates]))[:size]]] = True
+
+        while True:
+            out = pathlasso(
+                (A[:, kept], restrict_constraint(C, kept), y),
+                lambdas=[lam * lambdamax],
+                typ=typ,
+                meth=meth,
+                rho=rho,
+                true_lam=True,
+                e=e,
+                return_sigm=True,
+                rho_classification=rho_classification,
+                intercept=intercept,
+                anderson=anderson,
+                gap=gap,
+                budget=budget,
+                init=np.concatenate([beta[:start], beta[start:][kept]]),
+            )
+            sol = out[0][0]
+            if typ in ["R3", "R4"]:
+                s = out[2][0]
+            beta = np.zeros(d + start)
+            if intercept:
+                beta[0] = sol[0]
+            beta[start:][kept] = sol[start:]
+
+            u = loss_residual(scaled, beta, typ, rho_r, rho_classification, intercept)
+            c, lamb = kkt_correlations(scaled, u, beta, intercept)
+            if not np.any(active_set(beta[start:])):
+                lamb = lamb * lam
+            violations = np.nonzero(kkt_violations(c, lamb, kept))[0]
+            if len(violations) == 0:
+                break
+            largest = np.argsort(-abs(c[violations]))[: max(size, np.sum(kept))]
+            kept[violations[largest]] = True
+
+        BETA.append(beta)
+        S.append(s)
+        if np.sum(abs(beta[start:]) > 1e-5) >= n_act:
+            BETA.extend([beta] * (len(lambdass) - len(BETA)))
+            S.extend([s] * (len(lambdass) - len(S)))
+            break
+
+    return BETA, S
+
+
+def classification_CD(matrices, intercept=False, gap=None, budget=None):
+    """Coordinate descent solver of C1 (see coordinate_descent),
+    where the intercept is an unpenalized first variable, out of the constraint"""
+    A, C, y = matrices
+    if budget is None:
+        budget = solver_budget()
+    weights = np.ones(A.shape[1])
+    if intercept:
+        A = np.concatenate([np.ones((len(A), 1)), A], axis=1)
+        C = np.concatenate([np.zeros((len(C), 1)), C], axis=1)
+        weights = np.concatenate([[0.0], weights])
+    return coordinate_descent(
+        (A, C, y),
+        "C1",
+        weights=weights,
+        N=budget.max_iter,
+        gap_tol=gap,
+        budget=budget,
+    )
+
+
+def add_intercept(BETA, ybar, Xbar):
+    """Add the intercept ybar - Xbar.beta in the first column of BETA,
+    for R1 and R3 where the problem is solved on centered data"""
+    BETA = np.asarray(BETA)
+    out = np.empty((len(BETA), BETA.shape[1] + 1))
+    out[:, 1:] = BETA
+    out[:, 0] = ybar - BETA.dot(Xbar)
+    return out
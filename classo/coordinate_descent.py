@@ -0,0 +1,284 @@
+import numpy as np
+import numpy.linalg as LA
+
+from .misc_functions import ker_projector, duality_gap, solver_budget
+from .path_alg import h_prime
+
+r"""
+Coordinate descent for the formulations R1, R2 and C1 :
+
+    min  sum h(r_i) + lambda ||b||1   with C.b = 0
+
+where r = Ab - y for R1 (h(r) = r^2) and R2 (Huber), and r = y * Ab for C1 (squared hinge).
+In the three cases, the derivative of the loss with respect to Ab is 2 dr h'(r), where h' is
+given by path_alg.h_prime, and the second derivative of h is at most 1.
+So along a direction D, the loss is majorized by the quadratic of curvature 2 ||A.D||^2,
+and each move of the coordinate descent minimizes exactly this majorization plus the L1 penalty
+(it is the exact minimization along D for R1).
+
+The constraint is handled according to its structure (see misc_functions.ker_projector) :
+    - zero-sum constraints, on all the variables or on disjoint groups of variables :
+      the coordinates of a group are moved by pairs, b_i + t and b_j - t, so C.b stays at 0.
+      The partner j of i is the coordinate of the group that violates the optimality conditions
+      the most in the opposite direction, as in the maximal violating pair rule of SMO.
+      The variables in no group (such as an intercept) are moved alone.
+    - other constraints : augmented Lagrangian. The coordinates are moved alone, to minimize
+      the objective plus v.Cb + mu/2 ||Cb||^2, then the multiplier is updated with v = v + mu Cb,
+      until Cb is small enough.
+
+The sweeps follow the active-set cycling : after a sweep on all the variables,
+the sweeps are done on the active variables only until they converge,
+then a sweep on all the variables checks if some other variable has to enter.
+"""
+
+
+class coordinate_descent:
+    """Coordinate descent solver of a given problem, for any lambda.
+    The quantities that do not depend on lambda are computed once, so the same object
+    can be used along a path, with warm starts.
+
+    Args :
+        matrices    : (A, C, y)
+        typ         : 'R1', 'R2' or 'C1'
+        rho         : parameter of the Huber loss, for R2
+        weights     : weights of the L1 penalty (0 for an unpenalized coefficient, such as an intercept)
+        tol         : the sweeps stop when no move changes Ab by more than tol ||y||
+        N           : maximum number of sweeps
+        gap_tol     : if it is given, the sweeps go on (with a smaller tol) until the relative duality gap
+                      is smaller than gap_tol. An unpenalized first variable is taken as an intercept.
+        budget      : solver_budget whose time budget stops the sweeps, and which counts them.
+                      When N or the time budget runs out, the current beta is returned (projected on Ker(C)).
+
+    Attributes :
+        Proj        : ker_projector of C, whose kind tells how the constraint is handled
+        groups      : group of each variable for the pairwise moves (-1 if it is moved alone)
+        lagrangian  : True if the constraint is handled with an augmented Lagrangian
+        norms2      : squared norms of the columns of A
+        gap         : duality gap of the last solution, if gap_tol is given
+        stopped     : True if the last sweeps were stopped by the budget
+    """
+
+    def __init__(
+        self,
+        matrices,
+        typ="R1",
+        rho=1.345,
+        weights=None,
+        tol=1e-5,
+        N=100000,
+        gap_tol=None,
+        budget=None,
+    ):
+        A, C, y = matrices
+        m, d = A.shape
+        self.AT, self.C, self.y, self.typ = np.ascontiguousarray(A.T), C, y, typ
+        self.rho, self.gap_tol, self.gap = rho, gap_tol, None
+        self.budget = solver_budget(N) if budget is None else budget
+        self.stopped = False
+        self.dim = (m, d, len(C))
+        self.tol, self.N = tol * LA.norm(y), N
+        self.weights = np.ones(d) if weights is None else weights
+        self.h = h_prime(rho, typ)
+        self.dr = y if typ == "C1" else 1.0
+        self.norms2 = np.sum(self.AT ** 2, axis=1)
+
+        self.Proj = ker_projector(C)
+        self.lagrangian = self.Proj.kind == "dense"
+        if self.Proj.kind == "zero-sum":
+            self.groups = np.zeros(d, dtype=int)
+        elif self.Proj.kind == "blocks":
+            self.groups = self.Proj.groups
+        else:
+            self.groups = -np.ones(d, dtype=int)
+
+        if self.lagrangian:
+            self.CT = np.ascontiguousarray(C.T)
+            self.Cnorms2 = np.sum(self.CT ** 2, axis=1)
+            # the penalization is of the same order as the curvature of the loss
+            self.mu = 2 * np.mean(self.norms2) / max(np.mean(self.Cnorms2), 1e-16)
+            # the updates of the multiplier need more accurate inner solutions
+            self.tol = self.tol / 10
+
+    # derivative of the loss with respect to Ab
+    def gradient(self, Ab):
+        if self.typ == "C1":
+            return 2 * self.dr * self.h(self.y * Ab)
+        return 2 * self.h(Ab - self.y)
+
+    def solve(self, lamb, beta=None):
+        m, d, k = self.dim
+        beta = np.zeros(d) if beta is None else np.array(beta, dtype=float)
+        if self.gap_tol is None:
+            return self.solve_tol(lamb, beta, self.tol)
+
+        # the tolerance of the sweeps is decreased until the duality gap is small enough
+        tol = self.tol
+        while True:
+            beta = self.solve_tol(lamb, beta, tol)
+            self.gap = self.duality_gap(beta, lamb)
+            if self.gap < self.gap_tol or tol < 1e-12 * self.tol or self.stopped:
+                return beta
+            tol = tol / 10
+
+    def solve_tol(self, lamb, beta, tol):
+        k = self.dim[2]
+        Ab = (self.AT.T).dot(beta)
+        if not self.lagrangian:
+            return self.sweeps(lamb, beta, Ab, tol)[0]
+
+        # augmented Lagrangian
+        v = np.zeros(k)
+        for i in range(self.N):
+            beta, Ab = self.sweeps(lamb, beta, Ab, tol, v)[:2]
+            Cb = self.C.dot(beta)
+            if LA.norm(Cb) * np.sqrt(self.mu) < tol:
+                return beta
+            if self.stopped:
+                break
+            v = v + self.mu * Cb
+        self.budget.converged, self.stopped = False, True
+        return self.Proj.dot(beta)
+
+    # relative duality gap at beta, projected on Ker(C) (see misc_functions.duality_gap)
+    def duality_gap(self, beta, lamb):
+        A, C, w = self.AT.T, self.C, self.weights
+        beta = self.Proj.dot(beta)
+        intercept = w[0] == 0
+        if intercept:
+            A, C, w = A[:, 1:], C[:, 1:], w[1:]
+        return duality_gap(
+            (A, C, self.y), beta, lamb, self.typ, self.rho, w, intercept=intercept
+        )
+
+    def sweeps(self, lamb, beta, Ab, tol, v=None):
+        w = lamb * self.weights
+        Cb = self.C.dot(beta) if v is not None else None
+        full = True
+        for i in range(self.N):
+            if full:
+                units = np.arange(len(beta))
+            else:
+                units = np.nonzero((beta != 0) | (w == 0))[0]
+            change = self.sweep(units, w, beta, Ab, v, Cb)
+            self.budget.iterations += 1
+            if change < tol and full:
+                self.stopped = False
+                break
+            full = change < tol
+            if self.budget.out_of_time():
+                self.stopped = True
+                break
+        else:
+            # the budget of sweeps ran out
+            self.budget.converged, self.stopped = False, True
+
+        if v is None:
+            return beta, Ab
+        return beta, Ab, Cb
+
+    # one sweep on the variables of units, beta, Ab and Cb are updated inplace.
+    # Returns the largest change of Ab.
+    def sweep(self, units, w, beta, Ab, v, Cb):
+        AT, groups = self.AT, self.groups
+        partners = self.partners(units, w, beta, Ab)
+        change = 0.0
+        for i in units:
+            j = partners[i]
+            g = self.gradient(Ab)
+            if j < 0:
+                # single move
+                grad, L = AT[i].dot(g), 2 * self.norms2[i]
+                if v is not None:
+                    grad += self.CT[i].dot(v + self.mu * Cb)
+                    L += self.mu * self.Cnorms2[i]
+                if L == 0.0:
+                    continue
+                t = prox(beta[i] - grad / L, w[i] / L) - beta[i]
+                if t == 0.0:
+                    continue
+                beta[i] += t
+                Ab += t * AT[i]
+                if v is not None:
+                    Cb += t * self.CT[i]
+                change = max(change, abs(t) * np.sqrt(self.norms2[i]))
+            else:
+                # pairwise move b_i + t, b_j - t
+                D = AT[i] - AT[j]
+                L = 2 * D.dot(D)
+                if L == 0.0:
+                    continue
+                t = pair_step(beta[i], beta[j], w[i], w[j], D.dot(g), L)
+                if t == 0.0:
+                    continue
+                beta[i] += t
+                beta[j] -= t
+                Ab += t * D
+                change = max(change, abs(t) * np.sqrt(L / 2))
+        return change
+
+    # partner of each variable of units for the pairwise moves (-1 for a single move) :
+    # the variable of the same group (among units) that violates the most the optimality conditions
+    # in the opposite direction, with the gradient at the beginning of the sweep.
+    def partners(self, units, w, beta, Ab):
+        partners = -np.ones(len(beta), dtype=int)
+        in_group = units[self.groups[units] >= 0]
+        if len(in_group) == 0:
+            return partners
+        G = self.AT[in_group].dot(self.gradient(Ab))
+        b = beta[in_group]
+        # directional derivatives of the objective along +e_i and -e_i
+        up = G + w[in_group] * np.where(b >= 0, 1.0, -1.0)
+        down = -G + w[in_group] * np.where(b <= 0, 1.0, -1.0)
+        wants_up = up < down
+        for g in np.unique(self.groups[in_group]):
+            idx = np.nonzero(self.groups[in_group] == g)[0]
+            if len(idx) < 2:
+                continue
+            best_down = idx[np.argsort(down[idx])[:2]]
+            best_up = idx[np.argsort(up[idx])[:2]]
+            for a in idx:
+                best = best_down if wants_up[a] else best_up
+                partners[in_group[a]] = in_group[best[1] if best[0] == a else best[0]]
+        return partners
+
+
+# compute the prox of the function : f(b) = w |b|
+def prox(b, w):
+    return np.sign(b) * max(abs(b) - w, 0.0)
+
+
+# Minimizer of the function of t :  grad t + L/2 t^2 + wi |bi + t| + wj |bj - t|  (with L > 0).
+# The function is convex, and quadratic between its kinks -bi and bj,
+# so its minimizer is the stationary point of a quadratic piece if it lies in this piece,
+# and a kink otherwise.
+def pair_step(bi, bj, wi, wj, grad, L):
+    for si in [-1.0, 1.0]:
+        for sj in [-1.0, 1.0]:
+            t = -(grad + wi * si - wj * sj) / L
+            if (bi + t) * si >= 0 and (bj - t) * sj >= 0:
+                return t
+
+    def objective(t):
+        return grad * t + L / 2 * t ** 2 + wi * abs(bi + t) + wj * abs(bj - t)
+
+    return min(-bi, bj, key=objective)
+
+
+def pathlasso_CD(cd, path, lambdamax, n_active=False, beta=None):
+    """
+    Solutions for the lambdas of path (rescaled by lambdamax), in decreasing order, with warm starts,
+    starting from beta if it is given.
+    """
+    m, d, k = cd.dim
+    if type(n_active) == int and n_active > 0:
+        n_act = n_active
+    else:
+        n_act = d + 1
+    BETA = []
+    for lam in path:
+        beta = cd.solve(lam * lambdamax, beta)
+        BETA.append(beta)
+        if sum(abs(beta[cd.weights > 0]) > 1e-5) >= n_act:
+            BETA.extend([BETA[-1]] * (len(path) - len(BETA)))
+            break
+    return BETA
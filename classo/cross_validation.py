@@ -1,7 +1,14 @@
+import functools
+import multiprocessing
+import os
+
 import numpy as np
 import numpy.random as rd
-import numpy.linalg as LA
 from .compact_func import Classo, pathlasso
+from .misc_functions import gram_products, huber
+
+# environment variables that set the number of threads of the BLAS libraries
+BLAS_THREADS = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"]
 
 
 def train_test_CV(n, k):
@@ -38,6 +45,8 @@ def training(
     lambdas,
     w,
     intercept,
+    products=None,
+    guide=None,
 ):
     (A, C, y) = matrices
     mat = (A[training_set], C, y[training_set])
@@ -51,6 +60,8 @@ def training(
         rho_classification=rho_classification,
         w=w,
         intercept=intercept,
+        products=products,
+        guide=guide,
     )[0]
     return sol
 
@@ -67,8 +78,13 @@ def cv_test_i(
     lambdas,
     w,
     intercept,
+    products=None,
+    guide=None,
 ):
     training_set, test_set = train_test_i(SUBLIST, i)
+    if products is not None:
+        # products of the training set : the whole data minus the test set
+        products = products.downdate(matrices[0][test_set], matrices[2][test_set])
     BETA = training(
         matrices,
         typ,
@@ -80,21 +96,18 @@ def cv_test_i(
         lambdas,
         w,
         intercept,
+        products,
+        guide,
+    )
+    return accuracy_path(
+        matrices[0][test_set],
+        matrices[2][test_set],
+        BETA,
+        typ,
+        rho=rho,
+        rho_classification=rho_classification,
+        intercept=intercept,
     )
-    n_lam = len(lambdas)
-    residual = np.zeros(n_lam)
-    for j in range(n_lam):
-        residual[j] = accuracy_func(
-            matrices[0][test_set],
-            matrices[2][test_set],
-            BETA[j],
-            typ,
-            rho=rho,
-            rho_classification=rho_classification,
-            intercept=intercept,
-        )
-
-    return residual
 
 
 def average_test(
@@ -108,24 +121,30 @@ def average_test(
     lambdas,
     w,
     intercept,
+    n_jobs=1,
+    products=None,
+    guide=None,
 ):
     k = len(SUBLIST)
-    n_lam = len(lambdas)
-    RESIDUAL = np.zeros((k, n_lam))
-    for i in range(k):
-        RESIDUAL[i, :] = cv_test_i(
-            matrices,
-            typ,
-            num_meth,
-            SUBLIST,
-            i,
-            rho,
-            rho_classification,
-            e,
-            lambdas,
-            w,
-            intercept,
-        )
+    test_i = functools.partial(
+        cv_test_i,
+        matrices,
+        typ,
+        num_meth,
+        SUBLIST,
+        rho=rho,
+        rho_classification=rho_classification,
+        e=e,
+        lambdas=lambdas,
+        w=w,
+        intercept=intercept,
+        products=products,
+        guide=guide,
+    )
+    if n_jobs == 1 or k == 1:
+        RESIDUAL = np.array([test_i(i) for i in range(k)])
+    else:
+        RESIDUAL = np.array(parallel_map(test_i, range(k), n_jobs))
     MSE = np.mean(RESIDUAL, axis=0)
     SE = np.std(RESIDUAL, axis=0) / np.sqrt(k)
     return (MSE, SE)
@@ -145,7 +164,13 @@ def CV(
     oneSE=True,
     w=None,
     intercept=False,
+    n_jobs=1,
+    adaptive=False,
 ):
+    """
+    If adaptive, the lambdas are evaluated on an adaptive grid taken from lambdas (see adaptive_test),
+    and the lambdas evaluated are also returned, as the last element.
+    """
 
     if lambdas is None:
         lambdas = np.linspace(1.0, 1e-3, Nlam)
@@ -154,28 +179,81 @@ def CV(
     n = len(matrices[0])
 
     SUBLIST = train_test_CV(n, k)
-    MSE, SE = average_test(
-        matrices,
-        typ,
-        num_meth,
-        SUBLIST,
-        rho,
-        rho_classification,
-        e,
-        lambdas,
-        w,
-        intercept,
-    )
-    i = np.argmin(MSE)
-    i_1SE = np.min(np.where(MSE <= MSE[i] + SE[i]))
 
-    if oneSE:
-        lam = lambdas[i_1SE]
+    # for the least-squares formulations with n > d, the products A^tA and A^ty are computed
+    # once, and the ones of each training set are downdated from them (see gram_products)
+    A, y = matrices[0], matrices[2]
+    products = None
+    if typ in ["R1", "R3"] and num_meth != "CD" and A.shape[0] > A.shape[1]:
+        products = gram_products(A, y)
+
+    # with the iterative methods for R1, the path on the whole data is computed first,
+    # it guides the warm starts of the folds and gives the output (see full_path)
+    full = typ == "R1" and num_meth in ["DR", "P-PDS", "PF-PDS"]
+
+    args = (matrices, typ, num_meth, SUBLIST, rho, rho_classification, e)
+    if adaptive:
+        lambdas, MSE, SE, OUT = adaptive_test(
+            *args, lambdas, w, intercept, n_jobs, products, full=full
+        )
+    else:
+        OUT, guide = None, None
+        if full:
+            OUT, guide = full_path(
+                matrices,
+                typ,
+                num_meth,
+                rho,
+                rho_classification,
+                e,
+                lambdas,
+                w,
+                intercept,
+                products,
+            )
+        MSE, SE = average_test(*args, lambdas, w, intercept, n_jobs, products, guide)
+    i, i_1SE = selected_lambdas(MSE, SE)
+
+    j = i_1SE if oneSE else i
+    if full:
+        out = OUT[j]
     else:
-        lam = lambdas[i]
-    out = Classo(
+        out = Classo(
+            matrices,
+            lambdas[j],
+            typ=typ,
+            meth=num_meth,
+            rho=rho,
+            e=e,
+            rho_classification=rho_classification,
+            w=w,
+            intercept=intercept,
+        )
+    if adaptive:
+        return (out, MSE, SE, i, i_1SE, lambdas)
+    return (out, MSE, SE, i, i_1SE)
+
+
+# Path on the whole data, computed before the folds with the iterative methods : its solutions are
+# the outputs of CV, and the states of its iterations guide the warm starts of the folds,
+# which then start close to their solutions (see misc_functions.guided_state).
+# Returns the solutions and the states.
+def full_path(
+    matrices,
+    typ,
+    num_meth,
+    rho,
+    rho_classification,
+    e,
+    lambdas,
+    w,
+    intercept,
+    products=None,
+):
+    guide = []
+    out = pathlasso(
         matrices,
-        lam,
+        lambdas=lambdas,
         typ=typ,
         meth=num_meth,
         rho=rho,
@@ -183,23 +261,141 @@ def CV(
         rho_classification=rho_classification,
         w=w,
         intercept=intercept,
+        products=products,
+        states=guide,
+    )[0]
+    return out, guide
+
+
+# indices of the lambdas selected without and with the one-standard-error rule
+def selected_lambdas(MSE, SE):
+    i = np.argmin(MSE)
+    i_1SE = np.min(np.where(MSE <= MSE[i] + SE[i]))
+    return i, i_1SE
+
+
+# Cross validation on an adaptive grid taken from lambdas (one lambda out of coarse first) :
+# the coarse grid is evaluated by blocks of block lambdas, from the largest one, until the validation
+# error has clearly risen past its minimum (on the two last lambdas, it is more than one standard error
+# above it), then the grid is refined around the lambdas selected with and without the one-standard-error
+# rule, on all the lambdas between their neighbours of the coarse grid.
+# If full, each set of lambdas is also solved on the whole data first, to guide the folds (see full_path).
+# Returns the lambdas evaluated (in decreasing order), with their MSE and SE,
+# and the solutions on the whole data if full (else None).
+def adaptive_test(
+    matrices,
+    typ,
+    num_meth,
+    SUBLIST,
+    rho,
+    rho_classification,
+    e,
+    lambdas,
+    w,
+    intercept,
+    n_jobs=1,
+    products=None,
+    coarse=4,
+    block=5,
+    full=False,
+):
+    average = functools.partial(
+        average_test,
+        matrices,
+        typ,
+        num_meth,
+        SUBLIST,
+        rho,
+        rho_classification,
+        e,
+        w=w,
+        intercept=intercept,
+        n_jobs=n_jobs,
+        products=products,
     )
-    return (out, MSE, SE, i, i_1SE)
+    lambdas = np.sort(lambdas)[::-1]
+    n_lam = len(lambdas)
+    MSE, SE, OUT = np.zeros(n_lam), np.zeros(n_lam), [None] * n_lam
 
+    # evaluation of the lambdas of idx, written in MSE, SE and OUT
+    def test(idx):
+        guide = None
+        if full:
+            out, guide = full_path(
+                matrices,
+                typ,
+                num_meth,
+                rho,
+                rho_classification,
+                e,
+                lambdas[idx],
+                w,
+                intercept,
+                products,
+            )
+            for j, o in zip(idx, out):
+                OUT[j] = o
+        MSE[idx], SE[idx] = average(lambdas[idx], guide=guide)
+
+    grid = np.arange(0, n_lam, coarse)
+    if grid[-1] != n_lam - 1:
+        grid = np.append(grid, n_lam - 1)
+    for start in range(0, len(grid), block):
+        evaluated = grid[: start + block]
+        new = evaluated[start:]
+        test(new)
+        i = evaluated[np.argmin(MSE[evaluated])]
+        if np.all(MSE[evaluated[-2:]] > MSE[i] + SE[i]):
+            break
+
+    # refinement between the neighbours of the selected lambdas
+    refined = set()
+    for j in selected_lambdas(MSE[evaluated], SE[evaluated]):
+        low, high = max(j - 1, 0), min(j + 1, len(evaluated) - 1)
+        refined.update(range(evaluated[low], evaluated[high] + 1))
+    new = np.array(sorted(refined.difference(evaluated)), dtype=int)
+    if len(new) > 0:
+        test(new)
+
+    evaluated = np.union1d(evaluated, new)
+    OUT = [OUT[j] for j in evaluated] if full else None
+    return lambdas[evaluated], MSE[evaluated], SE[evaluated], OUT
 
-# Computation of the residual, for huber, LS, huber_classification and classification
-def hub(r, rho):
-    h = 0
-    for j in range(len(r)):
-        if abs(r[j]) < rho:
-            h += r[j] ** 2
-        elif r[j] > 0:
-            h += (2 * r[j] - rho) * rho
-        else:
-            h += (-2 * r[j] - rho) * rho
-    return h
 
+# Values of function on the elements of iterable, computed by a pool of n_jobs processes (all the cores if None or -1).
+# The processes are started with 'spawn', and each of them uses one BLAS thread, so that they do not oversubscribe the cores
+# (the BLAS libraries read the number of threads from the environment when they are loaded).
+# Each value is computed as in a sequential run, by the same function on the same data.
+def parallel_map(function, iterable, n_jobs=None):
+    iterable = list(iterable)
+    if n_jobs is None or n_jobs < 0:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = max(min(n_jobs, len(iterable)), 1)
+    saved = {name: os.environ.get(name) for name in BLAS_THREADS}
+    os.environ.update({name: "1" for name in BLAS_THREADS})
+    try:
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(n_jobs, initializer=_set_sequential_mkl) as pool:
+            return pool.map(function, iterable)
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                del os.environ[name]
+            else:
+                os.environ[name] = value
 
+
+# mkl can also be set after it is loaded, if it is installed
+def _set_sequential_mkl():
+    try:
+        import mkl
+
+        mkl.set_num_threads(1)
+    except ImportError:
+        pass
+
+
+# Computation of the residual, for huber, LS, huber_classification and classification
 def hinge(A, y, beta):
     return sum(np.maximum(0, 1 - y * A.dot(beta)) ** 2)
 
@@ -212,20 +408,36 @@ def misclassification_rate(X, y, beta):
 def accuracy_func(
     A, y, beta, typ="R1", rho=1.345, rho_classification=-1.0, intercept=False
 ):
+    return accuracy_path(
+        A,
+        y,
+        [beta],
+        typ,
+        rho=rho,
+        rho_classification=rho_classification,
+        intercept=intercept,
+    )[0]
+
 
+# Residuals of all the solutions of BETAS (one per row, with the intercept first if intercept),
+# from the predictions A.BETAS^t computed at once, and the losses computed column-wise :
+# mean of the Huber function of the residuals for R2, misclassification rate for C1 and C2,
+# and mean squared error otherwise.
+def accuracy_path(
+    A, y, BETAS, typ="R1", rho=1.345, rho_classification=-1.0, intercept=False
+):
+    BETAS = np.asarray(BETAS)
     if intercept:
-        Aprime = np.concatenate([np.ones((len(A), 1)), A], axis=1)
+        predictions = A.dot(BETAS[:, 1:].T) + BETAS[:, 0]
     else:
-        Aprime = A[:, :]
-
-    n = len(y)
+        predictions = A.dot(BETAS.T)
 
+    if typ in ["C1", "C2"]:
+        return np.mean(np.sign(predictions) != y[:, None], axis=0)
+    residuals = predictions - y[:, None]
     if typ == "R2":
-        return hub(Aprime.dot(beta) - y, rho) / n
-    elif typ in ["C1", "C2"]:
-        return misclassification_rate(Aprime, y, beta)
-    else:
-        return LA.norm(Aprime.dot(beta) - y, 2) ** 2 / n
+        return np.mean(huber(residuals, rho), axis=0)
+    return np.mean(residuals ** 2, axis=0)
 
 
 """
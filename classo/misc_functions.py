@@ -1,8 +1,13 @@
+import copy
+from time import time
+
 import numpy as np
 import numpy.linalg as LA
 import matplotlib.pyplot as plt
 import pandas as pd
 from scipy.special import erfinv
+from scipy.optimize import linprog
+from scipy.linalg import cho_factor, get_lapack_funcs
 
 colo = [
     "red",
@@ -313,6 +318,593 @@ def proj_c(M, d):
     return np.eye(d) - LA.multi_dot([M.T, np.linalg.inv(M.dot(M.T)), M])
 
 
+class ker_projector:
+    """Projection on Ker(C) : x -> x - C^t (C.C^t)^-1 C.x, without forming the d*d matrix of proj_c.
+    It can be used in place of the matrix, with the method dot.
+
+    - zero-sum constraint (one row with equal coefficients) : x - mean(x), in O(d)
+    - block zero-sum constraints (each row has equal coefficients on a group of variables,
+      and the groups are disjoint) : x minus its mean on each group, in O(d)
+    - otherwise, Q is an orthonormal basis of the rows of C (computed once with an SVD of C,
+      which also handles dependent rows), and the projection is x - Q^t (Q.x), in O(k d)
+
+    Attributes :
+        kind    : 'none', 'zero-sum', 'blocks' or 'dense'
+        groups  : for 'blocks', the group of each variable (-1 if it is in no constraint)
+        counts  : for 'blocks', the size of each group
+        bins    : for 'blocks', the group of each variable, and k for the variables in no constraint
+        scale   : for 'blocks', 1 / counts, and 0 for the bin k of the variables in no constraint
+        Q       : for 'dense', orthonormal basis of the rows of C
+    """
+
+    def __init__(self, C, tol=1e-10):
+        C = np.atleast_2d(C)
+        nonzero = C != 0
+        per_column = np.sum(nonzero, axis=0)
+        if not np.any(nonzero):
+            self.kind = "none"
+        elif len(C) == 1 and np.all(nonzero) and np.all(C == C[0, 0]):
+            self.kind = "zero-sum"
+        elif np.all(per_column <= 1) and all(
+            np.all(row[row != 0] == row[row != 0][0]) for row in C if np.any(row)
+        ):
+            self.kind = "blocks"
+            self.groups = np.where(per_column > 0, np.argmax(nonzero, axis=0), -1)
+            self.inside = self.groups >= 0
+            self.counts = np.bincount(self.groups[self.inside], minlength=len(C))
+            self.counts[self.counts == 0] = 1
+            self.bins = np.where(self.inside, self.groups, len(C))
+            self.scale = np.append(1.0 / self.counts, 0.0)
+        else:
+            self.kind = "dense"
+            U, sing, Vt = LA.svd(C, full_matrices=False)
+            self.Q = Vt[sing > tol * sing[0]]
+
+    # projection of x, written in out if it is given (out must not be x)
+    def dot(self, x, out=None):
+        if self.kind == "none":
+            if out is None:
+                return x
+            out[:] = x
+            return out
+        if out is None:
+            out = np.empty(np.shape(x))
+        if self.kind == "zero-sum":
+            return np.subtract(x, np.mean(x), out=out)
+        elif self.kind == "blocks":
+            means = np.bincount(self.bins, x, minlength=len(self.scale))
+            means *= self.scale
+            np.take(means, self.bins, out=out)
+        else:
+            np.dot(self.Q.T, self.Q.dot(x), out=out)
+        return np.subtract(x, out, out=out)
+
+
+class gram_products:
+    """Products A^tA and A^ty of the matrices of a least-squares problem, with the sums
+    of the rows of A and y, from which the products of the centered matrices (intercept)
+    and of the rescaled matrices are obtained without going through A again.
+    The products of a subset of the rows are obtained by removing the other rows (downdate),
+    which is how the cross validation gets the products of each training set
+    from the products of the whole data, in O(n_test d^2) instead of O(n_train d^2).
+
+    Args :
+        A, y    : the matrices
+
+    Attributes :
+        AtA     : A^tA
+        Aty     : A^ty
+        Asum    : sum of the rows of A
+        ysum    : sum of y
+        n       : number of rows
+    """
+
+    def __init__(self, A, y):
+        self.AtA, self.Aty = (A.T).dot(A), (A.T).dot(y)
+        self.Asum, self.ysum, self.n = np.sum(A, axis=0), np.sum(y), len(y)
+
+    # products of the matrices without the rows A, y (for example a test set)
+    def downdate(self, A, y):
+        out = gram_products(A, y)
+        out.AtA = self.AtA - out.AtA
+        out.Aty = self.Aty - out.Aty
+        out.Asum, out.ysum = self.Asum - out.Asum, self.ysum - out.ysum
+        out.n = self.n - out.n
+        return out
+
+    # products of the matrices A - Abar and y - ybar
+    def centered(self):
+        out = copy.copy(self)
+        Abar, ybar = self.Asum / self.n, self.ysum / self.n
+        out.AtA = self.AtA - self.n * np.outer(Abar, Abar)
+        out.Aty = self.Aty - self.n * ybar * Abar
+        out.Asum, out.ysum = np.zeros(len(Abar)), 0.0
+        return out
+
+    # products of the matrices r A / w and r y
+    def scaled(self, w=1.0, r=1.0):
+        out = copy.copy(self)
+        out.AtA = self.AtA * (r ** 2 / np.outer(w, w))
+        out.Aty = self.Aty * (r ** 2 / w)
+        out.Asum, out.ysum = self.Asum * (r / w), self.ysum * r
+        return out
+
+
+class dr_resolvent:
+    """Linear operators of the Douglas-Rachford solvers, without explicit inverses :
+        Q2 = (2.I + coef A^t A)^-1
+        Q1 = coef A^t (2.I + coef A A^t)^-1  = coef Q2 A^t
+        QA = Q1 A = I - 2 Q2                  (Woodbury identity)
+    Only the smaller of the two systems, of size min(n, d), is factorized (Cholesky),
+    and the operators are applied with triangular solves and products with A.
+    Each operator can write its result in a given array out (which must not be its argument),
+    then it does not allocate any array of size n or d.
+
+    Args :
+        coef    : the coefficient coef
+        A       : the matrix A, of size n*d
+        gram    : A A^t if n <= d, else A^t A, if it is already computed
+
+    Attributes :
+        wide    : True if n <= d, then the factorized system is 2.I + coef A A^t
+        factor  : Cholesky factorization of the small system (scipy.linalg.cho_factor)
+        potrs   : LAPACK triangular solves with the factor (called directly, as
+                  cho_solve has an overhead that dominates on small problems)
+        buffer  : work array of size n
+    """
+
+    def __init__(self, coef, A, gram=None):
+        n, d = A.shape
+        self.A, self.coef, self.wide = A, coef, n <= d
+        if gram is None:
+            gram = A.dot(A.T) if self.wide else (A.T).dot(A)
+        self.factor = cho_factor(2 * np.eye(len(gram)) + coef * gram)
+        self.potrs = get_lapack_funcs("potrs", (self.factor[0],))
+        self.buffer = np.empty(n)
+
+    # solution of the factorized system, computed inplace in out if it is given (out can be u)
+    def solve(self, u, out=None):
+        c, lower = self.factor
+        if out is None:
+            return self.potrs(c, u, lower=lower)[0]
+        if out is not u:
+            out[:] = u
+        return self.potrs(c, out, lower=lower, overwrite_b=True)[0]
+
+    # products with A and A^t, written in out
+    def adot(self, x, out):
+        return np.dot(self.A, x, out=out)
+
+    def atdot(self, u, out):
+        return np.dot(self.A.T, u, out=out)
+
+    def q1(self, u, out=None):
+        if out is None:
+            out = np.empty(self.A.shape[1])
+        if self.wide:
+            self.atdot(self.solve(u, self.buffer), out)
+        else:
+            self.solve(self.atdot(u, out), out)
+        out *= self.coef
+        return out
+
+    def qa(self, x, out=None):
+        if self.wide:
+            return self.q1(self.adot(x, self.buffer), out)
+        out = self.solve(x, out)
+        out *= -2
+        out += x
+        return out
+
+    def q2(self, x, out=None):
+        if self.wide:
+            out = self.qa(x, out)
+            out -= x
+            out *= -0.5
+            return out
+        return self.solve(x, out)
+
+
+class mean_shift_matrix:
+    """Matrix [A, r E] of size n*(d+n) of the mean-shift formulation of the Huber loss,
+    where E = I, or E = I - 11^t/n if centered (then A is also centered).
+    Only A is stored : the n*n block is applied implicitly, so the object can be used
+    in place of the augmented matrix through the methods dot and T.dot.
+
+    Attributes :
+        A           : the matrix A, of size n*d
+        r           : coefficient of the identity block, that can be changed along a path
+        centered    : True if the identity block is centered
+        shape       : (n, d+n)
+        T           : the transposed matrix, as an object with a method dot
+    """
+
+    def __init__(self, A, r, centered=False):
+        self.A, self.r, self.centered = A, r, centered
+        n, d = A.shape
+        self.shape = (n, d + n)
+        self.T = mean_shift_transpose(self)
+
+    def block_dot(self, u):
+        if self.centered:
+            return u - np.mean(u)
+        return u
+
+    def dot(self, x):
+        d = self.A.shape[1]
+        return self.A.dot(x[:d]) + self.r * self.block_dot(x[d:])
+
+    def rdot(self, u):
+        return np.concatenate([(self.A.T).dot(u), self.r * self.block_dot(u)])
+
+
+class mean_shift_transpose:
+    """Transpose of a mean_shift_matrix"""
+
+    def __init__(self, M):
+        self.M = M
+        self.shape = M.shape[::-1]
+
+    def dot(self, u):
+        return self.M.rdot(u)
+
+
+class mean_shift_resolvent(dr_resolvent):
+    """dr_resolvent of a mean_shift_matrix M = [A, r E], using that
+        2.I + coef M M^t = 2.I + coef (A A^t + r^2 E)
+    If n <= d, this n*n system is factorized. Otherwise, with alpha = 2 + coef r^2, its inverse is
+        (I - A (alpha/coef I + A^tA)^-1 A^t) / alpha     (Woodbury identity)
+    on the orthogonal of 1 if centered (A^t 1 = 0), and 1/2 on 1. So only the d*d system is factorized.
+
+    Args :
+        coef    : the coefficient coef
+        M       : the mean_shift_matrix
+        gram    : A A^t if n <= d, else A^t A, which does not depend on r or coef
+    """
+
+    def __init__(self, coef, M, gram=None):
+        A = M.A
+        n, d = A.shape
+        self.A, self.coef, self.wide = M, coef, True
+        self.woodbury = n > d
+        if gram is None:
+            gram = (A.T).dot(A) if self.woodbury else A.dot(A.T)
+        if self.woodbury:
+            self.alpha = 2 + coef * M.r ** 2
+            K = self.alpha / coef * np.eye(d) + gram
+        else:
+            E = np.eye(n) - np.ones((n, n)) / n if M.centered else np.eye(n)
+            K = 2 * np.eye(n) + coef * (gram + M.r ** 2 * E)
+        self.factor = cho_factor(K)
+        self.potrs = get_lapack_funcs("potrs", (self.factor[0],))
+        self.buffer = np.empty(n)
+
+    def solve(self, u, out=None):
+        if not self.woodbury:
+            return dr_resolvent.solve(self, u, out)
+        A = self.A.A
+        if self.A.centered:
+            ubar = np.mean(u)
+        v = A.dot(dr_resolvent.solve(self, (A.T).dot(u)))
+        if out is None:
+            out = np.empty(len(u))
+        np.subtract(u, v, out=out)
+        out /= self.alpha
+        if self.A.centered:
+            out += ubar / 2 - ubar / self.alpha
+        return out
+
+    # the products with M = [A, r E] go through the mean_shift_matrix
+    def adot(self, x, out):
+        out[:] = self.A.dot(x)
+        return out
+
+    def atdot(self, u, out):
+        out[:] = self.A.T.dot(u)
+        return out
+
+
+class anderson:
+    """Type-II Anderson acceleration of a fixed-point iteration z = T(z), such as the loops
+    of the Douglas-Rachford and primal-dual splitting methods.
+    After each iteration, the new point T(z) is replaced by the extrapolation
+    T(z) - dF.gamma, where gamma minimizes ||g - dG.gamma|| (with some regularization),
+    g = T(z) - z is the residual and dF, dG are the differences of the last images and residuals.
+
+    Safeguard : if the residual at an extrapolated point is more than 'safeguard' times
+    the one of the previous iterate, this point is rejected, the plain step T(z) of the
+    previous iterate is taken instead, and the memory is cleared (restart).
+
+    The state z is a tuple of the variables of the loop (arrays or floats),
+    and step returns a tuple of the same form. With extrapolate=False, the plain step T(z)
+    is returned (but kept in memory), which is needed before a stopping test that compares
+    two consecutive iterates instead of z and T(z).
+
+    Args :
+        memory      : number of differences kept
+        reg         : relative regularization of the least squares problem
+        safeguard   : tolerated increase of the residual
+
+    Attributes :
+        dF, dG      : last differences of images and of residuals (circular buffers, one per row)
+        H           : gram matrix of the rows of dG
+        extrapolated: True if the last point returned is an extrapolation
+    """
+
+    def __init__(self, memory=5, reg=1e-10, safeguard=2.0):
+        self.memory, self.reg, self.safeguard = memory, reg, safeguard
+        self.shapes = None
+        self.restart()
+
+    def restart(self):
+        self.dF, self.dG, self.H = None, None, np.zeros((self.memory, self.memory))
+        self.F, self.g, self.extrapolated, self.count = None, None, False, 0
+
+    def step(self, z, Tz, extrapolate=True):
+        F = np.concatenate([np.ravel(u) for u in Tz])
+        g = F - np.concatenate([np.ravel(u) for u in z])
+        if self.shapes is None:
+            self.shapes = [np.shape(u) for u in Tz]
+            sizes = [int(np.prod(shape)) for shape in self.shapes]
+            ends = np.cumsum(sizes)
+            self.slices = [slice(e - size, e) for e, size in zip(ends, sizes)]
+        ng = LA.norm(g)
+
+        if self.extrapolated and ng > self.safeguard * self.ng:
+            F = self.F
+            self.restart()
+            return self.split(F)
+
+        if self.F is not None:
+            if self.dF is None:
+                self.dF = np.zeros((self.memory, len(F)))
+                self.dG = np.zeros((self.memory, len(F)))
+            # circular buffers, and the gram matrix H of dG is updated with the new row only
+            j = self.count % self.memory
+            self.dF[j], self.dG[j] = F - self.F, g - self.g
+            self.H[j] = self.dG.dot(self.dG[j])
+            self.H[:, j] = self.H[j]
+            self.count += 1
+        self.F, self.g, self.ng = F, g, ng
+
+        mem = min(self.count, self.memory)
+        if mem == 0 or not extrapolate:
+            self.extrapolated = False
+            return Tz
+        H = self.H[:mem, :mem].copy()
+        H.flat[:: mem + 1] += self.reg * np.trace(H) + 1e-30
+        try:
+            gamma = LA.solve(H, self.dG[:mem].dot(g))
+        except LA.LinAlgError:
+            self.restart()
+            return Tz
+        self.extrapolated = True
+        return self.split(F - gamma.dot(self.dF[:mem]))
+
+    def split(self, x):
+        return tuple(
+            x[sl].reshape(shape) if len(shape) > 0 else float(x[sl][0])
+            for sl, shape in zip(self.slices, self.shapes)
+        )
+
+
+# prox of the function f(b) = sum(wi |bi|) (soft thresholding), with w >= 0 :
+# b - clip(b, -w, w), computed in out (which must not be b) without any temporary array.
+def soft_thresholding(b, w, out=None):
+    out = np.minimum(b, w, out=out)
+    np.negative(out, out=out)
+    np.minimum(out, w, out=out)
+    return np.add(b, out, out=out)
+
+
+class workspace:
+    """Work arrays of the iterations of a solver, allocated once and reused at each iteration
+    and for each lambda of a path, so that the loops do not allocate temporary arrays :
+    the operations write their results in these arrays, with the arguments out.
+
+    Attributes :
+        arrays  : dictionary of the work arrays, by name
+    """
+
+    def __init__(self):
+        self.arrays = {}
+
+    # work array of the given name and size (its content is arbitrary)
+    def get(self, name, size):
+        array = self.arrays.get(name)
+        if array is None or len(array) != size:
+            array = self.arrays[name] = np.empty(size)
+        return array
+
+    # new arrays with the values of the state (a tuple of arrays and floats), updated inplace by the iterations
+    def state(self, init):
+        return tuple(np.array(u, dtype=float) if np.ndim(u) else float(u) for u in init)
+
+
+# Initial state of the iterations at a lambda of a path, from the state at the previous lambda,
+# moved by the change of a guide between the two lambdas : the guide is the states along the same path
+# on related data (for example the whole data set, for the folds of a cross validation).
+# The parts of the state whose size differs from the guide (such as the residuals) are not moved.
+def guided_state(state, previous, current):
+    if isinstance(state, tuple):
+        if not len(state) == len(previous) == len(current):
+            return state
+        return tuple(guided_state(*parts) for parts in zip(state, previous, current))
+    if np.shape(state) != np.shape(current) or np.shape(previous) != np.shape(current):
+        return state
+    return state + (current - previous)
+
+
+class solver_budget:
+    """Iteration and time budgets of the iterative methods ('DR', 'P-PDS', 'PF-PDS' and 'CD'),
+    which also receives the diagnostics of their convergence.
+    When a budget runs out, the iterations stop and return their last iterate
+    (projected on Ker(C)) instead of raising an error : the iterations are Fejer-monotone,
+    so the last iterate is the closest to the solutions.
+
+    Args :
+        max_iter    : maximum number of iterations for each lambda
+        max_time    : maximum running time in seconds, from the creation of the budget (or start).
+                      For a path, the lambdas left once it runs out get a few iterations each.
+                      If None, there is no time limit
+
+    Attributes :
+        deadline    : time at which the iterations stop, set by start
+        converged   : False if a budget ran out before the stopping criterion was met
+        iterations  : number of iterations done since start
+    """
+
+    def __init__(self, max_iter=500000, max_time=None):
+        self.max_iter, self.max_time = max_iter, max_time
+        self.start()
+
+    def start(self):
+        self.deadline = None if self.max_time is None else time() + self.max_time
+        self.converged, self.iterations = True, 0
+
+    # True if the time budget ran out, and then the iterations are not converged
+    def out_of_time(self):
+        if self.deadline is not None and time() > self.deadline:
+            self.converged = False
+            return True
+        return False
+
+    def __repr__(self):
+        string = "converged" if self.converged else "stopped by the budget"
+        return string + " after " + str(self.iterations) + " iterations"
+
+
+def duality_gap(
+    matrices, beta, lamb, typ="R1", rho=1.345, weights=None, intercept=False
+):
+    """
+    Relative duality gap (P - D) / P of the problem  min F(A.b) + lamb sum(weights |b|)  with C.b = 0,
+    at a feasible beta (beta[0] being an unpenalized intercept if intercept),
+    where F is the loss of the formulation typ (for R3 and R4, the loss at the optimal sigma for beta,
+    so the gap of (beta, sigma) is at most this one).
+
+    The dual point is theta = grad F(A.beta), corrected so that the intercept is optimal,
+    with the multiplier v of the constraint fitted by least squares on the active set
+    (or the one that minimizes ||A^t.theta + C^t.v||inf / weights if it gives a better dual point),
+    and scaled down so that ||A^t.theta + C^t.v||inf <= lamb weights and theta is in the domain of F*.
+    Then D = - F*(theta), where F*(theta) = theta.y + ||theta||^2 / 4 for R1, R2, C1 and C2,
+    and theta.y for R3 and R4. A only needs A.dot and A.T.dot (it can be a mean_shift_matrix).
+    rho is rho_classification for C2.
+    """
+    A, C, y = matrices
+    m = len(y)
+    if intercept:
+        beta0, beta = beta[0], beta[1:]
+    else:
+        beta0 = 0.0
+    w = np.ones(len(beta)) if weights is None else weights
+    z = A.dot(beta) + beta0
+    bound = np.inf  # bound on |theta| given by the domain of F*
+
+    if typ in ["C1", "C2"]:
+        u = y * z
+        if typ == "C2":
+            hinge = np.maximum(1 - u, 0) ** 2
+            loss = np.where(u < rho, (1 - rho) * (1 + rho - 2 * u), hinge)
+            theta, bound = 2 * y * np.clip(u - 1, rho - 1, 0), 2 * (1 - rho)
+        else:
+            loss = np.maximum(1 - u, 0) ** 2
+            theta = 2 * y * np.minimum(u - 1, 0)
+        loss = np.sum(loss)
+    else:
+        r = z - y
+        if typ == "R1":
+            loss, theta = np.vdot(r, r), 2 * r
+        elif typ == "R2":
+            loss = np.sum(huber(r, rho))
+            theta, bound = 2 * np.clip(r, -rho, rho), 2 * rho
+        elif typ == "R3":
+            norm_r = LA.norm(r)
+            loss = np.sqrt(2 * m) * norm_r
+            theta = np.sqrt(2 * m) * r / max(norm_r, 1e-16)
+        else:
+            sigma = max(concomitant_sigma(r, rho, m), 1e-16)
+            loss = sigma * np.sum(huber(r / sigma, rho)) + m * sigma
+            theta, bound = 2 * np.clip(r / sigma, -rho, rho), 2 * rho
+
+    if intercept:
+        if typ in ["C1", "C2"]:
+            # theta has the sign of -y, so the sum of theta is corrected on one class only
+            s = np.sum(theta)
+            side = y > 0 if s > 0 else y < 0
+            theta[side] -= s / max(np.sum(side), 1)
+        else:
+            theta = theta - np.mean(theta)
+
+    g = A.T.dot(theta)
+    # the coefficients that are rounding errors of 0 are not taken as active
+    active = (abs(beta) > 1e-4 * LA.norm(beta, np.inf)) & (
+        lamb * np.max(w, initial=0.0) * abs(beta) > 1e-8 * loss
+    )
+    active = np.nonzero(active)[0]
+    s_active = lamb * w[active] * np.sign(beta[active])
+    v, res, rank, sv = LA.lstsq(C[:, active].T, -s_active - g[active], rcond=None)
+    V = [v]
+    if len(C) > 0:
+        misfit = abs(g[active] + C[:, active].T.dot(v) + s_active)
+        if rank < len(C) or np.any(misfit > 0.1 * lamb * w[active]):
+            # v is not determined by the active set (near lambdamax), or the active set is wrong
+            # (coefficients that are not 0 only because the iterations are not converged) :
+            # the multiplier that minimizes max |g + C^t.v| / w is also tried.
+            V.append(chebyshev_multiplier(C, g, w))
+
+    primal = loss + lamb * np.sum(w * abs(beta))
+    dual = -np.inf
+    for v in V:
+        c = abs(g + C.T.dot(v))[w > 0]
+        alpha = np.min(lamb * w[w > 0] / np.maximum(c, 1e-300), initial=1.0)
+        alpha = min(alpha, bound / max(LA.norm(theta, np.inf), 1e-300))
+        th = alpha * theta
+        if typ in ["R3", "R4"]:
+            dual = max(dual, -np.vdot(th, y))
+        else:
+            dual = max(dual, -np.vdot(th, y) - np.vdot(th, th) / 4)
+    return (primal - dual) / max(primal, 1e-16)
+
+
+# v that minimizes max |g_i + (C^t.v)_i| / w_i over the penalized variables,
+# solved as a linear program in (v, t) :  min t  with  -t w <= g + C^t.v <= t w.
+def chebyshev_multiplier(C, g, w):
+    pen = w > 0
+    G, M, W = g[pen], C[:, pen].T, w[pen]
+    cost = np.zeros(len(C) + 1)
+    cost[-1] = 1.0
+    sol = linprog(
+        cost,
+        A_ub=np.block([[M, -W[:, None]], [-M, -W[:, None]]]),
+        b_ub=np.concatenate([-G, G]),
+        bounds=[(None, None)] * len(cost),
+        method="highs",
+    )
+    if not sol.success:
+        return LA.lstsq(C.T, -g, rcond=None)[0]
+    return sol.x[:-1]
+
+
+# Huber function, of derivative 2 clip(r, -rho, rho), for each coordinate of r
+def huber(r, rho):
+    return np.where(abs(r) < rho, r ** 2, rho * (2 * abs(r) - rho))
+
+
+# optimal sigma of  min sigma sum h_rho(r / sigma) + c sigma  (the sigma of R4 for the residual r, with c = n)
+def concomitant_sigma(r, rho, c):
+    out = np.zeros(len(r), dtype=bool)
+    while True:
+        denom = c - np.sum(out) * rho ** 2
+        if denom <= 0:
+            return 0.0
+        s = LA.norm(r[~out]) / np.sqrt(denom)
+        new_out = abs(r) > rho * s
+        if np.all(new_out == out):
+            return s
+        out = new_out
+
+
 """
 def normalize(lb, lna, ly):
     for j in range(len(lb[0])):
@@ -367,18 +959,6 @@ def rescale(matrices):
     return ((Xn, Cn, yn), (lX, ly, my))
 
 
-def hub(r, rho):
-    h = 0
-    for j in range(len(r)):
-        if abs(r[j]) < rho:
-            h += r[j] ** 2
-        elif r[j] > 0:
-            h += (2 * r[j] - rho) * rho
-        else:
-            h += (-2 * r[j] - rho) * rho
-    return h
-
-
 def L_LS(A, y, lamb, x):
     return LA.norm(A.dot(x) - y) ** 2 + lamb * LA.norm(x, 1)
 
@@ -388,7 +968,7 @@ def L_conc(A, y, lamb, x):
 
 
 def L_H(A, y, lamb, x, rho):
-    return hub(A.dot(x) - y, rho) + lamb * LA.norm(x, 1)
+    return np.sum(huber(A.dot(x) - y, rho)) + lamb * LA.norm(x, 1)
 
 
 def denorm(B, lna, ly):
@@ -18,11 +18,16 @@ if intercept :
 
 """
 
+from collections import OrderedDict
+
 import numpy as np
 import numpy.linalg as LA
+from scipy.linalg import qr_delete, qr_insert, solve_triangular
 
 N = 10000
 N_frac = 100
+# above this number of parameters, and when d > n, the matrix A^tA is not formed (see gram_columns)
+N_gram = 2000
 
 
 class parameters_for_update:
@@ -31,60 +36,63 @@ class parameters_for_update:
     Attributes :
         number_act  (int) : number of active parameter
         idr         : saves the independant rows of the matrix C resctricted to the actives parameters
-        Xt          :  inverse of M
+        rows        : active_rows, QR factorization of C[idr] restricted to the active parameters
+        fact        : active_factor, Cholesky factor of M restricted to the active parameters
         activity    :  list of boolean, activity[i] is True when variable i is active
         beta        : current solution beta
         s           : current subgradient
         lam         : current lam
         lambdamax   : lambdamax
-        M           : matrix to invert
+        M           : matrix to invert, None when lazy
+        gram        : the block M[:d, :d], or a gram_columns object computing it lazily
+        lazy        : True when the matrix A^tA is not formed (for d >> n)
         y           : output
         r           : residual
         F           : F is the set where r<1 and if C1, and it is the set where rho<r<1 for C2, and r<rho for R2
+        AbarF       : mean of the rows of A in F, only used with intercept
         rho         : only use when doing huber path algo
 
+    Args :
+        AtA         : A^tA if it is already computed (see misc_functions.gram_products),
+                      used when all the rows are in F, without intercept (R1 and R3)
 
     """
 
-    def __init__(self, matrices, lamin, rho, typ, eps_L2=1e-3, intercept=False):
-        if typ == "C2" and rho > 1:
-            raise ValueError(
-                "For huberized hinge, rho has to be smaller than 1, but here it is :",
-                rho,
-            )
-
+    def __init__(
+        self,
+        matrices,
+        lamin,
+        rho,
+        typ,
+        eps_L2=1e-3,
+        intercept=False,
+        lazy_gram=None,
+        AtA=None,
+    ):
         (self.A, self.C, self.y) = matrices
         self.lamin = lamin
         self.rho = rho
         self.formulation = typ
         self.intercept = intercept
-        n, d, k = len(self.A), len(self.A[0]), len(self.C)
+        (n, d), k = self.A.shape, len(self.C)
         self.number_act = 0
         self.eps_L2 = eps_L2
-        self.idr = [False] * k
+        self.rows = active_rows(self.C)
+        self.idr = self.rows.idr
         self.activity = [False] * d
         self.beta = np.zeros(d)
 
-        if typ in ["C1", "C2"]:
-            r_func = lambda b0, y: y * b0
-            dr = self.y
-        else:
-            r_func = lambda b0, y: b0 - y
-            dr = 1.0
-
+        self.beta0, self.r, dr = initial_residual(self.y, rho, typ, intercept)
+        self.F = find_F(self.r, rho, typ)
         if intercept:
-            self.beta0 = find_beta0(r_func, dr, self.y, rho, typ)
             self.Abar = np.mean(self.A, axis=0)
-        else:
-            self.beta0 = 0.0
+            self.AbarF = np.mean(self.A[self.F], axis=0)
+        if lazy_gram is None:
+            # A can also be a structured matrix (like misc_functions.mean_shift_matrix),
+            # which only has the methods dot and T.dot, and then the gram matrix is lazy
+            lazy_gram = (d > n and d > N_gram) or not isinstance(self.A, np.ndarray)
+        self.lazy = lazy_gram
 
-        self.F = find_F(r_func(self.beta0, self.y), rho, typ)
-        P = self.A[self.F]
-        if intercept:
-            P = P - np.mean(P, axis=0)
-        AtA = P.T.dot(P) + eps_L2 * np.eye(d)
-
-        self.r = r_func(self.beta0, self.y)
         s = -2 * self.A.T.dot(dr * h_prime(rho, typ)(self.r))
         self.lambdamax = LA.norm(s, np.inf)
         self.lamin = lamin
@@ -96,30 +104,51 @@ class parameters_for_update:
                 self.activity[i] = True
                 self.number_act += 1
                 if k > 0:
-                    to_ad = next_idr1(self.idr, self.C[:, self.activity])
-                    if type(to_ad) == int:
-                        self.idr[to_ad] = True
+                    self.rows.add(i)
 
-        if k == 0:
-            self.M = 2 * AtA
-        else:
-            self.M = np.concatenate(
-                (
-                    np.concatenate((2 * AtA, self.C.T), axis=1),
-                    np.concatenate((self.C, np.zeros((k, k))), axis=1),
-                ),
-                axis=0,
+        if self.lazy:
+            self.M = None
+            self.gram = gram_columns(
+                self.A, self.F, eps_L2, AbarF=self.AbarF if intercept else None
             )
+            block = self.gram.block
+        else:
+            if AtA is None or intercept or not np.all(self.F):
+                P = self.A[self.F]
+                if intercept:
+                    P = P - self.AbarF
+                AtA = P.T.dot(P)
+            AtA = AtA + eps_L2 * np.eye(d)
+            if k == 0:
+                self.M = 2 * AtA
+            else:
+                self.M = np.concatenate(
+                    (
+                        np.concatenate((2 * AtA, self.C.T), axis=1),
+                        np.concatenate((self.C, np.zeros((k, k))), axis=1),
+                    ),
+                    axis=0,
+                )
+            self.gram = self.M[:d, :d]
+            M = self.M
+            block = lambda rows, cols: M[np.ix_(rows, cols)]
 
-        N = self.M[self.activity + self.idr, :][:, self.activity + self.idr]
-        try:
-            self.Xt = LA.inv(N)
-        except LA.LinAlgError:
-            self.Xt = LA.inv(N + self.eps_L2 * np.eye(len(N)))
+        self.fact = active_factor(block, np.nonzero(self.activity)[0], jitter=eps_L2)
 
 
 # iteration of the function up to solve the path at each breaking points.
-def solve_path(matrices, lamin, n_active, rho, typ, intercept=False):
+def solve_path(
+    matrices,
+    lamin,
+    n_active,
+    rho,
+    typ,
+    intercept=False,
+    lazy_gram=None,
+    sparse=False,
+    param=None,
+    AtA=None,
+):
     """
     This functions will compute the path for all the breaking points :
     beta is a piecewise linear function of lambda, and only value on the breaking points
@@ -131,29 +160,48 @@ def solve_path(matrices, lamin, n_active, rho, typ, intercept=False):
         n_active : another criteria to stop
         rho : only useful for huber-classification
         typ : can be 'R1', 'R3', 'R2','C2' or 'C1'
+        lazy_gram : if True, the matrix A^tA is never formed, which is needed when d is large.
+            If None, it is decided from the dimensions of A
+        sparse : if True, the path is returned as a sparse_path object instead of lists
+        param : parameters_for_update already built for these matrices (for example to read lambdamax first),
+            it is updated along the path. If None, it is built here
+        AtA : A^tA if it is already computed, used to build param (see parameters_for_update)
 
     Return :
         BETA : list of beta(lambda) for lambda in LAMBDA
         LAMBDA : list of breaking points
+        (or a sparse_path if sparse)
     """
 
     d = len(matrices[0][0])
-    param = parameters_for_update(matrices, lamin, rho, typ, intercept=intercept)
-    if intercept:
-        BETA0 = [param.beta0]
-    BETA, LAM = [param.beta], [param.lam]
-    if param.lam < lamin:
+    if param is None:
+        param = parameters_for_update(
+            matrices,
+            lamin,
+            rho,
+            typ,
+            intercept=intercept,
+            lazy_gram=lazy_gram,
+            AtA=AtA,
+        )
+    else:
+        param.lamin = lamin
+    if sparse:
+        PATH = sparse_path(d, intercept=intercept)
+        PATH.append(param.beta, param.lam, param.beta0)
+    else:
         if intercept:
-            return BETA0, BETA, LAM
-        else:
-            return BETA, LAM
+            BETA0 = [param.beta0]
+        BETA, LAM = [param.beta], [param.lam]
     for i in range(d * N_frac):
 
         still_F = np.any(param.F)
         too_active = n_active > 0 and param.number_act >= n_active
 
-        if not still_F or too_active or param.lam == lamin:
-            if intercept:
+        if param.lam < lamin or not still_F or too_active or param.lam == lamin:
+            if sparse:
+                return PATH
+            elif intercept:
                 return BETA0, BETA, LAM
             else:
                 return BETA, LAM
@@ -167,6 +215,9 @@ def solve_path(matrices, lamin, n_active, rho, typ, intercept=False):
         #                      "with rho equal to {} ".format(i, typ, intercept, rho ))
 
         up(param)
+        if sparse:
+            PATH.append(param.beta, param.lam, param.beta0)
+            continue
         BETA.append(param.beta), LAM.append(param.lam)
 
         # print("inside : ", param.r[ param.F], np.nonzero(param.F)[0] )
@@ -182,7 +233,9 @@ def solve_path(matrices, lamin, n_active, rho, typ, intercept=False):
     )
 
 
-def solve_path_Conc(matrices, stop, n_active=False, lassopath=True, true_lam=False):
+def solve_path_Conc(
+    matrices, stop, n_active=False, lassopath=True, true_lam=False, AtA=None
+):
     """
     This functions will compute the path for all the breaking points :
     beta is a piecewise linear function of lambda, and only value on the breaking points
@@ -194,6 +247,7 @@ def solve_path_Conc(matrices, stop, n_active=False, lassopath=True, true_lam=Fal
             continue while lambda_R3 > stop * lambda_R3_max
             but this is the lambda of R3, which live in another space..
         n_active : another criteria to stop
+        AtA : A^tA if it is already computed (see parameters_for_update)
 
     Return :
         BETA : list of beta(lambda) for lambda in LAMBDA
@@ -202,10 +256,10 @@ def solve_path_Conc(matrices, stop, n_active=False, lassopath=True, true_lam=Fal
     """
 
     (A, C, y) = matrices
-    n, d, k = len(A), len(A[0]), len(C)
-    # to compute r = (A beta - y)/||y|| more efficientely ; and we set reduclam=lam/stop to 2 so that if stop = 0, the condition reduclam < ||r|| is never furfilled
-    A_over_NORMy, y_over_NORMy, reduclam = (
-        A / (LA.norm(y)),
+    (n, d), k = A.shape, len(C)
+    # r = (A beta - y)/||y|| ; and we set reduclam=lam/stop to 2 so that if stop = 0, the condition reduclam < ||r|| is never furfilled
+    NORMy, y_over_NORMy, reduclam = (
+        LA.norm(y),
         y / (LA.norm(y)),
         2.0,
     )
@@ -219,13 +273,13 @@ def solve_path_Conc(matrices, stop, n_active=False, lassopath=True, true_lam=Fal
             -y_over_NORMy,
         )
 
-    param = parameters_for_update(matrices, lamin, 0, "R3")
+    param = parameters_for_update(matrices, lamin, 0, "R3", AtA=AtA)
     BETA, LAM = [param.beta], [param.lam]
     for i in range(d * N_frac):
 
         up(param)
         BETA.append(param.beta), LAM.append(param.lam)
-        param.r = A_over_NORMy.dot(param.beta) - y_over_NORMy
+        param.r = A.dot(param.beta) / NORMy - y_over_NORMy
         if stop != 0:
             reduclam = param.lam / stop
         if lassopath:
@@ -252,34 +306,169 @@ def solve_path_Conc(matrices, stop, n_active=False, lassopath=True, true_lam=Fal
     )
 
 
-def pathalgo_general(matrix, path, typ, n_active=False, rho=0, intercept=False):
+def pathalgo_general(
+    matrix,
+    path,
+    typ,
+    n_active=False,
+    rho=0,
+    intercept=False,
+    lazy_gram=None,
+    sparse=False,
+    param=None,
+):
     """
     This function is only to interpolate the solution path between the breaking points
+    If sparse, the sparse_path of the breaking points is returned instead, and can be evaluated on path later.
     """
-    BETA, BETA0, i = [], [], 0
+    out = solve_path(
+        matrix,
+        path[-1],
+        n_active,
+        rho,
+        typ,
+        intercept=intercept,
+        lazy_gram=lazy_gram,
+        sparse=sparse,
+        param=param,
+    )
+    if sparse:
+        return out
     if intercept:
-        B0, B, sp_path = solve_path(
-            matrix, path[-1], n_active, rho, typ, intercept=intercept
-        )
-        B0.append(B0[-1])
-    else:
-        B, sp_path = solve_path(
-            matrix, path[-1], n_active, rho, typ, intercept=intercept
-        )
+        B0, B, sp_path = out
+        return interpolate_path(B, sp_path, path, BETA0=B0)
 
-    sp_path.append(path[-1]), B.append(B[-1])
-    for lam in path:
-        while lam < sp_path[i + 1]:
-            i += 1
-        teta = (sp_path[i] - lam) / (sp_path[i] - sp_path[i + 1])
-        BETA.append(B[i] * (1 - teta) + B[i + 1] * teta)
-        if intercept:
-            BETA0.append(B0[i] * (1 - teta) + B0[i + 1] * teta)
+    B, sp_path = out
+    return interpolate_path(B, sp_path, path)
 
-    if intercept:
-        BETA = np.array([[BETA0[i]] + list(BETA[i]) for i in range(len(BETA0))])
 
-    return BETA
+def interpolation_weights(bp, lambdas):
+    """
+    For a path which is affine between the breaking points bp (in decreasing order),
+    find for each lambda the breaking points i, j = i+1 around it, and teta such that
+    beta(lambda) = (1-teta) beta[i] + teta beta[j]. The path is constant outside of the range of bp.
+    """
+    bp = np.asarray(bp, dtype=float)
+    lambdas = np.asarray(lambdas, dtype=float)
+    if len(bp) == 1:
+        zeros = np.zeros(len(lambdas), dtype=int)
+        return zeros, zeros, np.zeros(len(lambdas))
+    # j is the first breaking point smaller or equal to lam
+    j = len(bp) - np.searchsorted(bp[::-1], lambdas, side="right")
+    j = np.clip(j, 1, len(bp) - 1)
+    i = j - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        teta = np.clip((bp[i] - lambdas) / (bp[i] - bp[j]), 0.0, 1.0)
+    teta[bp[i] == bp[j]] = 1.0
+    return i, j, teta
+
+
+def interpolate_path(BETA, LAM, path, BETA0=None):
+    """
+    Evaluate on the lambdas of path the solution computed on the breaking points LAM,
+    as an array of size len(path) x d (with the intercepts BETA0 in the first column if given)
+    """
+    i, j, teta = interpolation_weights(LAM, path)
+    shift = int(BETA0 is not None)
+    BETAS = np.empty((len(teta), len(BETA[0]) + shift))
+    # filled row by row in place, which avoids the temporaries of size len(path) x d
+    for r in range(len(teta)):
+        row = BETAS[r, shift:]
+        np.multiply(BETA[i[r]], 1 - teta[r], out=row)
+        if teta[r] > 0:
+            row += teta[r] * BETA[j[r]]
+    if BETA0 is not None:
+        B0 = np.asarray(BETA0)
+        BETAS[:, 0] = B0[i] * (1 - teta) + B0[j] * teta
+    return BETAS
+
+
+class sparse_path:
+    """Solution path stored by its breaking points, with only the nonzero coefficients of each beta.
+
+    Since beta is affine in lambda between two breaking points, the path can be evaluated
+    at any lambda, and the dense array of the betas is only formed on request.
+
+    Attributes :
+        d           : dimension of beta (without intercept)
+        intercept   : whether the path also contains an intercept
+        lambdas     : array of the breaking points, in decreasing order
+        indices     : list of arrays, indices[i] are the nonzero coefficients of the i-th beta
+        values      : list of arrays, values[i] are the values of those coefficients
+        beta0       : list of the intercepts (empty without intercept)
+
+    """
+
+    def __init__(self, d, intercept=False):
+        self.d = d
+        self.intercept = intercept
+        self.lambdas = np.zeros(0)
+        self.indices, self.values, self.beta0 = [], [], []
+
+    def __len__(self):
+        return len(self.indices)
+
+    def append(self, beta, lam, beta0=None):
+        idx = np.nonzero(beta)[0]
+        self.indices.append(idx)
+        self.values.append(beta[idx])
+        self.lambdas = np.append(self.lambdas, lam)
+        if self.intercept:
+            self.beta0.append(beta0)
+
+    def beta(self, i):
+        """Dense beta at the i-th breaking point (with the intercept first if any)"""
+        beta = np.zeros(self.d)
+        beta[self.indices[i]] = self.values[i]
+        if self.intercept:
+            beta = np.concatenate([[self.beta0[i]], beta])
+        return beta
+
+    def to_dense(self):
+        """Dense array of the betas at the breaking points"""
+        return self.evaluate(self.lambdas)
+
+    def evaluate(self, lambdas):
+        """Dense array of size len(lambdas) x d of the betas (with the intercept first if any)
+        on the lambdas, interpolated between the breaking points,
+        and constant outside of the range of the breaking points.
+        """
+        i, j, teta = interpolation_weights(self.lambdas, lambdas)
+        BETAS = np.zeros((len(teta), self.d + self.intercept))
+        shift = int(self.intercept)
+        for k in np.unique(np.concatenate([i, j])):
+            coef = (1 - teta) * (i == k) + teta * (j == k)
+            rows = np.nonzero(coef)[0]
+            BETAS[np.ix_(rows, self.indices[k] + shift)] += np.outer(
+                coef[rows], self.values[k]
+            )
+            if self.intercept:
+                BETAS[rows, 0] += coef[rows] * self.beta0[k]
+        return BETAS
+
+    def scale(self, w):
+        """Divide the coefficients of the betas by w (not the intercept)"""
+        self.values = [v / w[idx] for idx, v in zip(self.indices, self.values)]
+
+    def add_intercept(self, ybar, Xbar):
+        """Add the intercept ybar - Xbar.beta, used for R1 and R3 where the problem is centered"""
+        self.intercept = True
+        self.beta0 = [
+            ybar - np.vdot(Xbar[idx], v) for idx, v in zip(self.indices, self.values)
+        ]
+
+
+def to_sparse_path(BETAS, lambdas, intercept=False):
+    """Store betas computed on a grid of lambdas (decreasing) in a sparse_path,
+    in which they are interpolated between the lambdas of the grid"""
+    BETAS = np.asarray(BETAS)
+    path = sparse_path(BETAS.shape[1] - int(intercept), intercept=intercept)
+    for beta, lam in zip(BETAS, lambdas):
+        if intercept:
+            path.append(beta[1:], lam, beta[0])
+        else:
+            path.append(beta, lam)
+    return path
 
 
 def up(param):
@@ -308,62 +497,35 @@ def up_LS(param):
     # parameters that does not change
     lambdamax = param.lambdamax
     lamin = param.lamin
-    M = param.M
     C = param.C
-    eps_L2 = param.eps_L2
 
     # parameters to be updated
     number_act = param.number_act
     idr = param.idr
-    Xt = param.Xt
+    fact = param.fact
     activity = param.activity
     beta = param.beta
     s = param.s
     lam = param.lam
 
     d = len(activity)
-    L = [lam] * d
-    Mat = M[:d, :d]
-    beta_dot, lam_s_dot = derivatives(activity, s, Mat, M[d:, :d], Xt, idr, number_act)
-    for i in range(d):
-        bi, di, e, s0 = beta[i], beta_dot[i], lam_s_dot[i], s[i]
+    Mat = param.gram
+    beta_dot, lam_s_dot = derivatives(activity, s, Mat, param.C, fact, idr)
+    skip = abs(lam_s_dot - s) < 1e-10
+    L = activity_steps(activity, beta, beta_dot, lam_s_dot, s, lam, lambdamax, skip)
+    dlamb = min(np.min(L), lam - lamin)
+    # Update the factor, list of rows in C and activity
+    for i in np.nonzero(L < dlamb + 1e-10)[0]:
         if activity[i]:
-            if abs(bi * di) > 1e-10 and bi * di > 0:
-                L[i] = bi / (di * lambdamax)
+            activity[i], number_act = False, number_act - 1
+            fact.remove(i)
+            if len(param.C) > 0:
+                param.rows.remove(i)
         else:
-            if abs(e - s0) < 1e-10:
-                continue
-            if e > s0:
-                dl = (1 + s0) / (1 + e)
-            else:
-                dl = (1 - s0) / (1 - e)
-            L[i] = dl * lam
-    dlamb = min(min(L), lam - lamin)
-    # Update matrix inverse, list of rows in C and activity
-    for i in range(d):
-        if L[i] < dlamb + 1e-10:
-            if activity[i]:
-                activity[i], number_act = False, number_act - 1
-                if len(M) > d:
-                    to_ad = next_idr2(idr, C[:, activity])
-                    if type(to_ad) == int:
-                        idr[to_ad] = False
-            else:
-                # x = M[:, activity + idr][i]
-                # al = M[i, i] - np.vdot(x, Xt.dot(x))
-                # if (abs(al) < 1e-10): break
-                activity[i], number_act = True, number_act + 1
-                if len(M) > d:
-                    to_ad = next_idr1(idr, C[:, activity])
-                    if type(to_ad) == int:
-                        idr[to_ad] = True
-
-    N = M[activity + idr, :][:, activity + idr]
-
-    try:
-        Xt = LA.inv(N)
-    except LA.LinAlgError:
-        Xt = LA.inv(N + eps_L2 * np.eye(len(N)))
+            activity[i], number_act = True, number_act + 1
+            fact.add(i)
+            if len(param.C) > 0:
+                param.rows.add(i)
 
     beta = beta - lambdamax * beta_dot * dlamb
     if dlamb < lam:
@@ -372,7 +534,6 @@ def up_LS(param):
 
     param.number_act = number_act
     param.idr = idr
-    param.Xt = Xt
     param.activity = activity
     param.beta = beta
     param.s = s
@@ -391,114 +552,76 @@ def up_huber(param):
     y = param.y
     C = param.C
     rho = param.rho
-    eps_L2 = param.eps_L2
 
     # parameters to be updated
     number_act = param.number_act
     idr = param.idr
-    Xt = param.Xt
+    fact = param.fact
     activity = param.activity
     F = param.F
     beta = param.beta
     s = param.s
     lam = param.lam
-    M = param.M
     r = param.r
 
     d = len(activity)
-    L = [lam] * d
-    Mat = M[:d, :d]
-    beta_dot, lam_s_dot = derivatives(activity, s, Mat, M[d:, :d], Xt, idr, number_act)
-    for i in range(d):
-        bi, di, e, s0 = beta[i], beta_dot[i], lam_s_dot[i], s[i]
-        if activity[i]:
-            if abs(bi * di) > 1e-10 and bi * di > 0:
-                L[i] = bi / (di * lambdamax)
-        else:
-            if abs(e + s0) < 1e-10 or abs(s0) > 1:
-                continue
-            if e > s0:
-                dl = (1 + s0) / (1 + e)
-            else:
-                dl = (1 - s0) / (1 - e)
-            L[i] = dl * lam
+    Mat = param.gram
+    beta_dot, lam_s_dot = derivatives(activity, s, Mat, param.C, fact, idr)
+    skip = (abs(lam_s_dot + s) < 1e-10) | (abs(s) > 1)
+    L = activity_steps(activity, beta, beta_dot, lam_s_dot, s, lam, lambdamax, skip)
 
-    dlamb = min(min(L), lam, lam - lamin)
+    dlamb = min(np.min(L), lam, lam - lamin)
     huber_up = False
     ADl = -A.dot(beta_dot) * lambdamax
     if param.intercept:
         ADl += np.vdot(param.Abar, beta_dot) * lambdamax
 
-    huber_up = False
-    j_switch = None
-    for j in range(len(r)):
-        #     find if there is a  0< dl < dlamb such that F[j] and |r[j]+ADl[j]*dl|>rho
-        # or  find if there is a  0< dl < dlamb such that not F[j] |r[j]+ADl[j]*dl|<rho
-        if abs(ADl[j]) < 1e-6 or abs(r[j]) < 1e-6 or abs(abs(r[j]) - rho) < 1e-6:
-            continue
-        c = -r[j] / ADl[j]
-        dl = (1 - rho / abs(r[j])) * c
-        if dl < 0:
-            if c > 0:
-                dl = (1 + rho / abs(r[j])) * c
-            else:
-                dl = dlamb
-        if dl < dlamb:
-            huber_up, j_switch, dlamb = True, j, dl
+    #     find the smallest 0< dl < dlamb such that F[j] and |r[j]+ADl[j]*dl|>rho
+    # or  find the smallest 0< dl < dlamb such that not F[j] |r[j]+ADl[j]*dl|<rho
+    skip = (abs(ADl) < 1e-6) | (abs(r) < 1e-6) | (abs(abs(r) - rho) < 1e-6)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        c = -r / ADl
+        dl = (1 - rho / abs(r)) * c
+        dl = np.where(dl < 0, np.where(c > 0, (1 + rho / abs(r)) * c, np.inf), dl)
+    dl[skip] = np.inf
+    j_switch, dlamb = first_switch(dl, dlamb)
+    huber_up = j_switch is not None
     beta = beta - lambdamax * beta_dot * dlamb
     if dlamb < lam:
         s = lam_s_dot + lam / (lam - dlamb) * (s - lam_s_dot)
     r = r + ADl * dlamb
     lam = lam - dlamb
     if param.intercept:
-        beta0_dot = -np.vdot(np.mean(A[F], axis=0), beta_dot)
+        beta0_dot = -np.vdot(param.AbarF, beta_dot)
         beta0 = param.beta0 - lambdamax * beta0_dot * dlamb
 
     if huber_up:
-        F[j_switch] = not F[j_switch]
         # sufficient :
         # F = F | (abs(r) < rho - 1e-6)
         # necessary :
         # F = F & (abs(r) <= rho + 1e-6)
-
-        if param.intercept:
-            P = A[F] - np.mean(A[F], axis=0)
-            M[:d, :][:, :d] = 2 * P.T.dot(P) + eps_L2 * np.eye(d)
-        else:
-            M[:d, :][:, :d] = 2 * A[F].T.dot(A[F]) + eps_L2 * np.eye(d)
+        switch_sample(param, j_switch)
     else:
-        # Update matrix inverse, list of rows in C and activity
-        for i in range(d):
-            if L[i] < dlamb + 1e-10:
-                if activity[i]:
-                    activity[i], number_act = False, number_act - 1
-                    if len(M) > d:
-                        to_ad = next_idr2(idr, M[d:, :d][:, activity])
-                        if type(to_ad) == int:
-                            idr[to_ad] = False
-                else:
-                    activity[i], number_act = True, number_act + 1
-                    if len(M) > d:
-                        to_ad = next_idr1(idr, M[d:, :d][:, activity])
-                        if type(to_ad) == int:
-                            idr[to_ad] = True
-
-    N = M[activity + idr, :][:, activity + idr]
-
-    try:
-        Xt = LA.inv(N)
-    except LA.LinAlgError:
-        Xt = LA.inv(N + eps_L2 * np.eye(len(N)))
+        # Update the factor, list of rows in C and activity
+        for i in np.nonzero(L < dlamb + 1e-10)[0]:
+            if activity[i]:
+                activity[i], number_act = False, number_act - 1
+                fact.remove(i)
+                if len(param.C) > 0:
+                    param.rows.remove(i)
+            else:
+                activity[i], number_act = True, number_act + 1
+                fact.add(i)
+                if len(param.C) > 0:
+                    param.rows.add(i)
 
     param.number_act = number_act
     param.idr = idr
-    param.Xt = Xt
     param.activity = activity
     param.F = F
     param.beta = beta
     param.s = s
     param.lam = lam
-    param.M = M
     param.r = r
     if param.intercept:
         param.beta0 = beta0
@@ -512,54 +635,34 @@ def up_cl(param):
     lamin = param.lamin
     A = param.A
     y = param.y
-    eps_L2 = param.eps_L2
 
     number_act = param.number_act
     idr = param.idr
-    Xt = param.Xt
+    fact = param.fact
     activity = param.activity
     F = param.F
     beta = param.beta
     s = param.s
     lam = param.lam
-    M = param.M
     r = param.r
 
     d = len(activity)
-    L = [lam] * d
-    Mat = M[:d, :d]
-    beta_dot, lam_s_dot = derivatives(activity, s, Mat, M[d:, :d], Xt, idr, number_act)
-    for i in range(d):
-        bi, di, e, s0 = beta[i], beta_dot[i], lam_s_dot[i], s[i]
-        if activity[i]:
-            if abs(bi * di) > 1e-10 and bi * di > 0:
-                L[i] = bi / (di * lambdamax)
-        else:
-            if abs(e + s0) < 1e-10 or abs(s0) > 1:
-                continue
-            if e > s0:
-                dl = (1 + s0) / (1 + e)
-            else:
-                dl = (1 - s0) / (1 - e)
-            L[i] = dl * lam
+    Mat = param.gram
+    beta_dot, lam_s_dot = derivatives(activity, s, Mat, param.C, fact, idr)
+    skip = (abs(lam_s_dot + s) < 1e-10) | (abs(s) > 1)
+    L = activity_steps(activity, beta, beta_dot, lam_s_dot, s, lam, lambdamax, skip)
 
-    dlamb = min(min(L), lam, lam - lamin)
-    max_up = False
-    j_switch = None
+    dlamb = min(np.min(L), lam, lam - lamin)
     yADl = -y * A.dot(beta_dot) * lambdamax
     if param.intercept:
         yADl += y * np.vdot(param.Abar, beta_dot) * lambdamax
-    for j in range(len(r)):
-        #     find if there is a  0< dl < dlamb such that F[j] and r[j]+yADl[j]*dl > 1
-        # or  find if there is a  0< dl < dlamb such that not F[j] r[j]+yADl[j]*dl < 1
-        if abs(r[j] - 1) < 1e-4:
-            continue
-        if yADl[j] != 0.0:
-            dl = (1 - r[j]) / yADl[j]
-        else:
-            dl = -1
-        if dl < dlamb and dl > 0:
-            max_up, j_switch, dlamb = True, j, dl
+    #     find the smallest 0< dl < dlamb such that F[j] and r[j]+yADl[j]*dl > 1
+    # or  find the smallest 0< dl < dlamb such that not F[j] r[j]+yADl[j]*dl < 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dl = (1 - r) / yADl
+    dl[(abs(r - 1) < 1e-4) | (yADl == 0.0) | ~(dl > 0)] = np.inf
+    j_switch, dlamb = first_switch(dl, dlamb)
+    max_up = j_switch is not None
 
     beta = beta - lambdamax * beta_dot * dlamb
     if dlamb < lam:
@@ -567,57 +670,36 @@ def up_cl(param):
     r = r + yADl * dlamb
     lam = lam - dlamb
     if param.intercept:
-        AbarF = np.mean(A[F], axis=0)
-        beta0_dot = -np.vdot(AbarF, beta_dot)
+        beta0_dot = -np.vdot(param.AbarF, beta_dot)
         beta0 = param.beta0 - lambdamax * beta0_dot * dlamb
 
     if max_up:
-        F[j_switch] = not F[j_switch]
         # sufficient :
         # F = F | (r < 1. - 1e-10)
         # necessary :
         # F = F & (r <= 1. + 1e-10)
-        if param.intercept:
-            P = A[F] - np.mean(A[F], axis=0)
-            M[:d, :][:, :d] = 2 * P.T.dot(P) + eps_L2 * np.eye(d)
-        else:
-            M[:d, :][:, :d] = 2 * A[F].T.dot(A[F]) + eps_L2 * np.eye(d)
+        switch_sample(param, j_switch)
     else:
-        # Update matrix inverse, list of rows in C and activity
-        for i in range(d):
-            if L[i] < dlamb + 1e-10:
-                if activity[i]:
-                    activity[i], number_act = False, number_act - 1
-                    if len(M) > d:
-                        to_ad = next_idr2(idr, M[d:, :d][:, activity])
-                        if type(to_ad) == int:
-                            idr[to_ad] = False
-                else:
-                    # x = M[:,activity+idr][i]
-                    # al = M[i,i]-np.vdot(x,Xt.dot(x))
-                    # if (abs(al)<1e-10): break
-                    activity[i], number_act = True, number_act + 1
-                    if len(M) > d:
-                        to_ad = next_idr1(idr, M[d:, :d][:, activity])
-                        if type(to_ad) == int:
-                            idr[to_ad] = True
-
-    N = M[activity + idr, :][:, activity + idr]
-
-    try:
-        Xt = LA.inv(N)
-    except LA.LinAlgError:
-        Xt = LA.inv(N + eps_L2 * np.eye(len(N)))
+        # Update the factor, list of rows in C and activity
+        for i in np.nonzero(L < dlamb + 1e-10)[0]:
+            if activity[i]:
+                activity[i], number_act = False, number_act - 1
+                fact.remove(i)
+                if len(param.C) > 0:
+                    param.rows.remove(i)
+            else:
+                activity[i], number_act = True, number_act + 1
+                fact.add(i)
+                if len(param.C) > 0:
+                    param.rows.add(i)
 
     param.number_act = number_act
     param.idr = idr
-    param.Xt = Xt
     param.activity = activity
     param.F = F
     param.beta = beta
     param.s = s
     param.lam = lam
-    param.M = M
     param.r = r
     if param.intercept:
         param.beta0 = beta0
@@ -634,72 +716,40 @@ def up_huber_cl(param):
     A = param.A
     y = param.y
     rho = param.rho
-    eps_L2 = param.eps_L2
 
     # parameters to be updated
     number_act = param.number_act
     idr = param.idr
-    Xt = param.Xt
+    fact = param.fact
     activity = param.activity
     F = param.F
     beta = param.beta
     s = param.s
     lam = param.lam
-    M = param.M
     r = param.r
 
     d = len(activity)
-    L = [lam] * d
-    Mat = M[:d, :d]
-    beta_dot, lam_s_dot = derivatives(
-        activity,
-        s,
-        Mat,
-        M[d:, :d],
-        Xt,
-        idr,
-        number_act,
-    )
-    for i in range(d):
-        bi, di, e, s0 = beta[i], beta_dot[i], lam_s_dot[i], s[i]
-        if activity[i]:
-            if abs(bi * di) > 1e-10 and bi * di > 0:
-                L[i] = bi / (di * lambdamax)
-        else:
-            if abs(e - s0) < 1e-10 or abs(s0) > 1:
-                continue
-            if e > s0:
-                dl = (1 + s0) / (1 + e)
-            else:
-                dl = (1 - s0) / (1 - e)
-            L[i] = dl * lam
+    Mat = param.gram
+    beta_dot, lam_s_dot = derivatives(activity, s, Mat, param.C, fact, idr)
+    skip = (abs(lam_s_dot - s) < 1e-10) | (abs(s) > 1)
+    L = activity_steps(activity, beta, beta_dot, lam_s_dot, s, lam, lambdamax, skip)
 
-    dlamb = min(min(L), lam, lam - lamin)
-    max_up = False
-    j_switch = None
+    dlamb = min(np.min(L), lam, lam - lamin)
     yADl = -y * A.dot(beta_dot) * lambdamax
     if param.intercept:
         yADl += y * np.vdot(param.Abar, beta_dot) * lambdamax
-    for j in range(len(r)):
-        #     find if there is a  0< dl < dlamb such that F[j] and r[j]+yADl[j]*dl > 1
-        # or  find if there is a  0< dl < dlamb such that not F[j] r[j]+yADl[j]*dl < 1
-        #     find if there is a  0< dlhuber < dlamb such that F[j] and r[j]+yADl[j]*dl < rho
-        # or  find if there is a  0< dlhuber < dlamb such that not F[j] r[j]+yADl[j]*dl > rho
-
-        if yADl[j] != 0.0:
-            dlmax = (1 - r[j]) / yADl[j]
-            dlhuber = (rho - r[j]) / yADl[j]
-        else:
-            dlmax, dlhuber = dlamb + 1, dlamb + 1
-        if dlmax <= 0.0:
-            dlmax = dlamb + 1
-        if dlhuber <= 0.0:
-            dlhuber = dlamb + 1
-
-        dl = min(dlhuber, dlmax)
-
-        if dl < dlamb:
-            max_up, j_switch, dlamb = True, j, dl
+    #     find the smallest 0< dl < dlamb such that F[j] and r[j]+yADl[j]*dl > 1
+    # or  find the smallest 0< dl < dlamb such that not F[j] r[j]+yADl[j]*dl < 1
+    #     find the smallest 0< dlhuber < dlamb such that F[j] and r[j]+yADl[j]*dl < rho
+    # or  find the smallest 0< dlhuber < dlamb such that not F[j] r[j]+yADl[j]*dl > rho
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dlmax = (1 - r) / yADl
+        dlhuber = (rho - r) / yADl
+    # a sample that lies on a boundary has just switched there
+    dlmax[(yADl == 0.0) | ~(dlmax > 0.0) | (abs(r - 1) < 1e-10)] = np.inf
+    dlhuber[(yADl == 0.0) | ~(dlhuber > 0.0) | (abs(r - rho) < 1e-10)] = np.inf
+    j_switch, dlamb = first_switch(np.minimum(dlhuber, dlmax), dlamb)
+    max_up = j_switch is not None
 
     beta = beta - lambdamax * beta_dot * dlamb
     if dlamb < lam:
@@ -707,66 +757,117 @@ def up_huber_cl(param):
     r = r + yADl * dlamb
     lam = lam - dlamb
     if param.intercept:
-        beta0_dot = -np.vdot(np.mean(A[F], axis=0), beta_dot)
+        beta0_dot = -np.vdot(param.AbarF, beta_dot)
         beta0 = param.beta0 - lambdamax * beta0_dot * dlamb
 
     if max_up:
-        F[j_switch] = not F[j_switch]
         # sufficient :
         # F = F | ( (r < 1. - 1e-10) & (r > rho + 1e-10) )
         # necessary :
         # F = F & ( (r <= 1. + 1e-10) & (r >= rho - 1e-10) )
-
-        if np.any(F):
-            if param.intercept:
-                P = A[F] - np.mean(A[F], axis=0)
-                M[:d, :][:, :d] = 2 * P.T.dot(P) + eps_L2 * np.eye(d)
-            else:
-                M[:d, :][:, :d] = 2 * A[F].T.dot(A[F]) + eps_L2 * np.eye(d)
+        switch_sample(param, j_switch)
 
     else:
-        # Update matrix inverse, list of rows in C and activity
-        for i in range(d):
-            if L[i] < dlamb + 1e-10:
-                if activity[i]:
-                    activity[i], number_act = False, number_act - 1
-                    if len(M) > d:
-                        to_ad = next_idr2(idr, M[d:, :d][:, activity])
-                        if type(to_ad) == int:
-                            idr[to_ad] = False
-                else:
-                    # x = M[:,activity+idr][i]
-                    # al = M[i,i]-np.vdot(x,Xt.dot(x))
-                    # if (abs(al)<1e-10): break
-                    activity[i], number_act = True, number_act + 1
-                    if len(M) > d:
-                        to_ad = next_idr1(idr, M[d:, :d][:, activity])
-                        if type(to_ad) == int:
-                            idr[to_ad] = True
-
-    N = M[activity + idr, :][:, activity + idr]
-
-    try:
-        Xt = LA.inv(N)
-    except LA.LinAlgError:
-        Xt = LA.inv(N + eps_L2 * np.eye(len(N)))
+        # Update the factor, list of rows in C and activity
+        for i in np.nonzero(L < dlamb + 1e-10)[0]:
+            if activity[i]:
+                activity[i], number_act = False, number_act - 1
+                fact.remove(i)
+                if len(param.C) > 0:
+                    param.rows.remove(i)
+            else:
+                activity[i], number_act = True, number_act + 1
+                fact.add(i)
+                if len(param.C) > 0:
+                    param.rows.add(i)
 
     param.number_act = number_act
     param.idr = idr
-    param.Xt = Xt
     param.activity = activity
     param.F = F
     param.beta = beta
     param.s = s
     param.lam = lam
-    param.M = M
     param.r = r
     if param.intercept:
         param.beta0 = beta0
 
 
+def activity_steps(activity, beta, beta_dot, lam_s_dot, s, lam, lambdamax, skip):
+    """
+    Compute, for every parameter, the step in lambda before it leaves (if active)
+    or enters (if inactive) the active set, with array operations instead of a loop over d.
+
+    Args :
+        skip    : boolean array of inactive parameters that are not considered (their step is lam)
+
+    Returns :
+        L       : array of size d, whose entries equal lam when no such step is found
+    """
+    activity = np.asarray(activity, dtype=bool)
+    L = np.full(len(beta), float(lam))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # active parameters : beta + dl*beta_dot*lambdamax reaches 0
+        bd = beta * beta_dot
+        leave = activity & (bd > 1e-10)
+        L[leave] = beta[leave] / (beta_dot[leave] * lambdamax)
+
+        # inactive parameters : |lambda s| reaches lambda
+        enter = ~activity & ~skip
+        e, s0 = lam_s_dot[enter], s[enter]
+        L[enter] = np.where(e > s0, (1 + s0) / (1 + e), (1 - s0) / (1 - e)) * lam
+    return L
+
+
+def first_switch(dl, dlamb):
+    """
+    Find the first sample to switch, i.e. the first index of the smallest entry of dl
+    if it is smaller than dlamb. Entries of samples that cannot switch are expected to be infinite.
+
+    Returns :
+        j_switch, dlamb   : (None, dlamb) if no sample switches before dlamb
+    """
+    if len(dl) == 0:
+        return None, dlamb
+    j = int(np.argmin(dl))
+    if dl[j] < dlamb:
+        return j, dl[j]
+    return None, dlamb
+
+
+def switch_sample(param, j):
+    """
+    Add or remove the sample j from F, and update M (or the cached columns when lazy) and the factor accordingly.
+
+    Only the row A[j] is involved : N.T N changes by the rank one matrix  A[j].T A[j],
+    and with intercept, the centered matrix changes by  n/(n+1) (A[j]-Abar).T (A[j]-Abar)  when A[j] is added
+    to the n rows of F with mean Abar,  and by  n/(n-1) (A[j]-Abar).T (A[j]-Abar)  when it is removed.
+    """
+    A, F = param.A, param.F
+    n_F = np.sum(F)
+    if F[j]:
+        sign = -1.0
+    else:
+        sign = 1.0
+    F[j] = not F[j]
+    if n_F + sign == 0:
+        # nothing to update, the path algorithm stops here
+        return
+
+    u = A[j]
+    if param.intercept:
+        u = (u - param.AbarF) * np.sqrt(n_F / (n_F + sign))
+        param.AbarF = param.AbarF + sign * (A[j] - param.AbarF) / (n_F + sign)
+    u = np.sqrt(2) * u
+    if param.lazy:
+        param.gram.update(u, sign, AbarF=param.AbarF if param.intercept else None)
+    else:
+        param.gram += sign * np.outer(u, u)
+    param.fact.update(u, sign)
+
+
 # Compute the derivatives of the solution Beta and the derivative of lambda*subgradient thanks to the ODE
-def derivatives(activity, s, Mat, C, Inv, idr, number_act):
+def derivatives(activity, s, Mat, C, fact, idr):
     """
     Compute the derivatives of the solution Beta and the derivative of lambda*subgradient
     thanks to the following equation :
@@ -776,25 +877,291 @@ def derivatives(activity, s, Mat, C, Inv, idr, number_act):
 
      (lambda s)_dot  = 2A[inactive].T A[active] beta_dot         on inactive variables
 
-     Then : Mat = A[inactive].T A[active]  and Inv is the inverse of a matrix of the first equaction.
+     Then : Mat = A[inactive].T A[active]  and fact is the factor of the first block of the first equation.
 
     """
+    order = fact.order
     beta_dot = np.zeros(len(activity))
-    beta_dot[activity] = -Inv[:number_act, :number_act].dot(s[activity])
+    x, v = fact.solve(s[order], C[idr][:, order])
+    beta_dot[order] = -x
     lam_s_dot = -Mat.dot(beta_dot)
 
     if len(C) > 0:
         v_dot = np.zeros(len(C))
-        v_dot[idr] = Inv[number_act:, :number_act].dot(s[activity])
+        v_dot[idr] = v
         lam_s_dot += C.T.dot(v_dot)
 
     return (beta_dot, lam_s_dot)
 
 
+class gram_columns:
+    """Matrix M[:d, :d] = 2 N.T N + 2 eps_L2 I  of the path algorithm, without forming it.
+
+    N = A[F] (centered if intercept), so only the matrix A of size n*d is stored.
+    The columns of M that are asked (those of the active parameters) are computed with
+    one product A.T.dot(w) each, and kept in a cache of bounded size.
+    The products with M are computed with the cached columns if possible,
+    and otherwise as 2 A.T.dot(N.dot(v)), so in O(nd) instead of O(d^2).
+
+    Attributes :
+        A, F        : the matrix and the boolean array of the samples in F, which is changed in place
+        eps_L2      : regularization of the diagonal
+        AbarF       : mean of the rows of A in F, None without intercept
+        cache_size  : maximum number of columns in the cache, n + k by default
+        cache       : OrderedDict i -> M[:, i], the last used columns being at the end
+
+    """
+
+    def __init__(self, A, F, eps_L2, AbarF=None, cache_size=None):
+        self.A, self.F = A, F
+        self.eps_L2 = eps_L2
+        self.AbarF = AbarF
+        if cache_size is None:
+            cache_size = A.shape[0]
+        self.cache_size = max(cache_size, 1)
+        self.cache = OrderedDict()
+
+    def Nt_N_dot(self, v):
+        # N.T N v = A[F].T (A[F] v - Abar.v) since the columns of N sum to 0
+        w = self.A.dot(v)
+        if self.AbarF is not None:
+            w = w - np.vdot(self.AbarF, v)
+        return self.A.T.dot(w * self.F)
+
+    def column(self, i):
+        if i in self.cache:
+            self.cache.move_to_end(i)
+            return self.cache[i]
+        e = np.zeros(self.A.shape[1])
+        e[i] = 1.0
+        col = 2 * self.Nt_N_dot(e) + 2 * self.eps_L2 * e
+        self.cache[i] = col
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return col
+
+    def block(self, rows, cols):
+        """Return M[rows][:, cols]"""
+        B = np.zeros((len(rows), len(cols)))
+        for c, i in enumerate(cols):
+            B[:, c] = self.column(i)[rows]
+        return B
+
+    def dot(self, v):
+        support = np.nonzero(v)[0]
+        if all(i in self.cache for i in support):
+            out = np.zeros(len(v))
+            for i in support:
+                out += v[i] * self.cache[i]
+            return out
+        return 2 * self.Nt_N_dot(v) + 2 * self.eps_L2 * v
+
+    def update(self, u, sign=1.0, AbarF=None):
+        """M becomes M + sign * u u^T, when a sample enters or leaves F (which is already updated)"""
+        self.AbarF = AbarF
+        for i in self.cache:
+            self.cache[i] += sign * u[i] * u
+
+
+class active_factor:
+    """Cholesky factor of the matrix M restricted to the active parameters.
+
+    It is updated when one parameter is added or removed from the active set,
+    which costs O(a^2) instead of the O(a^3) of a new factorization.
+    The factor is recomputed from scratch when an update becomes numerically poor.
+
+    Attributes :
+        gram        : function such that gram(rows, cols) returns the block M[rows][:, cols]
+        order       : list of active parameters, in the order they have been added to the factor
+        L           : lower triangular matrix such that L.L^T = M[order][:, order]
+        jitter      : value added to the diagonal if the block is not numerically definite
+        tol         : relative threshold under which a pivot is considered as poor
+
+    """
+
+    def __init__(self, gram, order, jitter=1e-3, tol=1e-10):
+        self.gram = gram
+        self.jitter = jitter
+        self.tol = tol
+        self.refactor(order)
+
+    def refactor(self, order):
+        self.order = list(order)
+        H = self.gram(self.order, self.order)
+        try:
+            self.L = LA.cholesky(H)
+        except LA.LinAlgError:
+            self.L = LA.cholesky(H + self.jitter * np.eye(len(H)))
+
+    def add(self, i):
+        a = len(self.order)
+        col = self.gram(self.order + [i], [i])[:, 0]
+        l = solve_triangular(self.L, col[:a], lower=True)
+        pivot = col[a] - l.dot(l)
+        if pivot <= self.tol * abs(col[a]):
+            self.refactor(self.order + [i])
+            return
+        L = np.zeros((a + 1, a + 1))
+        L[:a, :a], L[a, :a], L[a, a] = self.L, l, np.sqrt(pivot)
+        self.L = L
+        self.order.append(i)
+
+    def remove(self, i):
+        p = self.order.index(i)
+        x = self.L[p + 1 :, p]
+        L = np.delete(np.delete(self.L, p, axis=0), p, axis=1)
+        del self.order[p]
+        # the rows after p lost the column p : it is a rank one update of the last block
+        if not chol_update(L[p:, p:], x):
+            self.refactor(self.order)
+            return
+        self.L = L
+        self.check()
+
+    def update(self, u, sign=1.0):
+        """Rank one update of the factorized block : M[order][:, order] + sign * u[order].u[order]^T"""
+        if chol_update(self.L, u[self.order], sign):
+            self.check()
+        else:
+            self.refactor(self.order)
+
+    def check(self):
+        diag = abs(np.diag(self.L))
+        if len(diag) > 0 and min(diag) <= np.sqrt(self.tol) * max(diag):
+            self.refactor(self.order)
+
+    def solve(self, s, C):
+        """Solve the system :
+
+        H x + C.T v = s
+        C x         = 0
+
+        where H = L.L^T, thanks to the Schur complement C H^-1 C.T which is small
+        """
+        z = solve_triangular(self.L, s, lower=True)
+        v = np.zeros(len(C))
+        if len(C) > 0 and len(z) > 0:
+            W = solve_triangular(self.L, C.T, lower=True)
+            v = LA.lstsq(W.T.dot(W), W.T.dot(z), rcond=None)[0]
+            z = z - W.dot(v)
+        x = solve_triangular(self.L, z, lower=True, trans="T")
+        return x, v
+
+
+def chol_update(L, x, sign=1.0):
+    """
+    Rank one update (sign = 1) or downdate (sign = -1), in place, of a lower triangular Cholesky factor :
+    L.L^T  becomes  L.L^T + sign * x.x^T
+
+    Returns False if the downdated matrix is not numerically positive definite.
+    """
+    x = np.array(x, dtype=float)
+    for k in range(len(x)):
+        r2 = L[k, k] ** 2 + sign * x[k] ** 2
+        if r2 <= 0.0:
+            return False
+        r = np.sqrt(r2)
+        c, t = r / L[k, k], x[k] / L[k, k]
+        L[k, k] = r
+        L[k + 1 :, k] = (L[k + 1 :, k] + sign * t * x[k + 1 :]) / c
+        x[k + 1 :] = c * x[k + 1 :] - t * L[k + 1 :, k]
+    return True
+
+
+class active_rows:
+    """QR factorization of the matrix C[idr][:, order].T , where order is the list of active parameters
+    and idr saves independant rows of C restricted to the active parameters.
+
+    The factorization is updated when one parameter is added or removed from the active set,
+    and a row is added or removed from idr when it becomes independant or dependant,
+    so there is no new QR of the matrix at each breaking point.
+
+    Attributes :
+        C           : matrix of constraints
+        idr         : list of boolean, idr[j] is True when the row j of C is in the independant set
+        rows        : sorted list of the indices j such that idr[j], i.e. the columns of the factorized matrix
+        order       : list of active parameters, i.e. the rows of the factorized matrix
+        Q, R        : full QR factorization of C[rows][:, order].T
+        tol         : threshold under which a vector is considered as zero
+
+    """
+
+    def __init__(self, C, tol=1e-10):
+        self.C = np.asarray(C, dtype=float)
+        self.tol = tol
+        self.idr = [False] * len(C)
+        self.rows = []
+        self.order = []
+        self.Q, self.R = np.eye(0), np.zeros((0, 0))
+
+    def add(self, i):
+        """Add the parameter i to the active set, and return the row added to idr (or False)"""
+        a, r = len(self.order), len(self.rows)
+        if r == 0:
+            self.Q, self.R = np.eye(a + 1), np.zeros((a + 1, 0))
+        else:
+            self.Q, self.R = qr_insert(
+                self.Q, self.R, self.C[self.rows, i], a, which="row"
+            )
+        self.order.append(i)
+        if r == len(self.C):
+            return False
+
+        if r == 0:
+            # the rows of C were zero on the previous active parameters
+            res = self.C[:, i]
+            candidates = np.nonzero(res != 0)[0]
+        else:
+            # rows outside idr were in the span of the rows of idr, so they can only get out of it
+            # along the new direction of the orthogonal complement, which is the projection of e_i
+            q = self.Q[:, r:].dot(self.Q[a, r:])
+            nq = LA.norm(q)
+            if nq < self.tol:
+                return False
+            res = self.C[:, self.order].dot(q) / nq
+            res[self.rows] = 0.0
+            candidates = np.nonzero(abs(res) > self.tol)[0]
+
+        if len(candidates) == 0:
+            return False
+        j = candidates[0]
+        k = int(np.searchsorted(self.rows, j))
+        self.Q, self.R = qr_insert(
+            self.Q, self.R, self.C[j, self.order], k, which="col"
+        )
+        self.rows.insert(k, j)
+        self.idr[j] = True
+        return j
+
+    def remove(self, i):
+        """Remove the parameter i from the active set, and return the row removed from idr (or False)"""
+        p = self.order.index(i)
+        self.order.pop(p)
+        a, r = len(self.order), len(self.rows)
+        if r == 0:
+            self.Q, self.R = np.eye(a), np.zeros((a, 0))
+            return False
+        self.Q, self.R = qr_delete(self.Q, self.R, p, 1, which="row")
+
+        # the first row of idr that became a combination of the previous ones
+        small = np.nonzero(abs(np.diag(self.R)) < self.tol)[0]
+        if len(small) > 0:
+            k = small[0]
+        elif r > a:
+            k = a
+        else:
+            return False
+        self.Q, self.R = qr_delete(self.Q, self.R, k, 1, which="col")
+        j = self.rows.pop(k)
+        self.idr[j] = False
+        return j
+
+
 # Upddate a list of constraints which are independant if we restrict the matrix C to the acrive set (C_A has to have independant rows)
 # When we ad an active parameter
 def next_idr1(liste, mat):
     # function to know which indice one should add
+    # (the path algorithm uses active_rows, which keeps this QR factorization up to date)
     if sum(liste) == len(mat):
         return False
     if sum(liste) == 0:
@@ -827,8 +1194,36 @@ def next_idr2(liste, mat):
 
 
 def h_lambdamax(matrices, rho, typ="R1", intercept=False):
-    param = parameters_for_update(matrices, 0.0, rho, typ, intercept=intercept)
-    return param.lambdamax
+    """
+    lambdamax = ||2 A^t h'(r)||inf where r is the residual at beta = 0,
+    without building the state of the path algorithm (parameters_for_update)
+    """
+    beta0, r, dr = initial_residual(matrices[2], rho, typ, intercept)
+    return LA.norm(2 * matrices[0].T.dot(dr * h_prime(rho, typ)(r)), np.inf)
+
+
+def initial_residual(y, rho, typ, intercept=False):
+    """
+    Find the intercept beta0 at beta = 0 (0 if not intercept), the residual r,
+    and the derivative dr of the residual with respect to the intercept
+    """
+    if typ == "C2" and rho > 1:
+        raise ValueError(
+            "For huberized hinge, rho has to be smaller than 1, but here it is :",
+            rho,
+        )
+    if typ in ["C1", "C2"]:
+        r_func = lambda b0, y: y * b0
+        dr = y
+    else:
+        r_func = lambda b0, y: b0 - y
+        dr = 1.0
+
+    if intercept:
+        beta0 = find_beta0(r_func, dr, y, rho, typ)
+    else:
+        beta0 = 0.0
+    return beta0, r_func(beta0, y), dr
 
 
 # Compute the derivative of the huber function, particulary useful for the computing of lambdamax
@@ -910,24 +1305,6 @@ sigma = || A*B(lambda*sigma) - y ||_2       (where B(lambda) is found thanks to
 
 
 """
-# Update the invers of a matrix whom we add a line, which is useul to compute the derivatives
-def next_inv(Xt, B, al, ligne):
-    n = len(Xt)
-    Yt = np.zeros((n + 1, n + 1))
-    alpha = 1 / al
-    B = np.array([B])
-    b1 = Xt[:ligne, :][:, :ligne] + alpha * B[:, :ligne].T.dot(B[:, :ligne])
-    b2 = Xt[ligne:, :][:, :ligne] + alpha * B[:, ligne:].T.dot(B[:, :ligne])
-    b4 = Xt[ligne:, :][:, ligne:] + alpha * B[:, ligne:].T.dot(B[:, ligne:])
-    col1 = np.concatenate((b1, -alpha * B[:, :ligne], b2), axis=0)
-    col2 = np.concatenate((b2.T, -alpha * B[:, ligne:], b4), axis=0)
-    col = np.concatenate(
-        (-alpha * B[0, :ligne], [alpha], -alpha * B[0, ligne:]), axis=0
-    )
-    return np.concatenate((col1, np.array([col]).T, col2), axis=1)
-
-
-
 def pathalgo_huber_cl(matrix, path, rho, n_active = False, intercept = False):
     return pathalgo_general(
         matrix, path, "C2", n_active=n_active, rho=rho, intercept=intercept
@@ -0,0 +1,165 @@
+import numpy as np
+import numpy.linalg as LA
+from scipy.optimize import linprog
+
+from .path_alg import h_prime
+from .solve_R4 import find_sigmax
+
+r"""
+Feature screening along a lambda-path.
+
+Let g be the gradient of the data-fitting term of the problem, at the current beta.
+The optimality conditions of every formulation, with the constraint C.b = 0, read :
+
+    g + C^t.v + lam' s = 0     with s in the subdifferential of ||b||1
+
+where v is the multiplier of the constraint, and lam' the lambda in the units of g.
+v and lam' are estimated by least squares on the active set,
+so that the correlations c = g + C^t.v can be compared to lam' for every formulation.
+
+Sequential strong rule : between two consecutive lambdas lam_prev > lam of the path,
+the features such that |c_j| < lam'/lam_prev * (2*lam - lam_prev) are discarded.
+
+Gap-safe rule (R1 only) : a dual feasible point theta is built from the residual of the
+previous solution, and the features such that |A_j.theta + C_j.v| + r ||A_j|| < lam'
+(where r = 2 sqrt(gap)) are discarded.
+
+Both rules may discard a feature wrongly (the strong rule is a heuristic,
+and the multiplier v is frozen in the gap-safe sphere), so the solution of the
+reduced problem is checked with the KKT conditions, and the violators are added back.
+"""
+
+
+def loss_residual(
+    matrices,
+    beta,
+    typ="R1",
+    rho=1.345,
+    rho_classification=-1.0,
+    intercept=False,
+):
+    """
+    Returns the vector u such that A^t.u is proportional to the gradient of the
+    data-fitting term at beta (beta[0] being the intercept if intercept).
+    For R3 and R4, sigma is fixed to its optimal value for beta, so the problem in beta
+    is a R1 or R2 problem with a rescaled lambda. For R4 the matrices and rho have to be
+    the ones of the rescaled problem if e is not the default value.
+    """
+    A, C, y = matrices
+    if intercept:
+        beta0, beta = beta[0], beta[1:]
+    else:
+        beta0 = 0.0
+    r = A.dot(beta) + beta0
+
+    if typ in ["C1", "C2"]:
+        return y * h_prime(rho_classification, typ)(y * r)
+    r = r - y
+    if typ == "R2":
+        return np.clip(r, -rho, rho)
+    if typ == "R4":
+        return np.clip(r / find_sigmax(r, rho, len(r)), -rho, rho)
+    return r
+
+
+def active_set(beta, tol=1e-4):
+    """
+    Mask of the active features of beta : the iterative solvers do not return exact zeros,
+    so the coefficients smaller than tol * ||beta||inf are considered null.
+    """
+    return abs(beta) > tol * LA.norm(beta, np.inf)
+
+
+def kkt_correlations(matrices, u, beta, intercept=False):
+    """
+    Compute the correlations c = A^t.u + C^t.v and the lambda lam' in the same units,
+    where (v, lam') is the least squares solution of the optimality conditions on the active set.
+    If beta is 0, then v minimizes ||c||inf, and lam' = ||A^t.u||inf,
+    which is the definition of lambdamax in this package.
+    """
+    A, C, y = matrices
+    if intercept:
+        beta = beta[1:]
+    g = A.T.dot(u)
+    active = np.nonzero(active_set(beta))[0]
+    if len(active) == 0:
+        return g + C.T.dot(minimax_multiplier(g, C)), LA.norm(g, np.inf)
+
+    system = np.concatenate([C[:, active].T, np.sign(beta[active])[:, None]], axis=1)
+    sol = LA.lstsq(system, -g[active], rcond=None)[0]
+    return g + C.T.dot(sol[:-1]), sol[-1]
+
+
+def minimax_multiplier(g, C):
+    """
+    Solve the linear program min_v ||g + C^t.v||inf, which gives the multiplier of the
+    constraint when beta = 0 (the constraint can keep beta at 0 below lambdamax).
+    """
+    k = len(C)
+    if not np.any(C):
+        return np.zeros(k)
+    ones = np.ones((len(g), 1))
+    out = linprog(
+        np.concatenate([np.zeros(k), [1.0]]),
+        A_ub=np.block([[C.T, -ones], [-C.T, -ones]]),
+        b_ub=np.concatenate([-g, g]),
+        bounds=[(None, None)] * (k + 1),
+        method="highs",
+    )
+    return out.x[:k]
+
+
+def strong_rule(c, lamb, lam, lam_prev, beta, intercept=False):
+    """
+    Sequential strong rule : returns the mask of the features kept to solve the problem at lam,
+    knowing the correlations c and the (rescaled) lambda lamb at the solution beta for lam_prev.
+    """
+    if intercept:
+        beta = beta[1:]
+    return (abs(c) >= lamb / lam_prev * (2 * lam - lam_prev)) | active_set(beta)
+
+
+def gap_safe_R1(matrices, beta, c, lamb):
+    """
+    Gap-safe sphere test for R1 : min ||Ab - y||^2 + lamb ||b||1 with C.b = 0,
+    where c = 2 A^t.(A.beta - y) + C^t.v are the correlations at beta (feasible).
+    The dual of the problem is max - ||theta||^2/4 - theta.y  s.t.  ||A^t.theta + C^t.v||inf <= lamb,
+    and the dual feasible point is a rescaling of theta = 2 (A.beta - y).
+    Returns the mask of the features that cannot be discarded.
+    """
+    A, C, y = matrices
+    theta = 2 * (A.dot(beta) - y)
+    norm_theta = np.vdot(theta, theta)
+    if norm_theta == 0.0:
+        return np.ones(len(c), dtype=bool)
+    alpha_max = lamb / max(LA.norm(c, np.inf), 1e-16)
+    alpha = np.clip(-2 * np.vdot(theta, y) / norm_theta, -alpha_max, alpha_max)
+
+    primal = norm_theta / 4 + lamb * LA.norm(beta, 1)
+    dual = -(alpha ** 2) * norm_theta / 4 - alpha * np.vdot(theta, y)
+    radius = 2 * np.sqrt(max(primal - dual, 0.0))
+    return abs(alpha * c) + radius * LA.norm(A, axis=0) >= lamb
+
+
+def kkt_violations(c, lamb, kept, tol=1e-3):
+    """
+    Returns the mask of the discarded features that violate the optimality conditions,
+    knowing the correlations c and the lambda lamb (in the same units) of the solution.
+    """
+    return (~kept) & (abs(c) > lamb * (1 + tol))
+
+
+def restrict_constraint(C, kept):
+    """
+    Constraint matrix of the reduced problem : the columns of C for the kept features,
+    without the null rows, and replaced by an orthonormal basis of its rows
+    if they are not linearly independent (so the projection on Ker(C) is well defined).
+    """
+    C = C[:, kept]
+    C = C[np.any(C != 0, axis=1)]
+    if len(C) == 0:
+        return np.zeros((1, C.shape[1]))
+    rank = LA.matrix_rank(C)
+    if rank < len(C):
+        C = LA.svd(C)[2][:rank]
+    return C
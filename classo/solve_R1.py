@@ -1,7 +1,18 @@
-from .path_alg import solve_path
+from .path_alg import solve_path, interpolate_path
 import numpy as np
 import numpy.linalg as LA
-from .misc_functions import unpenalized
+from .misc_functions import (
+    unpenalized,
+    ker_projector,
+    dr_resolvent,
+    anderson,
+    duality_gap,
+    solver_budget,
+    soft_thresholding,
+    workspace,
+    guided_state,
+)
+from .coordinate_descent import coordinate_descent
 
 r"""
 Problem    :   min ||Ab - y||^2 + lambda ||b||1 with C.b= 0
@@ -17,7 +28,7 @@ tol = 1e-5
 
 
 def Classo_R1(pb, lam):
-    pb_type = pb.type  # can be 'Path-Alg', 'P-PDS' , 'PF-PDS' or 'DR'
+    pb_type = pb.type  # can be 'Path-Alg', 'P-PDS' , 'PF-PDS', 'DR' or 'CD'
 
     if lam < 1e-5:
         return unpenalized(pb.matrix)
@@ -25,105 +36,171 @@ def Classo_R1(pb, lam):
     # ODE
     # here we compute the path algo until our lambda, and just take the last beta
     if pb_type == "Path-Alg":
-        BETA = solve_path(pb.matrix, lam, False, 0, "R1")[0]
+        BETA = solve_path(pb.matrix, lam, False, 0, "R1", AtA=pb.known_AtA())[0]
         return BETA[-1]
 
     regpath = pb.regpath
     if not regpath:
         pb.compute_param()  # this is a way to compute costful matrices computation like A^tA only once when we do pathcomputation with warm starts.
+
+    # coordinate descent, warm started from pb.init
+    if pb_type == "CD":
+        beta = pb.cd.solve(lam * pb.lambdamax, pb.init)
+        if regpath:
+            return beta, beta
+        return beta
+
     (m, d, k), (A, C, y) = pb.dim, pb.matrix
     lamb = lam * pb.lambdamax
     Anorm = pb.Anorm
     tol = pb.tol * LA.norm(y) / Anorm  # tolerance rescaled
 
-    Proj = proj_c(C, d)
+    Proj = pb.Proj  # Proj = I - C^t . (C . C^t )^-1 . C
     AtA = pb.AtA
     Aty = pb.Aty
     # Save some matrix products already computed in problem.compute_param()
     gamma, tau = pb.gam / (2 * pb.AtAnorm), pb.tauN
-    w, zerod = lamb * gamma * pb.weights, np.zeros(
-        d
-    )  # two vectors usefull to compute the prox of f(b) = sum(wi |bi|)
+    w = lamb * gamma * pb.weights  # weights of the prox of f(b) = sum(wi |bi|)
+    acc = anderson(pb.anderson) if pb.anderson else None
+    # the iterations update their state inplace, and their temporaries are work arrays
+    work = pb.work
+    u, p, g = work.get("u", d), work.get("p", d), work.get("g", d)
 
     if pb_type == "PF-PDS":  # y1 --> S ; p1 --> p . ; p2 --> y2
-        (x, v) = pb.init
-        for i in range(pb.N):
-
-            S = x - gamma * (AtA.dot(x) - Aty) * 2 - (C.T).dot(v)
-            p = prox(S, w, zerod)
+        x, v = work.state(pb.init)
+        S, eps = work.get("S", d), work.get("eps", d)
+        for i in range(pb.budget.max_iter):
+            if acc is not None:
+                z = (x.copy(), v.copy())
+            # S = x - 2 gamma (AtA.x - Aty) - C^t.v
+            np.dot(AtA, x, out=g)
+            g -= Aty
+            g *= 2 * gamma
+            np.dot(C.T, v, out=S)
+            S += g
+            np.subtract(x, S, out=S)
+            soft_thresholding(S, w, out=p)
 
             y2 = v + tau * C.dot(x)
-            v = v + tau * C.dot(p)
+            v += tau * C.dot(p)
 
-            eps = p - gamma * (AtA.dot(p) - Aty) * 2 - C.T.dot(y2) - S
-            x = x + eps
+            # eps = p - 2 gamma (AtA.p - Aty) - C^t.y2 - S
+            np.dot(AtA, p, out=g)
+            g -= Aty
+            g *= 2 * gamma
+            np.dot(C.T, y2, out=eps)
+            eps += g
+            eps += S
+            np.subtract(p, eps, out=eps)
+            x += eps
 
-            if i % 10 == 2 and LA.norm(eps) < tol:
-                if regpath:
-                    return (x, (x, v))
-                else:
-                    return x
+            if i % 10 == 2 and pb.stop(x, lamb, LA.norm(eps) < tol):
+                break
 
             if LA.norm(x) + LA.norm(p) + LA.norm(v) > 1e6:
                 raise ValueError("The algorithm of PF-PDS diverges")
+            if acc is not None:
+                x[:], v[:] = acc.step(z, (x, v))
+        else:
+            pb.budget.converged = False  # the iteration budget ran out
 
-        raise ValueError(
-            "The algorithm of PF-PDS did not converge after %i iterations " % pb.N
-        )
+        pb.budget.iterations += i + 1
+        if pb.gap_tol is not None or not pb.budget.converged:
+            x = Proj.dot(x)  # feasible point, whose duality gap is computed
+        if regpath:
+            return (x, (x, v))
+        return x
 
     if pb_type == "P-PDS":
-        xbar, x, v = pb.init
-        for i in range(pb.N):
-            grad = AtA.dot(x) - Aty
-            v = v + tau * C.dot(xbar)
-            s = x - 2 * gamma * grad - (C.T).dot(v)
-            p = prox(s, w, zerod)
-            nw_x = Proj.dot(p)
-
-            eps = nw_x - x
-            xbar = p + eps
-
-            if i % 10 == 2 and LA.norm(eps) < tol:
-                if regpath:
-                    return (x, (xbar, x, v))
-                else:
-                    return x
-            x = nw_x
+        xbar, x, v = work.state(pb.init)
+        eps = work.get("eps", d)
+        for i in range(pb.budget.max_iter):
+            if acc is not None:
+                z = (xbar.copy(), x.copy(), v.copy())
+            # s = x - 2 gamma (AtA.x - Aty) - C^t.v, in u
+            np.dot(AtA, x, out=g)
+            g -= Aty
+            g *= 2 * gamma
+            v += tau * C.dot(xbar)
+            np.dot(C.T, v, out=u)
+            u += g
+            np.subtract(x, u, out=u)
+            soft_thresholding(u, w, out=p)
+            # new x = Proj.p, in u
+            Proj.dot(p, out=u)
+
+            np.subtract(u, x, out=eps)
+            np.add(p, eps, out=xbar)
+
+            if i % 10 == 2 and pb.stop(x, lamb, LA.norm(eps) < tol):
+                break
+            x[:] = u
             if LA.norm(x) > 1e10:
                 raise ValueError("The algorithm of P-PDS diverges")
+            if acc is not None:
+                xbar[:], x[:], v[:] = acc.step(z, (xbar, x, v))
+        else:
+            pb.budget.converged = False  # the iteration budget ran out
 
-        raise ValueError(
-            "The algorithm of P-PDS did not converge after %i iterations " % pb.N
-        )
+        pb.budget.iterations += i + 1
+        if regpath:
+            return (x, (xbar, x, v))
+        return x
 
     else:  # "DR":
         gamma = gamma / (2 * lam)
         w = w / (2 * lam)
         mu, ls, c, root = pb.mu, [], pb.c, 0.0
-        Q1, Q2 = QQ(2 * gamma / (mu - 1), A, AtA=pb.AtA, AAt=pb.AAt)
-        QA, qy = Q1.dot(A), Q1.dot(y)
+        Q = pb.resolvent(2 * gamma / (mu - 1))
+        qy = Q.q1(y)
 
         qy_mult = qy * (mu - 1)
 
-        b, xbar, x = pb.init
-        for i in range(pb.N):
-            xbar = xbar + mu * (prox(2 * b - xbar, w, zerod) - b)
-            x = x + mu * (Proj.dot(2 * b - x) - b)
-
-            nv_b = (2 - mu) * b
-            nv_b = nv_b + qy_mult + Q2.dot(x + xbar - 2 * nv_b)
-            if i % 2 == 1 and LA.norm(b - nv_b) < tol:
-                if regpath:
-                    return (b, (b, xbar, x))
-                else:
-                    return b
-
-            b = nv_b
+        b, xbar, x = work.state(pb.init)
+        nv_b = np.empty(d)
+        every = 2 if pb.gap_tol is None else 10  # the duality gap is checked less often
+        for i in range(pb.budget.max_iter):
+            if acc is not None:
+                z = (b.copy(), xbar.copy(), x.copy())
+            # xbar = xbar + mu (prox(2b - xbar) - b)
+            np.multiply(b, 2, out=u)
+            u -= xbar
+            soft_thresholding(u, w, out=p)
+            p -= b
+            p *= mu
+            xbar += p
+            # x = x + mu (Proj.(2b - x) - b)
+            np.multiply(b, 2, out=u)
+            u -= x
+            Proj.dot(u, out=p)
+            p -= b
+            p *= mu
+            x += p
+
+            # nv_b = (2 - mu) b + qy_mult + Q2.(x + xbar - 2 (2 - mu) b)
+            np.multiply(b, 2 - mu, out=nv_b)
+            np.multiply(nv_b, -2, out=u)
+            u += x
+            u += xbar
+            nv_b += qy_mult
+            nv_b += Q.q2(u, out=p)
+            if i % every == 1 and pb.stop(
+                b, lamb, LA.norm(np.subtract(b, nv_b, out=u)) < tol
+            ):
+                break
+
+            b, nv_b = nv_b, b
+            if acc is not None:
+                b[:], xbar[:], x[:] = acc.step(z, (b, xbar, x))
+        else:
+            pb.budget.converged = False  # the iteration budget ran out
 
-        raise ValueError(
-            "The algorithm of Doulgas Rachford did not converge after %i iterations "
-            % pb.N
-        )
+        pb.budget.iterations += i + 1
+        if pb.gap_tol is not None or not pb.budget.converged:
+            b = Proj.dot(b)  # feasible point, whose duality gap is computed
+        if regpath:
+            return (b, (b, xbar, x))
+        return b
 
 
 """
@@ -135,23 +212,21 @@ and then to evaluate it in the given finite path.
 """
 
 
-def pathlasso_R1(pb, path, n_active=False):
+def pathlasso_R1(pb, path, n_active=False, sparse=False, guide=None, states=None):
     n, d, k = pb.dim
     BETA, tol = [], pb.tol
+    if pb.type == "Path-Alg" and sparse:
+        # the breaking points are returned as a sparse_path, which can be evaluated on path later
+        return solve_path(
+            pb.matrix, path[-1], n_active, 0, "R1", sparse=True, AtA=pb.known_AtA()
+        )
     if pb.type == "Path-Alg":
-        beta, sp_path = solve_path(pb.matrix, path[-1], n_active, 0, "R1")
-        # in the method ODE, we only compute the solution for breaking points. We can stop here if return_sp_path = True
-        # else, we do a little manipulation to interpolated the value of beta between those points, as we know beta is affine between those breaking points.
-        # if return_sp_path:
-        #     return beta, sp_path
-        sp_path.append(path[-1]), beta.append(beta[-1])
-        i = 0
-        for lam in path:
-            while lam < sp_path[i + 1]:
-                i += 1
-            teta = (sp_path[i] - lam) / (sp_path[i] - sp_path[i + 1])
-            BETA.append(beta[i] * (1 - teta) + beta[i + 1] * teta)
-        return BETA
+        beta, sp_path = solve_path(
+            pb.matrix, path[-1], n_active, 0, "R1", AtA=pb.known_AtA()
+        )
+        # in the method ODE, we only compute the solution for breaking points,
+        # then we interpolate the value of beta between those points, as we know beta is affine between those breaking points.
+        return interpolate_path(beta, sp_path, path)
 
     # Now we are in the case where we have to do warm starts.
     save_init = pb.init
@@ -161,11 +236,19 @@ def pathlasso_R1(pb, path, n_active=False):
         n_act = n_active
     else:
         n_act = d + 1
-    for lam in path:
+    # the states of the iterations after each lambda are appended to states, and if guide is given,
+    # the warm start of each lambda follows it (see misc_functions.guided_state)
+    if states is None:
+        states = []
+    states.append(pb.init)
+    for j, lam in enumerate(path):
+        if guide is not None and j + 1 < len(guide):
+            pb.init = guided_state(pb.init, guide[j], guide[j + 1])
         X = Classo_R1(pb, lam)
         beta, init = X[0], X[1]
         BETA.append(beta)
         pb.init = init
+        states.append(init)
         p = sum([(abs(beta[i]) > 1e-5) for i in range(len(beta))])
 
         if p >= n_act or type(init) == str:
@@ -184,8 +267,10 @@ Class of problem : we define a type, which will contain as attributes all the pa
 
 
 class problem_R1:
-    def __init__(self, data, algo):
-        self.N = 500000
+    def __init__(self, data, algo, products=None):
+        self.budget = solver_budget()  # iteration and time budgets, and diagnostics
+        # A^tA and A^ty if they are already computed (see misc_functions.gram_products)
+        self.products = products
 
         self.matrix, self.dim = data, (
             data[0].shape[0],
@@ -199,23 +284,32 @@ class problem_R1:
             self.init = np.zeros(d), np.zeros(d), np.zeros(k)
         elif algo == "PF-PDS":
             self.init = np.zeros(d), np.zeros(k)
+        elif algo == "CD":
+            self.init = np.zeros(d)
         else:
             self.init = np.zeros(d), np.zeros(d), np.zeros(d)
         self.tol = tol
+        self.anderson = 0  # memory of the Anderson acceleration of the iterations (0 : none)
+        self.gap_tol = None  # relative duality gap at which the iterations stop (None : step criterion)
+        self.gap = None  # last duality gap computed by stop
 
         self.weights = np.ones(d)
         self.regpath = False
         self.name = algo + " LS"
         self.type = algo  # type of algorithm used
         self.mu = 1.95
-        self.Aty = (self.matrix[0].T).dot(self.matrix[2])
+        if products is None:
+            self.Aty = (self.matrix[0].T).dot(self.matrix[2])
+        else:
+            self.Aty = products.Aty
         self.lambdamax = 2 * LA.norm(self.Aty, np.infty)
         self.gam = 1.0
         self.tau = 0.5  # equation for the convergence of 'PF-PDS' and LS algorithms : gam + tau < 1
         if algo == "DR":
             self.gam = self.dim[1]
         self.AtA = None
-        self.AAt = None
+        self.gram = None
+        self.work = workspace()  # work arrays of the iterations
 
     # this is a method of the class pb that is used to computed the expensive multiplications only once. (espacially usefull for warm start. )
 
@@ -223,48 +317,63 @@ class problem_R1:
         (A, C, y) = self.matrix
         m, d, k = self.dim
 
-        self.Anorm = LA.norm(A, "fro")
-
-        self.AtA = (A.T).dot(A)
+        # the coordinate descent only needs the norms of the columns, computed by the solver itself
+        if self.type == "CD":
+            self.cd = coordinate_descent(
+                self.matrix,
+                "R1",
+                weights=self.weights,
+                tol=self.tol,
+                N=self.budget.max_iter,
+                gap_tol=self.gap_tol,
+                budget=self.budget,
+            )
+            return
+
+        # DR only needs the smaller of A^tA and AA^t, for its resolvent (see dr_resolvent)
+        if self.type == "DR" and m <= d:
+            self.AtA = None
+            self.gram = A.dot(A.T)
+        else:
+            AtA = (A.T).dot(A) if self.products is None else self.products.AtA
+            self.AtA = None if self.type == "DR" else AtA
+            self.gram = AtA
+        self.Anorm = np.sqrt(np.trace(self.gram))
         self.c = d ** 2 / np.trace(
-            self.AtA
+            self.gram
         )  # parameter for Concomitant problem : the matrix is scaled as c*A^2
         self.Cnorm = LA.norm(C, 2) ** 2 + 1e-5
         self.tauN = self.tau / self.Cnorm
-        self.AtAnorm = LA.norm(self.AtA, 2)
-
-        if self.type == "DR":
-            self.AAt = A.dot(A.T)
-
-
-"""
-Functions used in the algorithms, modules needed :
-import numpy as np
-import numpy.linalg as LA
-from .../class_of_problem import problem
-"""
-
-
-# compute the prox of the function : f(b)= sum (wi * |bi| )
-def prox(b, w, zeros):
-    return np.minimum(b + w, zeros) + np.maximum(b - w, zeros)
-
-
-# Compute I - C^t (C.C^t)^-1 . C : the projection on Ker(C)
-def proj_c(M, d):
-    k = len(M)
-    return np.eye(d) - LA.multi_dot(
-        [M.T, np.linalg.inv(M.dot(M.T) + 1e-4 * np.eye(k)), M]
-    )
-
-
-def QQ(coef, A, AtA=None, AAt=None):
-    if AtA is None:
-        AtA = (A.T).dot(A)
-    if AAt is None:
-        AAt = A.dot(A.T)
+        self.AtAnorm = LA.norm(self.gram, 2)
+        self.Proj = ker_projector(C)
+
+    # A^tA given to the problem, for the path algorithm (None if it has to compute it)
+    def known_AtA(self):
+        return None if self.products is None else self.products.AtA
+
+    # linear operators of the DR iterations (see dr_resolvent), computed after compute_param.
+    def resolvent(self, coef):
+        return dr_resolvent(coef, self.matrix[0], gram=self.gram)
+
+    # stopping test of the iterations at b : the step criterion step if gap_tol is None,
+    # and else the duality gap at the projection of b on Ker(C) (see misc_functions.duality_gap),
+    # or the end of the time budget.
+    def stop(self, b, lamb, step):
+        if self.gap_tol is not None:
+            b = self.Proj.dot(b)
+            self.gap = duality_gap(self.matrix, b, lamb, "R1", weights=self.weights)
+            step = self.gap < self.gap_tol
+        return step or self.budget.out_of_time()
+
+    # initial state of the iterations from a previous solution beta (warm start)
+    def warm_start(self, beta):
+        k = self.dim[2]
+        if self.type == "P-PDS":
+            self.init = beta, beta, np.zeros(k)
+        elif self.type == "PF-PDS":
+            self.init = beta, np.zeros(k)
+        elif self.type == "CD":
+            self.init = beta
+        else:
+            self.init = beta, beta, beta
 
-    return (
-        coef * (A.T).dot(LA.inv(2 * np.eye(A.shape[0]) + coef * AAt)),
-        LA.inv(2 * np.eye(A.shape[1]) + coef * AtA),
-    )
@@ -2,6 +2,19 @@ from .path_alg import solve_path, pathalgo_general
 import numpy as np
 import numpy.linalg as LA
 from .solve_R1 import problem_R1, Classo_R1
+from .misc_functions import (
+    ker_projector,
+    mean_shift_matrix,
+    mean_shift_resolvent,
+    unpenalized,
+    anderson,
+    duality_gap,
+    solver_budget,
+    soft_thresholding,
+    workspace,
+    guided_state,
+)
+from .coordinate_descent import coordinate_descent
 
 r"""
 Problem    :   min h_rho(Ab - y) + lambda ||b||1 with C.b = 0 <=>   min ||Ab - y - r*o||^2 + lambda ||b,o||1 with C.b = 0, o in R^m
@@ -20,15 +33,14 @@ tol = 1e-5
 
 def Classo_R2(pb, lam, compute=True):
 
-    pb_type = pb.type  # can be 'Path-Alg', 'P-PDS' , 'PF-PDS' or 'DR'
+    pb_type = pb.type  # can be 'Path-Alg', 'P-PDS' , 'PF-PDS', 'DR' or 'CD'
 
     (m, d, k), (A, C, y) = pb.dim, pb.matrix
     lamb, rho = lam * pb.lambdamax, pb.rho
 
     if lam < 1e-5:
-        pb_type = "DR"
-        compute = "True"
-        # here we simply refer to Classo_R1 that is called line 42.
+        # the mean-shift r*o vanishes with lambda, so this is the unpenalized least squares problem
+        return unpenalized(pb.matrix)
 
     # Path-Alg
     # here we compute the path algo until our lambda, and just take the last beta
@@ -47,8 +59,17 @@ def Classo_R2(pb, lam, compute=True):
 
         return beta
 
-    # DR :
+    # coordinate descent, warm started from pb.init
     regpath = pb.regpath
+    if pb_type == "CD":
+        if compute:
+            pb.compute_param()
+        beta = pb.cd.solve(lamb, pb.init)
+        if regpath:
+            return beta, beta
+        return beta
+
+    # DR :
     r = lamb / (2 * rho)
     if pb_type == "DR":
         if compute:
@@ -56,7 +77,7 @@ def Classo_R2(pb, lam, compute=True):
             x = Classo_R1(pb.prob_R1, lamb / pb.prob_R1.lambdamax)
             beta = x[:-m]
             if pb.intercept:
-                betaO = pb.prob_R1.ybar - np.vdot(pb.prob_R1.Abar, x)
+                betaO = pb.prob_R1.intercept(x)
                 beta = np.array([betaO] + list(beta))
             return beta
         else:
@@ -66,7 +87,7 @@ def Classo_R2(pb, lam, compute=True):
             x, warm_start = Classo_R1(pb.prob_R1, lamb / pb.prob_R1.lambdamax)
             beta = x[:-m]
             if pb.intercept:
-                betaO = pb.prob_R1.ybar - np.vdot(pb.prob_R1.Abar, x)
+                betaO = pb.prob_R1.intercept(x)
                 beta = np.array([betaO] + list(beta))
             return (beta, warm_start)
 
@@ -74,81 +95,127 @@ def Classo_R2(pb, lam, compute=True):
 
     if compute:
         pb.compute_param()
-    tau, Proj, AtA, Aty = pb.tauN, proj_c(C, d), pb.AtA, pb.Aty
+    tau, Proj, AtA, Aty = pb.tauN, pb.Proj, pb.AtA, pb.Aty
     gamma = pb.gam / (2 * (pb.AtAnorm + r ** 2))
     t = lamb * gamma
-    w, tm, zerom, zerod = (
-        t * pb.weights,
-        t * np.ones(m),
-        np.zeros(m),
-        np.zeros(d),
-    )
-    o, xbar, x, v = pb.init
-    # vectors usefull to compute the prox of f(b)= sum(wi |bi|)
+    w = t * pb.weights  # weights of the prox of f(b)= sum(wi |bi|), and t for o
+    acc = anderson(pb.anderson) if pb.anderson else None
+    # the iterations update their state inplace, and their temporaries are work arrays
+    work = pb.work
+    o, xbar, x, v = work.state(pb.init)
+    S, p, g, eps = [work.get(name, d) for name in ["S", "p", "g", "eps"]]
+    S2, p2, Ax, eps2 = [work.get(name, m) for name in ["S2", "p2", "Ax", "eps2"]]
 
     # FORWARD BACKWARD
     if pb_type == "P-PDS":
 
-        for i in range(pb.N):
-            grad = AtA.dot(x) - Aty
-            v = v + tau * C.dot(xbar)
-            S = x - 2 * gamma * grad - 2 * gamma * r * (A.T).dot(o) - (C.T).dot(v)
-            o = prox(
-                o * (1 - 2 * gamma * r ** 2) + 2 * gamma * r * (y - A.dot(x)),
-                tm,
-                zerom,
-            )
-            p = prox(S, w, zerod)
-            nw_x = Proj.dot(p)
-            eps = nw_x - x
-            xbar = p + eps
-
-            if i % 10 == 2 and LA.norm(eps) < tol:  # 0.6
-                if regpath:
-                    return (x, (o, xbar, x, v))
-                else:
-                    return x
-            x = nw_x
+        for i in range(pb.budget.max_iter):
+            if acc is not None:
+                z = (o.copy(), xbar.copy(), x.copy(), v.copy())
+            # S = x - 2 gamma (AtA.x - Aty + r A^t.o) - C^t.v
+            np.dot(AtA, x, out=g)
+            g -= Aty
+            np.dot(A.T, o, out=S)
+            S *= r
+            S += g
+            S *= 2 * gamma
+            v += tau * C.dot(xbar)
+            np.dot(C.T, v, out=p)
+            S += p
+            np.subtract(x, S, out=S)
+            # o = prox(o (1 - 2 gamma r^2) + 2 gamma r (y - A.x))
+            np.dot(A, x, out=Ax)
+            np.subtract(y, Ax, out=S2)
+            S2 *= 2 * gamma * r
+            o *= 1 - 2 * gamma * r ** 2
+            S2 += o
+            o[:] = soft_thresholding(S2, t, out=p2)
+            soft_thresholding(S, w, out=p)
+            # new x = Proj.p, in S
+            Proj.dot(p, out=S)
+            np.subtract(S, x, out=eps)
+            np.add(p, eps, out=xbar)
+
+            if i % 10 == 2 and pb.stop(x, lamb, LA.norm(eps) < tol):  # 0.6
+                break
+            x[:] = S
             if LA.norm(x) > 1e10:
                 raise ValueError("The algorithm of P-PDS diverges")
+            if acc is not None:
+                o[:], xbar[:], x[:], v[:] = acc.step(z, (o, xbar, x, v))
+        else:
+            pb.budget.converged = False  # the iteration budget ran out
 
-        raise ValueError(
-            "The algorithm of P-PDS did not converge after %i iterations " % pb.N
-        )
+        pb.budget.iterations += i + 1
+        if regpath:
+            return (x, (o, xbar, x, v))
+        return x
 
     else:  # "PF-PDS"
-        for i in range(pb.N):
-            grad = AtA.dot(x) - Aty
-
-            S1 = x - 2 * gamma * grad - 2 * gamma * r * (A.T).dot(o) - (C.T).dot(v)
-            S2 = o * (1 - 2 * gamma * r ** 2) + 2 * gamma * r * (y - A.dot(x))
-
-            p1 = prox(S1, w, zerod)
-            p2 = prox(S2, tm, zerom)
-
-            v = v + tau * C.dot(p1)
+        Ato = work.get("Ato", d)
+        for i in range(pb.budget.max_iter):
+            if acc is not None:
+                z = (o.copy(), x.copy(), v.copy())
+            # S1 = x - 2 gamma (AtA.x - Aty + r A^t.o) - C^t.v
+            np.dot(AtA, x, out=g)
+            g -= Aty
+            np.dot(A.T, o, out=Ato)
+            Ato *= r
+            np.add(g, Ato, out=S)
+            S *= 2 * gamma
+            np.dot(C.T, v, out=eps)
+            S += eps
+            np.subtract(x, S, out=S)
+            # S2 = o (1 - 2 gamma r^2) + 2 gamma r (y - A.x)
+            np.dot(A, x, out=Ax)
+            np.subtract(y, Ax, out=S2)
+            S2 *= 2 * gamma * r
+            np.multiply(o, 1 - 2 * gamma * r ** 2, out=eps2)
+            S2 += eps2
+
+            soft_thresholding(S, w, out=p)
+            soft_thresholding(S2, t, out=p2)
+
+            v += tau * C.dot(p)
             v2 = v + tau * C.dot(x)
 
-            eps1 = (
-                p1 + 2 * gamma * (Aty - AtA.dot(p1) - r * A.T.dot(o)) - C.T.dot(v2) - S1
-            )
-            eps2 = p2 + 2 * r * gamma * (y - r * p2 - A.dot(x)) - S2
-
-            x = x + eps1
-            o = o + eps2
-
-            if i % 10 == 2 and LA.norm(eps1) + LA.norm(eps2) < tol:
-                if regpath:
-                    return (x, (o, xbar, x, v))
-                else:
-                    return x
+            # eps1 = p1 - 2 gamma (AtA.p1 - Aty + r A^t.o) - C^t.v2 - S1
+            np.dot(AtA, p, out=g)
+            g -= Aty
+            g += Ato
+            g *= 2 * gamma
+            np.dot(C.T, v2, out=eps)
+            eps += g
+            eps += S
+            np.subtract(p, eps, out=eps)
+            # eps2 = p2 + 2 r gamma (y - r p2 - A.x) - S2
+            np.multiply(p2, r, out=eps2)
+            eps2 += Ax
+            np.subtract(y, eps2, out=eps2)
+            eps2 *= 2 * r * gamma
+            eps2 += p2
+            eps2 -= S2
+
+            x += eps
+            o += eps2
+
+            step = LA.norm(eps) + LA.norm(eps2) < tol
+            if i % 10 == 2 and pb.stop(x, lamb, step):
+                break
 
             if LA.norm(x) + LA.norm(o) + LA.norm(v) > 1e6:
                 raise ValueError("The algorithm of PF-PDS diverges")
+            if acc is not None:
+                o[:], x[:], v[:] = acc.step(z, (o, x, v))
+        else:
+            pb.budget.converged = False  # the iteration budget ran out
 
-        raise ValueError(
-            "The algorithm of PF-PDS did not converge after %i iterations " % pb.N
-        )
+        pb.budget.iterations += i + 1
+        if pb.gap_tol is not None or not pb.budget.converged:
+            x = Proj.dot(x)  # feasible point, whose duality gap is computed
+        if regpath:
+            return (x, (o, xbar, x, v))
+        return x
 
 
 """
@@ -159,7 +226,7 @@ and then to evaluate it in the given finite path.
 """
 
 
-def pathlasso_R2(pb, path, n_active=False):
+def pathlasso_R2(pb, path, n_active=False, sparse=False, guide=None, states=None):
     n, d, k = pb.dim
     BETA, tol = [], pb.tol
     if pb.type == "Path-Alg":
@@ -168,21 +235,33 @@ def pathlasso_R2(pb, path, n_active=False):
             AA, CC = A[:, 1:], C[:, 1:]
         else:
             AA, CC = A[:, :], C[:, :]
-        return pathalgo_general((AA, CC, y), path, "R2", n_active, pb.rho, pb.intercept)
+        return pathalgo_general(
+            (AA, CC, y), path, "R2", n_active, pb.rho, pb.intercept, sparse=sparse
+        )
 
     # Now we are in the case where we have to do warm starts.
     save_init = pb.init
     pb.regpath = True
-    pb.compute_param()
-    pb.init_R1()
+    if pb.type == "DR":
+        pb.init_R1()
+    else:
+        pb.compute_param()
     if type(n_active) == int and n_active > 0:
         n_act = n_active
     else:
         n_act = d + 1
-    for lam in path:
+    # the states of the iterations after each lambda are appended to states, and if guide is given,
+    # the warm start of each lambda follows it (see misc_functions.guided_state)
+    if states is None:
+        states = []
+    states.append(pb.init)
+    for j, lam in enumerate(path):
+        if guide is not None and j + 1 < len(guide):
+            pb.init = guided_state(pb.init, guide[j], guide[j + 1])
         X = Classo_R2(pb, lam, compute=False)
         BETA.append(X[0])
         pb.init = X[1]
+        states.append(X[1])
         if (
             sum([(abs(X[0][i]) > 1e-5) for i in range(len(X[0]))]) >= n_act
             or type(X[1]) == str
@@ -205,7 +284,7 @@ Class of problem : we define a type, which will contain as keys, all the paramet
 
 class problem_R2:
     def __init__(self, data, algo, rho, intercept=False):
-        self.N = 500000
+        self.budget = solver_budget()  # iteration and time budgets, and diagnostics
 
         (AA, CC, y) = data
         A = AA[:, :]
@@ -226,14 +305,21 @@ class problem_R2:
         )
         self.matrix = (A, C, y)
         (m, d, k) = self.dim
-        self.init = np.zeros(m), np.zeros(d), np.zeros(d), np.zeros(k)
+        if algo == "CD":
+            self.init = np.zeros(d)
+        else:
+            self.init = np.zeros(m), np.zeros(d), np.zeros(d), np.zeros(k)
         self.tol = tol
+        self.anderson = 0  # memory of the Anderson acceleration of the iterations (0 : none)
+        self.gap_tol = None  # relative duality gap at which the iterations stop (None : step criterion)
+        self.gap = None  # last duality gap computed by stop
         self.regpath = False
         self.name = algo + " Huber"
         self.type = algo  # type of algo used
         self.rho = rho
         self.gam = 1.0
         self.tau = 0.5  # equation for the convergence of Noproj and LS algorithms : gam + tau < 1
+        self.work = workspace()  # work arrays of the iterations
         if not intercept:
             yy = y
         self.lambdamax = 2 * LA.norm(AA.T.dot(h_prime(yy, rho)), np.infty)
@@ -245,6 +331,20 @@ class problem_R2:
     def compute_param(self):
         (A, C, y) = self.matrix
         m, d, k = self.dim
+        # the coordinate descent only needs the norms of the columns, computed by the solver itself
+        if self.type == "CD":
+            self.cd = coordinate_descent(
+                self.matrix,
+                "R2",
+                rho=self.rho,
+                weights=self.weights,
+                tol=self.tol,
+                N=self.budget.max_iter,
+                gap_tol=self.gap_tol,
+                budget=self.budget,
+            )
+            return
+
         self.c = (
             d / LA.norm(A, 2)
         ) ** 2  # parameter for Concomitant problem : the matrix is scaled as c*A^2
@@ -254,65 +354,116 @@ class problem_R2:
         self.Cnorm = LA.norm(C, 2) ** 2 + 1e-5
         self.tauN = self.tau / self.Cnorm
         self.AtAnorm = LA.norm(self.AtA, 2)
+        self.Proj = ker_projector(C)
+
+    # stopping test of the iterations at b : the step criterion step if gap_tol is None,
+    # and else the duality gap at the projection of b on Ker(C) (see misc_functions.duality_gap),
+    # or the end of the time budget.
+    def stop(self, b, lamb, step):
+        if self.gap_tol is not None:
+            (A, C, y), b = self.matrix, self.Proj.dot(b)
+            if self.intercept:
+                A, C = A[:, 1:], C[:, 1:]
+            self.gap = duality_gap(
+                (A, C, y), b, lamb, "R2", self.rho, intercept=self.intercept
+            )
+            step = self.gap < self.gap_tol
+        return step or self.budget.out_of_time()
+
+    # initial state of the iterations from a previous solution beta (warm start)
+    def warm_start(self, beta):
+        m, d, k = self.dim
+        if self.type == "CD":
+            self.init = beta
+        elif self.type == "DR":
+            # state of the iterations of prob_R1, whose variables are (b, o), without intercept
+            if self.intercept:
+                beta = beta[1:]
+            x = np.concatenate([beta, np.zeros(m)])
+            self.init = x, x, x
+        else:
+            self.init = np.zeros(m), beta, beta, np.zeros(k)
 
     def init_R1(self, r=0.0):
         (AA, CC, y) = self.matrix
         A, C = AA[:, :], CC[:, :]
-        (m, d, k) = self.dim
         if self.intercept:
             A, C = A[:, 1:], C[:, 1:]
 
-        Ahuber = np.append(A, r * np.eye(m), 1)
-        Chuber = np.append(C, np.zeros((k, m)), 1)
         yhuber = y
         if self.intercept:
-            Abar = np.mean(Ahuber, axis=0)
+            Abar = np.mean(A, axis=0)
             ybar = np.mean(y)
-            Ahuber = Ahuber - Abar
+            A = A - Abar
             yhuber = yhuber - ybar
-        matrices_huber = (Ahuber, Chuber, yhuber)
-        prob = problem_R1(matrices_huber, self.type)
+        prob = problem_huber_R1((A, C, yhuber), self.type, r=r, centered=self.intercept)
         prob.regpath = self.regpath
+        prob.anderson = self.anderson
+        prob.gap_tol = self.gap_tol
+        prob.budget = self.budget
         prob.compute_param()
         if self.intercept:
             prob.Abar = Abar
             prob.ybar = ybar
-            self.AAt = (A - np.mean(A, axis=0)).dot((A - np.mean(A, axis=0)).T)
-        else:
-            self.AAt = A.dot(A.T)
         self.prob_R1 = prob
 
     def add_r(self, r):
-        prob = self.prob_R1
-        A_r1 = prob.matrix[0]
-        m = A_r1.shape[0]
-        d = A_r1.shape[1] - m
-        prob.AtA[d:, :d] = prob.matrix[0][:, :d] * r
-        prob.AtA[:d, d:] = prob.AtA[d:, :d].T
-        prob.Aty = np.append(prob.Aty[:d], prob.matrix[2] * r)
-        prob.lambdamax = 2 * LA.norm(prob.Aty, np.infty)
-        extension = np.eye(m)
-        if self.intercept:
-            # self.init_R1(r=r)
-            extension = extension - np.mean(extension, axis=0)
-        extension = r * extension
-        A_r1[:, d:] = extension
-        right_bottom = extension.dot(extension)
-        prob.AtA[d:, d:] = right_bottom
-        prob.AAt = self.AAt + right_bottom
-        prob.AtAnorm = LA.norm(prob.AtA, 2)
-
-
-# compute the prox of the function : f(b) = sum (wi * |bi| )
-def prox(b, w, zeros):
-    return np.minimum(b + w, zeros) + np.maximum(b - w, zeros)
-
-
-# Compute I - C^t (C.C^t)^-1 . C : the projection on Ker(C)
-def proj_c(M, d):
-    if LA.matrix_rank(M) == 0:
-        return np.eye(d)
-    return np.eye(d) - LA.multi_dot([M.T, np.linalg.inv(M.dot(M.T)), M])
+        self.prob_R1.add_r(r)
+
+
+class problem_huber_R1(problem_R1):
+    """R1 problem of the mean-shift formulation of problem_R2 (with the DR algorithm) :
+        min ||Ab + r E o - y||^2 + lambda ||b,o||1 with C.b = 0
+    where E = I, or E = I - 11^t/n if centered. The matrix [A, r E] is a mean_shift_matrix,
+    so nothing of size n*n or (d+n)^2 is formed apart from the smaller of AA^t and A^tA,
+    and r can be changed along a path with add_r.
+
+    Attributes (on top of the ones of problem_R1) :
+        gram        : AA^t if n <= d, else A^tA, which does not depend on r
+        Anorm2_A    : ||A||_2 ^2
+        Afro2_A     : ||A||_F ^2
+        Abar, ybar  : means of the columns of A and of y before centering, if centered
+    """
+
+    def __init__(self, data, algo, r=0.0, centered=False):
+        (A, C, y) = data
+        (m, d), k = A.shape, len(C)
+        matrices = (
+            mean_shift_matrix(A, r, centered=centered),
+            np.append(C, np.zeros((k, m)), 1),
+            y,
+        )
+        super().__init__(matrices, algo)
+        self.gram = A.dot(A.T) if m <= d else (A.T).dot(A)
+        self.Anorm2_A = LA.norm(self.gram, 2)
+        self.Afro2_A = np.trace(self.gram)
+        self.Proj = ker_projector(matrices[1])
+
+    def compute_param(self):
+        (M, C, y) = self.matrix
+        m, d, k = self.dim
+        # norms of [A, r E] from the ones of A, as E is an orthogonal projection (of rank m-1 if centered)
+        rank_E = m - 1 if M.centered else m
+        self.Anorm = np.sqrt(self.Afro2_A + M.r ** 2 * rank_E)
+        self.c = d ** 2 / self.Anorm ** 2
+        self.Cnorm = LA.norm(C, 2) ** 2 + 1e-5
+        self.tauN = self.tau / self.Cnorm
+        self.AtAnorm = self.Anorm2_A + M.r ** 2
+
+    def add_r(self, r):
+        M = self.matrix[0]
+        M.r = r
+        self.Aty = (M.T).dot(self.matrix[2])
+        self.lambdamax = 2 * LA.norm(self.Aty, np.infty)
+        self.compute_param()
+
+    def resolvent(self, coef):
+        return mean_shift_resolvent(coef, self.matrix[0], gram=self.gram)
+
+    def intercept(self, x):
+        # intercept of the problem before centering, with x = (b, o)
+        m = self.dim[0]
+        return self.ybar - np.vdot(self.Abar, x[:-m]) - self.matrix[0].r * np.mean(x[-m:])
 
 
 # Compute the derivative of the huber function, particulary useful for the computing of lambdamax
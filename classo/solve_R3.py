@@ -1,7 +1,17 @@
 from .path_alg import solve_path_Conc
 import numpy as np
 import numpy.linalg as LA
-from .misc_functions import unpenalized
+from .misc_functions import (
+    unpenalized,
+    ker_projector,
+    dr_resolvent,
+    anderson,
+    duality_gap,
+    solver_budget,
+    soft_thresholding,
+    workspace,
+    guided_state,
+)
 
 r"""
 Problem    :   min ||Ab - y||^2/sigma + n/2 sigma + lambda ||b||1 with C.b= 0 and sigma > 0
@@ -36,7 +46,7 @@ def Classo_R3(pb, lam):
     # Then we only have to finc the solution between the last beta computed and the one before.
     if pb_type == "Path-Alg":
         (beta1, beta2), (s1, s2), (r1, r2) = solve_path_Conc(
-            (A, C, y), lam, lassopath=False
+            (A, C, y), lam, lassopath=False, AtA=pb.known_AtA()
         )
         dr, ds = r1 - r2, s1 - s2
         teta = root_2(
@@ -56,52 +66,82 @@ def Classo_R3(pb, lam):
         lamb = lam * pb.lambdamax
         Anorm = pb.Anorm
         tol = pb.tol * LA.norm(y) / Anorm  # tolerance rescaled
-        Proj = proj_c(C, d)  # Proj = I - C^t . (C . C^t )^-1 . C
-        QA = pb.QA
-        Q1 = pb.Q1
-        Q2 = pb.Q2
+        Proj = pb.Proj  # Proj = I - C^t . (C . C^t )^-1 . C
+        Q = pb.resolvent
         # Save some matrix products already computed in problem.compute_param()
         gamma = pb.gam / (pb.Anorm2 * lam)  # Normalize gamma
-        w = lamb * gamma * pb.weights
-
-        zerod = np.zeros(d)
-        # two vectors usefull to compute the prox of f(b)= sum(wi |bi|)
+        w = lamb * gamma * pb.weights  # weights of the prox of f(b)= sum(wi |bi|)
         mu, c, root = pb.mu, pb.c, 0.0
-        xs, nu, o, xbar, x = pb.init
-
-        b, s = 0.0, 0.0  # just for flake8 purpose.
-        for i in range(pb.N):
-            nv_b = x + Q1.dot(o) - QA.dot(x) - Q2.dot(x - xbar)
+        xs, nu, o, xbar, x = pb.work.state(pb.init)
+        # the iterations update their state inplace, and their temporaries are work arrays
+        u, p, v = [pb.work.get(name, d) for name in ["u", "p", "v"]]
+        Ab, um = pb.work.get("Ab", m), pb.work.get("um", m)
+
+        acc = anderson(pb.anderson) if pb.anderson else None
+
+        b, nv_b, s = np.zeros(d), np.empty(d), 0.0
+        for i in range(pb.budget.max_iter):
+            if acc is not None:
+                z = (xs, nu, o.copy(), xbar.copy(), x.copy())
+            # x + Q1.o - QA.x - Q2.(x - xbar) , with Q2 = (I - QA)/2
+            np.add(x, xbar, out=v)
+            v *= 0.5
+            np.dot(A, v, out=um)
+            np.subtract(o, um, out=um)
+            np.add(v, Q.q1(um, out=nv_b), out=nv_b)
             nv_s = (xs + nu) / 2
-            if i % 10 == 2 and LA.norm(b - nv_b) + LA.norm(s - nv_s) / Anorm < 2 * tol:
-                s = s / np.sqrt(m)
-                if regpath:
-                    return (b, (xs, nu, o, xbar, x), s)
-                else:
-                    return (b, s)
-
-            s, b = nv_s, nv_b
-            Ab = A.dot(b)
-            p1, p2, root = prox_phi_1(xs, 2 * Ab - o - y, np.sqrt(m) * gamma / c, root)
-            sup1 = max(0, nu) - s
-            sup2 = p1 - s
-            sup3 = p2 + y - Ab
-            sup4 = prox(2 * b - xbar, w, zerod) - b
-            sup5 = Proj.dot(2 * b - x) - b
-
-            xs = xs + mu * sup1
-            nu = nu + mu * sup2
-            o = o + mu * sup3
-            xbar = xbar + mu * sup4
-            x = x + mu * sup5
-
-            if LA.norm(b) + LA.norm(s) > 1e6:
+            if i % 10 == 2:
+                step = LA.norm(np.subtract(b, nv_b, out=u))
+                step = step + abs(s - nv_s) / Anorm < 2 * tol
+                if pb.stop(b, lamb, step):
+                    break
+
+            s, (b, nv_b) = nv_s, (nv_b, b)
+            np.dot(A, b, out=Ab)
+            np.multiply(Ab, 2, out=um)
+            um -= o
+            um -= y
+            p1, p2, root = prox_phi_1(xs, um, np.sqrt(m) * gamma / c, root)
+
+            xs = xs + mu * (max(0, nu) - s)
+            nu = nu + mu * (p1 - s)
+            # o = o + mu (p2 + y - Ab)
+            np.add(y, p2, out=um)
+            um -= Ab
+            um *= mu
+            o += um
+            # xbar = xbar + mu (prox(2b - xbar) - b)
+            np.multiply(b, 2, out=u)
+            u -= xbar
+            soft_thresholding(u, w, out=p)
+            p -= b
+            p *= mu
+            xbar += p
+            # x = x + mu (Proj.(2b - x) - b)
+            np.multiply(b, 2, out=u)
+            u -= x
+            Proj.dot(u, out=p)
+            p -= b
+            p *= mu
+            x += p
+
+            if LA.norm(b) + abs(s) > 1e6:
                 raise ValueError("The algorithm of Doulgas Rachford diverges")
+            if acc is not None:
+                # no extrapolation before the stopping test, which compares consecutive iterates
+                xs, nu, o[:], xbar[:], x[:] = acc.step(
+                    z, (xs, nu, o, xbar, x), extrapolate=i % 10 != 1
+                )
+        else:
+            pb.budget.converged = False  # the iteration budget ran out
 
-        raise ValueError(
-            "The algorithm of Doulgas Rachford did not converge after %i iterations "
-            % pb.N
-        )
+        pb.budget.iterations += i + 1
+        if pb.gap_tol is not None or not pb.budget.converged:
+            b = Proj.dot(b)  # feasible point, whose duality gap is computed
+        s = s / np.sqrt(m)
+        if regpath:
+            return (b, (xs, nu, o, xbar, x), s)
+        return (b, s)
 
 
 """
@@ -112,14 +152,16 @@ and then to evaluate it in the given finite path.
 """
 
 
-def pathlasso_R3(pb, path, n_active=False):
+def pathlasso_R3(pb, path, n_active=False, guide=None, states=None):
     n, d, k = pb.dim
     BETA, SIGMA, tol = [], [], pb.tol
 
     if pb.type == "Path-Alg":
         y = pb.matrix[2]
         sigmax = LA.norm(y)
-        X, LAM, R = solve_path_Conc(pb.matrix, path[-1], n_active=n_active)
+        X, LAM, R = solve_path_Conc(
+            pb.matrix, path[-1], n_active=n_active, AtA=pb.known_AtA()
+        )
         LAM.append(path[-1]), X.append(X[-1]), R.append(R[-1])
         beta2, l2, r2, j = X[0], path[0] + 0.1, -y / LA.norm(y), 0
         for lam in path:
@@ -154,11 +196,19 @@ def pathlasso_R3(pb, path, n_active=False):
     else:
         n_act = d + 1
 
-    for lam in path:
+    # the states of the iterations after each lambda are appended to states, and if guide is given,
+    # the warm start of each lambda follows it (see misc_functions.guided_state)
+    if states is None:
+        states = []
+    states.append(pb.init)
+    for j, lam in enumerate(path):
+        if guide is not None and j + 1 < len(guide):
+            pb.init = guided_state(pb.init, guide[j], guide[j + 1])
         X = Classo_R3(pb, lam)
         BETA.append(X[0])
         SIGMA.append(X[-1])
         pb.init = X[1]
+        states.append(X[1])
 
         if (
             sum([(abs(X[0][i]) > 1e-5) for i in range(len(X[0]))]) >= n_act
@@ -181,8 +231,10 @@ Class of problem : we define a type, which will contain as keys, all the paramet
 
 
 class problem_R3:
-    def __init__(self, data, algo):
-        self.N = 500000
+    def __init__(self, data, algo, products=None):
+        self.budget = solver_budget()  # iteration and time budgets, and diagnostics
+        # A^tA and A^ty if they are already computed (see misc_functions.gram_products)
+        self.products = products
 
         (A, C, y) = data
         self.dim = (A.shape[0], A.shape[1], C.shape[0])
@@ -191,6 +243,9 @@ class problem_R3:
         (m, d, k) = self.dim
         self.weights = np.ones(d)
         self.tol = tol
+        self.anderson = 0  # memory of the Anderson acceleration of the iterations (0 : none)
+        self.gap_tol = None  # relative duality gap at which the iterations stop (None : step criterion)
+        self.gap = None  # last duality gap computed by stop
 
         self.regpath = False
         self.name = algo + " Concomitant"
@@ -200,39 +255,51 @@ class problem_R3:
         self.mu = 1.95
 
         self.gam = 1.0  # np.sqrt(d/m)
-        self.Aty = (A.T).dot(y)
+        self.Aty = (A.T).dot(y) if products is None else products.Aty
         self.sigmax = LA.norm(y) / np.sqrt(m / 2)
         self.lambdamax = 2 * LA.norm(self.Aty, np.infty) / self.sigmax
         self.init = 0.0, 0.0, np.zeros(m), np.zeros(d), np.zeros(d)
+        self.work = workspace()  # work arrays of the iterations
 
     # Here we compute the costful matrices products and inverts in order to compute it only once, which is especially helpful for warmstarts.
     def compute_param(self):
         (A, C, y) = self.matrix
         m, d, k = self.dim
-        self.Anorm = LA.norm(A, "fro")
+        gram = None if self.products is None or m <= d else self.products.AtA
+        if gram is None:
+            self.Anorm = LA.norm(A, "fro")
+            c = (d / LA.norm(A, 2)) ** 2
+        else:
+            self.Anorm = np.sqrt(np.trace(gram))
+            c = d ** 2 / LA.eigvalsh(gram)[-1]
         self.Anorm2 = self.Anorm ** 2
-        c = (d / LA.norm(A, 2)) ** 2
         # parameter for Concomitant problem : the matrix is scaled as c*A^2
         self.c = c
-        self.Q1, self.Q2 = QQ(c, A)
-        self.QA = self.Q1.dot(A)
-
+        self.Proj = ker_projector(C)  # Proj = I - C^t . (C . C^t )^-1 . C
+        self.resolvent = dr_resolvent(c, A, gram=gram)
 
-"""
-Functions used in the algorithms, modules needed :
-"""
+    # stopping test of the iterations at b : the step criterion step if gap_tol is None,
+    # and else the duality gap at the projection of b on Ker(C) (see misc_functions.duality_gap),
+    # or the end of the time budget.
+    def stop(self, b, lamb, step):
+        if self.gap_tol is not None:
+            b = self.Proj.dot(b)
+            self.gap = duality_gap(self.matrix, b, lamb, "R3", weights=self.weights)
+            step = self.gap < self.gap_tol
+        return step or self.budget.out_of_time()
 
+    # initial state of the iterations from a previous solution beta (warm start)
+    def warm_start(self, beta):
+        self.init = self.init[:3] + (beta, beta)
 
-# compute the prox of the function : f(b)= sum (wi * |bi| )
-def prox(b, w, zeros):
-    return np.minimum(b + w, zeros) + np.maximum(b - w, zeros)
+    # A^tA given to the problem, for the path algorithm (None if it has to compute it)
+    def known_AtA(self):
+        return None if self.products is None else self.products.AtA
 
 
-# Compute I - C^t (C.C^t)^-1 . C : the projection on Ker(C)
-def proj_c(M, d):
-    if LA.matrix_rank(M) == 0:
-        return np.eye(d)
-    return np.eye(d) - LA.multi_dot([M.T, np.linalg.inv(M.dot(M.T)), M])
+"""
+Functions used in the algorithms, modules needed :
+"""
 
 
 # Compute the real positive root of a polynomial of degree 3 in the form :
@@ -245,14 +312,6 @@ def calc_Newton(a, b, root):
     return root
 
 
-def QQ(coef, A):
-    # compute QQ = coef A^t (2.I.+coef A A^t )^-1 , (2.I.+coef A^t A)^-1
-    return (
-        coef * (A.T).dot(LA.inv(2 * np.eye(A.shape[0]) + coef * A.dot(A.T))),
-        LA.inv(2 * np.eye(A.shape[1]) + coef * (A.T).dot(A)),
-    )
-
-
 # Return the cost function of some Beta for a given Lasso problem : L_LS = ||y-Ab||2^2  + lambda* ||b||1
 def L_LS(pb, lam, sol):
     return LA.norm(
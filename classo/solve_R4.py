@@ -1,6 +1,18 @@
 import numpy as np
 import numpy.linalg as LA
 from .solve_R3 import problem_R3, Classo_R3
+from .misc_functions import (
+    ker_projector,
+    dr_resolvent,
+    mean_shift_matrix,
+    unpenalized,
+    anderson,
+    duality_gap,
+    solver_budget,
+    soft_thresholding,
+    workspace,
+    guided_state,
+)
 
 r"""
 Problem    :   min h_rho((Ab - y)/sigma)sigma + simga + lambda ||b||1 with C.b= 0, sigma>0
@@ -25,35 +37,31 @@ def Classo_R4(pb, lam):
     regpath = pb.regpath
 
     if lam < 1e-5:
-        pb_type = "Path-Alg"  # in this case, we will simply use R3.
+        # the mean-shift vanishes with lambda, so this is the unpenalized least squares problem,
+        # and sigma is given by its residual
+        if pb.intercept:
+            beta = unpenalized((A[:, 1:], C[:, 1:], y), intercept=True)
+        else:
+            beta = unpenalized(pb.matrix)
+        return beta, LA.norm(A.dot(beta) - y) / np.sqrt(m)
 
     # Only alternative to 2prox : one can use the other formulation of the problem which shows that
     #  we can augment the data and then simply solve a concomitant problem
     # (we do that with the method ODE for example becasue it is pretty efficient).
-    # Unfortunately we can do that only for fixed lambda and not for any path algorithms
-    # because the augmentation of the data required depends on lambda.
+    # The augmentation of the data depends on lambda, so the path algorithm is run
+    # for each lambda, but the augmented data are computed once for the whole path.
     if pb_type == "Path-Alg":
         # trick of mean-shift formulation explained in the pdf "concomitant huber"
         # problem of e ==> same trick to do as explained as in the end of the file compact_func, with r = np.sqrt(2)
-
-        A_aug = np.sqrt(2) * np.concatenate((A, lamb / (2 * rho) * np.eye(m)), axis=1)
-        C_aug = np.concatenate((C, np.zeros((k, m))), axis=1)
-        y_aug = np.sqrt(2) * y
-
-        if pb.intercept:
-            A_aug = A_aug[:, 1:]
-            C_aug = C_aug[:, 1:]
-            Abar = np.mean(A_aug, axis=0)
-            ybar = np.mean(y_aug)
-            A_aug = A_aug - Abar
-            y_aug = y_aug - ybar
-
-        pb_aug = problem_R3((A_aug, C_aug, y_aug), "Path-Alg")
+        pb_aug, r_aug = pb.augmented_problem(lamb)
         beta_aug, s = Classo_R3(pb_aug, lamb / pb_aug.lambdamax)
         s = s / 2
         beta = beta_aug[:-m]
         if pb.intercept:
-            betaO = ybar - np.vdot(Abar, beta_aug)
+            # the columns of the block r I have mean r/m, and the augmented data are scaled by sqrt(2)
+            Abar, ybar = pb.aug[3:]
+            betaO = ybar - np.vdot(Abar, beta) - r_aug * np.mean(beta_aug[-m:])
+            betaO = betaO / np.sqrt(2)
             beta = np.array([betaO] + list(beta))
         return beta, s
 
@@ -67,58 +75,92 @@ def Classo_R4(pb, lam):
             pb.compute_param()
 
         proj_sigm = pb.proj_sigm
-        QA = pb.QA
-        Q1 = pb.Q1
-        Q2 = pb.Q2
+        Q = pb.resolvent
         Proj = pb.Proj
         Anorm = pb.Anorm
 
         tol = pb.tol * LA.norm(y)  # tolerance rescaled
         gamma = LA.norm(y) * pb.gam / (Anorm ** 2)
-        # two vectors usefull to compute the prox of f(b)= sum(wi |bi|)
-        w = lamb * gamma * pb.weights
-        zerod = np.zeros(d)
+        w = lamb * gamma * pb.weights  # weights of the prox of f(b)= sum(wi |bi|)
         mu, c = pb.mu, pb.c
         root = [0.0] * len(y)
-        xs, nu, o, xbar, x = pb.init
-
-        b, s = 0.0, 0.0  # just for flake8 purpose
-        for i in range(pb.N):
-            nv_b = x + Q1.dot(o) - QA.dot(x) - Q2.dot(x - xbar)
-            nv_s = (xs + nu) / 2
-            if i > 0 and LA.norm(b - nv_b) * Anorm + LA.norm(s - nv_s) < 2 * tol:
-                if regpath:
-                    return (
-                        b,
-                        (xs, nu, o, xbar, x),
-                        sum(s) / len(s) / pb.sigmax,
-                    )
-                else:
-                    return (b, sum(s) / len(s))
-
-            s, b = nv_s, nv_b
-            Ab = A.dot(b)
-            p1, p2, root = prox_phi_2(xs, 2 * Ab - o - y, gamma / c, root, rho)
-
-            sup1 = proj_sigm(nu) - s
-            sup2 = p1 - s
-            sup3 = p2 + y - Ab
-            sup4 = prox(2 * b - xbar, w, zerod) - b
-            sup5 = Proj.dot(2 * b - x) - b
-
-            xs = xs + mu * sup1
-            nu = nu + mu * sup2
-            o = o + mu * sup3
-            xbar = xbar + mu * sup4
-            x = x + mu * sup5
+        xs, nu, o, xbar, x = pb.work.state(pb.init)
+        # the iterations update their state inplace, and their temporaries are work arrays
+        u, p, v = [pb.work.get(name, d) for name in ["u", "p", "v"]]
+        Ab, um = pb.work.get("Ab", m), pb.work.get("um", m)
+
+        acc = anderson(pb.anderson) if pb.anderson else None
+        # the duality gap is only computed every 10 iterations
+        every = acc is None and pb.gap_tol is None
+
+        b, nv_b, s, nv_s = np.zeros(d), np.empty(d), np.zeros(m), np.empty(m)
+        for i in range(pb.budget.max_iter):
+            if acc is not None:
+                z = (xs.copy(), nu.copy(), o.copy(), xbar.copy(), x.copy())
+            # x + Q1.o - QA.x - Q2.(x - xbar) , with Q2 = (I - QA)/2
+            np.add(x, xbar, out=v)
+            v *= 0.5
+            np.dot(A, v, out=um)
+            np.subtract(o, um, out=um)
+            np.add(v, Q.q1(um, out=nv_b), out=nv_b)
+            np.add(xs, nu, out=nv_s)
+            nv_s *= 0.5
+            if i > 0 and (every or i % 10 == 2):
+                step = LA.norm(np.subtract(b, nv_b, out=u)) * Anorm
+                step = step + LA.norm(np.subtract(s, nv_s, out=um)) < 2 * tol
+                if pb.stop(b, lamb, step):
+                    break
+
+            (s, nv_s), (b, nv_b) = (nv_s, s), (nv_b, b)
+            np.dot(A, b, out=Ab)
+            np.multiply(Ab, 2, out=um)
+            um -= o
+            um -= y
+            p1, p2, root = prox_phi_2(xs, um, gamma / c, root, rho)
+
+            # xs = xs + mu (proj_sigm(nu) - s) and nu = nu + mu (p1 - s)
+            np.subtract(proj_sigm(nu), s, out=um)
+            um *= mu
+            xs += um
+            np.subtract(p1, s, out=um)
+            um *= mu
+            nu += um
+            # o = o + mu (p2 + y - Ab)
+            np.add(y, p2, out=um)
+            um -= Ab
+            um *= mu
+            o += um
+            # xbar = xbar + mu (prox(2b - xbar) - b)
+            np.multiply(b, 2, out=u)
+            u -= xbar
+            soft_thresholding(u, w, out=p)
+            p -= b
+            p *= mu
+            xbar += p
+            # x = x + mu (Proj.(2b - x) - b)
+            np.multiply(b, 2, out=u)
+            u -= x
+            Proj.dot(u, out=p)
+            p -= b
+            p *= mu
+            x += p
 
             if LA.norm(b) + LA.norm(s) > 1e6:
                 raise ValueError("The algorithm of Doulgas Rachford diverges")
-
-        raise ValueError(
-            "The algorithm of Doulgas Rachford did not converge after %i iterations "
-            % pb.N
-        )
+            if acc is not None:
+                # no extrapolation before the stopping test, which compares consecutive iterates
+                xs[:], nu[:], o[:], xbar[:], x[:] = acc.step(
+                    z, (xs, nu, o, xbar, x), extrapolate=i % 10 != 1
+                )
+        else:
+            pb.budget.converged = False  # the iteration budget ran out
+
+        pb.budget.iterations += i + 1
+        if pb.gap_tol is not None or not pb.budget.converged:
+            b = Proj.dot(b)  # feasible point, whose duality gap is computed
+        if regpath:
+            return (b, (xs, nu, o, xbar, x), sum(s) / len(s) / pb.sigmax)
+        return (b, sum(s) / len(s))
 
 
 """
@@ -129,22 +171,43 @@ that rules Beta and the subgradient s, and then to evaluate it in the given fini
 """
 
 
-def pathlasso_R4(pb, path, n_active=False):
+def pathlasso_R4(pb, path, n_active=False, guide=None, states=None):
     n, d, k = pb.dim
     BETA, SIGMA, tol = [], [], pb.tol
-    pb.type = "DR"
-    save_init = pb.init
-    pb.regpath = True
-    pb.compute_param()
     if type(n_active) == int and n_active > 0:
         n_act = n_active
     else:
         n_act = d + 1
 
-    for lam in path:
+    if pb.type == "Path-Alg":
+        # there is no piecewise linear path because sigma and the mean-shift vary with lambda,
+        # so each lambda is solved exactly, reusing the augmented data of the previous ones
+        for lam in path:
+            beta, s = Classo_R4(pb, lam)
+            BETA.append(beta), SIGMA.append(s / pb.sigmax)
+            if sum(abs(beta) > 1e-5) >= n_act:
+                BETA.extend([BETA[-1]] * (len(path) - len(BETA)))
+                SIGMA.extend([SIGMA[-1]] * (len(path) - len(SIGMA)))
+                break
+        return (BETA, SIGMA)
+
+    pb.type = "DR"
+    save_init = pb.init
+    pb.regpath = True
+    pb.compute_param()
+
+    # the states of the iterations after each lambda are appended to states, and if guide is given,
+    # the warm start of each lambda follows it (see misc_functions.guided_state)
+    if states is None:
+        states = []
+    states.append(pb.init)
+    for j, lam in enumerate(path):
+        if guide is not None and j + 1 < len(guide):
+            pb.init = guided_state(pb.init, guide[j], guide[j + 1])
         X = Classo_R4(pb, lam)
         BETA.append(X[0]), SIGMA.append(X[2])
         pb.init = X[1]
+        states.append(X[1])
 
         if (
             sum([(abs(X[0][i]) > 1e-5) for i in range(len(X[0]))]) >= n_act
@@ -168,7 +231,7 @@ Class of problem : we define a type, which will contain as keys, all the paramet
 
 class problem_R4:
     def __init__(self, data, algo, rho, intercept=False):
-        self.N = 500000
+        self.budget = solver_budget()  # iteration and time budgets, and diagnostics
 
         (AA, C, y) = data
         A = AA[:, :]
@@ -177,7 +240,7 @@ class problem_R4:
         if intercept:
             # add a column of 1 in A, and change weight.
             A = np.concatenate([np.ones((len(A), 1)), A], axis=1)
-            C = np.concatenate([np.ones((len(C), 1)), C], axis=1)
+            C = np.concatenate([np.zeros((len(C), 1)), C], axis=1)
             self.weights = np.concatenate([[0.0], self.weights])
             # not exactly what it should be...
             yy = y - np.mean(y)
@@ -191,6 +254,9 @@ class problem_R4:
 
         (m, d, k) = self.dim
         self.tol = tol
+        self.anderson = 0  # memory of the Anderson acceleration of the iterations (0 : none)
+        self.gap_tol = None  # relative duality gap at which the iterations stop (None : step criterion)
+        self.gap = None  # last duality gap computed by stop
 
         self.regpath = False
         self.name = algo + " Concomitant Huber"
@@ -218,20 +284,63 @@ class problem_R4:
             np.zeros(d),
             np.zeros(d),
         )
+        self.aug = None
+        self.work = workspace()  # work arrays of the iterations
+
+    # Concomitant problem on the data augmented with the mean-shift sqrt(2) [A, r I], r = sqrt(2) lamb / (2 rho).
+    # Only r depends on lambda, so the centered data are computed once and kept for the next lambdas of a path.
+    def augmented_problem(self, lamb):
+        (A, C, y) = self.matrix
+        m, d, k = self.dim
+        if self.aug is None:
+            A_aug = np.sqrt(2) * A
+            C_aug = np.concatenate((C, np.zeros((k, m))), axis=1)
+            y_aug = np.sqrt(2) * y
+            Abar, ybar = None, None
+            if self.intercept:
+                A_aug = A_aug[:, 1:]
+                C_aug = C_aug[:, 1:]
+                Abar = np.mean(A_aug, axis=0)
+                ybar = np.mean(y_aug)
+                A_aug = A_aug - Abar
+                y_aug = y_aug - ybar
+            self.aug = (A_aug, C_aug, y_aug, Abar, ybar)
+
+        A_aug, C_aug, y_aug = self.aug[:3]
+        r_aug = np.sqrt(2) * lamb / (2 * self.rho)
+        A_aug = mean_shift_matrix(A_aug, r_aug, centered=self.intercept)
+        return problem_R3((A_aug, C_aug, y_aug), "Path-Alg"), r_aug
 
     def compute_param(self):
         (A, C, y) = self.matrix
         m, d, k = self.dim
         self.Anorm = LA.norm(A, "fro")
-        self.Proj = proj_c(C, d)  # Proj = I - C^t . (C . C^t )^-1 . C
-        self.Q1, self.Q2 = QQ(self.c, A)
-        self.QA = self.Q1.dot(A)
-        self.proj_sigm = lambda vect: (
-            [max(0, sum(vect)) / len(vect)] * len(vect)
+        self.Proj = ker_projector(C)  # Proj = I - C^t . (C . C^t )^-1 . C
+        self.resolvent = dr_resolvent(self.c, A)
+        self.proj_sigm = lambda vect: np.full(
+            len(vect), max(0, np.sum(vect)) / len(vect)
         )  # here,
         # compared to the Muller&Combettes paper, there is a projection more on sigma =0,
         # for numerical issues...
 
+    # stopping test of the iterations at b : the step criterion step if gap_tol is None,
+    # and else the duality gap at the projection of b on Ker(C) (see misc_functions.duality_gap),
+    # or the end of the time budget.
+    def stop(self, b, lamb, step):
+        if self.gap_tol is not None:
+            (A, C, y), b = self.matrix, self.Proj.dot(b)
+            if self.intercept:
+                A, C = A[:, 1:], C[:, 1:]
+            self.gap = duality_gap(
+                (A, C, y), b, lamb, "R4", self.rho, intercept=self.intercept
+            )
+            step = self.gap < self.gap_tol
+        return step or self.budget.out_of_time()
+
+    # initial state of the iterations from a previous solution beta (warm start)
+    def warm_start(self, beta):
+        self.init = self.init[:3] + (beta, beta)
+
 
 """
 Functions used in the algorithms, modules needed:
@@ -241,75 +350,62 @@ from .../class_of_problem import problem
 """
 
 
-# compute the prox of the function : f(b)= sum (wi * |bi| )
-def prox(b, w, zeros):
-    return np.minimum(b + w, zeros) + np.maximum(b - w, zeros)
-
-
-# Compute I - C^t (C.C^t)^-1 . C : the projection on Ker(C)
-def proj_c(M, d):
-    if LA.matrix_rank(M) == 0:
-        return np.eye(d)
-    return np.eye(d) - LA.multi_dot([M.T, np.linalg.inv(M.dot(M.T)), M])
-
-
-def QQ(coef, A):
-    return (
-        coef * (A.T).dot(LA.inv(2 * np.eye(A.shape[0]) + coef * A.dot(A.T))),
-        LA.inv(2 * np.eye(A.shape[1]) + coef * (A.T).dot(A)),
-    )
-
-
-# Compute the real positive root of a polynomial of degree 3 in the form : X^3 + a*X - b with Newton method and a warm start (for Comcomitant problem)
+# Compute the real positive roots of polynomials of degree 3 in the form : X^3 + a*X - b with Newton method and a warm start (for Comcomitant problem)
+# a, b and root are arrays : the iterations are done at once on the components that are not converged yet
 def calc_Newton(a, b, root):
+    root = np.array(root, dtype=float)
     er = root ** 3 + a * root - b
-    i = 0
-    bound = min(np.cbrt(b), b / a)
-    while abs(er) > 1e-6 and i < 20:
-        if root < 0.0:
-            root, er = 0.0, -b
-        elif root > bound:
-            root, er = bound, bound ** 3 + a * bound - b
-        root = root - er / (3 * root ** 2 + a)
-        er = root ** 3 + a * root - b
-        i += 1
-    if i == 20:
-        r = np.roots([1.0, 0.0, a, -b])
-        root = np.amax((r[np.isreal(r)]).real)
+    bound = np.minimum(np.cbrt(b), b / a)
+    for i in range(20):
+        act = abs(er) > 1e-6
+        if not np.any(act):
+            break
+        r, aa, bb, bd = root[act], a[act], b[act], bound[act]
+        low, high = r < 0.0, r > bd
+        e = np.where(low, -bb, np.where(high, bd ** 3 + aa * bd - bb, er[act]))
+        r = np.where(low, 0.0, np.where(high, bd, r))
+        r = r - e / (3 * r ** 2 + aa)
+        root[act], er[act] = r, r ** 3 + aa * r - bb
+    else:
+        # the components that did not converge after 20 iterations
+        for j in np.nonzero(act)[0]:
+            rts = np.roots([1.0, 0.0, a[j], -b[j]])
+            root[j] = np.amax((rts[np.isreal(rts)]).real)
     return root
 
 
+# Prox of the function (u,s) --> sum_i (0.5*h_rho(u_i/sigma_i) + 0.5)*sigma_i
+# Explicit formula for each component were given in the Combettes&Muller paper,
+# here the four cases are computed with masks, and Newton method is used on the components of the last case.
 def prox_phi_2(sig, u, gamma, warm_start, rho):
-    p, q, ws = np.zeros(len(u)), np.zeros(len(u)), np.zeros(len(u))
-    for i in range(len(u)):
-        p[i], q[i], ws[i] = prox_phi_i(sig[i], u[i], 2 * gamma, warm_start[i], rho)
-    return (p, q, ws)
-
-
-# Each componant of the prox. Explicit formula were given in the Combettes&Muller paper.
-# It is the prox of the function (u,s) --> (0.5*h_rho(u/sigma) + 0.5)*sigma
-def prox_phi_i(s, u, gamma, root, rho):
-    if u == 0.0:
-        return (0, 0, root)
-    frac = gamma * rho / abs(u)
-    term = s + gamma * (rho ** 2 - 1) / 2
+    gamma = 2 * gamma
+    sig, u = np.asarray(sig, dtype=float), np.asarray(u, dtype=float)
+    root = np.array(warm_start, dtype=float)
+    p, q = np.zeros(len(u)), np.zeros(len(u))
+    absu = abs(u)
+    with np.errstate(divide="ignore"):
+        frac = gamma * rho / absu
+    term = sig + gamma * (rho ** 2 - 1) / 2
     bool1 = frac >= 1
-    bool2 = abs(u) ** 2 <= gamma * (gamma - 2 * s)
+    bool2 = absu ** 2 <= gamma * (gamma - 2 * sig)
     bool3 = term <= 0
-    bool4 = abs(u) >= rho * s + gamma * rho * (1 + rho ** 2) / 2
-
-    if bool1 and bool2:
-        return (0.0, 0.0, root)
-    elif bool3 and not bool1:
-        return (0.0, u * (1 - frac), root)
-    elif not bool3 and bool4:
-        return (term, u * (1 - frac), root)
-    root = calc_Newton(2 * s / gamma + 1, 2 * abs(u) / gamma, root)
-    return (
-        s + gamma * (root ** 2 - 1) / 2,
-        u - gamma * root * np.sign(u),
-        root,
-    )
+    bool4 = absu >= rho * sig + gamma * rho * (1 + rho ** 2) / 2
+
+    case1 = (absu == 0.0) | (bool1 & bool2)
+    case2 = ~case1 & bool3 & ~bool1
+    case3 = ~case1 & ~case2 & ~bool3 & bool4
+    newton = ~(case1 | case2 | case3)
+
+    shrink = case2 | case3
+    q[shrink] = u[shrink] * (1 - frac[shrink])
+    p[case3] = term[case3]
+    if np.any(newton):
+        s, un = sig[newton], u[newton]
+        r = calc_Newton(2 * s / gamma + 1, 2 * absu[newton] / gamma, root[newton])
+        root[newton] = r
+        p[newton] = s + gamma * (r ** 2 - 1) / 2
+        q[newton] = un - gamma * r * np.sign(un)
+    return (p, q, root)
 
 
 # Compute the derivative of the huber function, particulary useful for the computing of lambdamax
@@ -322,17 +418,13 @@ def h_prime(y, rho):
 # useful for computing lambdamax.
 def find_sigmax(y, rho, e):
     m, evol = len(y), True
-    F = [True] * m
+    F = np.ones(m, dtype=bool)
     if rho > 1:
         while evol:
-            evol = False
-            s = LA.norm(y[F]) / np.sqrt(e - (m - sum(F)) * rho ** 2)
-            cste = rho * s
-            for j in range(m):
-                if F[j] and y[j] > cste:
-                    F[j], evol = False, True
-                elif not F[j] and not y[j] > cste:
-                    F[j], evol = True, True
+            s = LA.norm(y[F]) / np.sqrt(e - (m - np.sum(F)) * rho ** 2)
+            nv_F = ~(y > rho * s)
+            evol = np.any(nv_F != F)
+            F = nv_F
         return s
     else:
         print("rho too little ==> sigma is always 0")
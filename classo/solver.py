@@ -17,13 +17,20 @@ The package is organized as follow :
 
 
 from time import time
+from functools import partial
 import numpy as np
 import matplotlib.pyplot as plt
 
-from .misc_functions import theoretical_lam, min_LS, affichage, check_size
+from .misc_functions import (
+    theoretical_lam,
+    min_LS,
+    affichage,
+    check_size,
+    solver_budget,
+)
 
 # from .misc_functions import tree_to_matrix
-from .compact_func import Classo, pathlasso
+from .compact_func import Classo, pathlasso, solution_gap
 from .cross_validation import CV
 from .stability_selection import stability, selected_param
 from .alo import alo_classo_risk
@@ -49,7 +56,7 @@ class classo_problem:
         solution (Solution) : object giving caracteristics of the solution of the model_selection that is asked.
             Before using the method :func:`solve()` , its componant are empty/null.
         numerical_method (str) : name of the numerical method that is used, it can be :
-            'Path-Alg' (path algorithm) , 'P-PDS' (Projected primal-dual splitting method) , 'PF-PDS' (Projection-free primal-dual splitting method) or 'DR' (Douglas-Rachford-type splitting method).
+            'Path-Alg' (path algorithm) , 'P-PDS' (Projected primal-dual splitting method) , 'PF-PDS' (Projection-free primal-dual splitting method) , 'DR' (Douglas-Rachford-type splitting method) or 'CD' (coordinate descent, for R1, R2 and C1).
             Default value : 'not specified', which means that the function :func:`choose_numerical_method` will choose it accordingly to the formulation.
 
     """
@@ -436,7 +443,7 @@ class PATHparameters:
     Attributes:
         numerical_method (str) : name of the numerical method that is used, it can be :
             'Path-Alg' (path algorithm) , 'P-PDS' (Projected primal-dual splitting method),
-            'PF-PDS' (Projection-free primal-dual splitting method) or 'DR' (Douglas-Rachford-type splitting method).
+            'PF-PDS' (Projection-free primal-dual splitting method) , 'DR' (Douglas-Rachford-type splitting method) or 'CD' (coordinate descent, for R1, R2 and C1).
             Default value : 'not specified', which means that the function :func:`choose_numerical_method` will choose it accordingly to the formulation
 
         n_active (int): if it is higher than 0, then the algo stops computing the path when n_active variables are active.
@@ -460,6 +467,33 @@ class PATHparameters:
 
         label (numpy.ndarray of str) : labels on each coefficient.
 
+        screening (bool) : if True, each lambda of the path is solved only on the features kept by the
+        sequential strong rule (and the gap-safe rule for R1), and the discarded features which violate
+        the optimality conditions are added back. It is useful when d is large, with the iterative methods.
+            Default value : False
+
+        working_set (bool) : if True, each lambda of the path is solved on a working set of features, which starts
+        with the previous active set and grows with the features that violate the optimality conditions the most.
+        The reduced problems are warm started. It is useful when d is large and few coefficients are nonzero.
+            Default value : False
+
+        anderson (int) : if it is higher than 0, the iterations of 'DR', 'P-PDS' and 'PF-PDS' are accelerated
+        with an Anderson acceleration that uses the anderson last iterates (10 is a good value on poorly conditioned problems).
+        It is mostly useful for R1 and R2 : the iterations of the concomitant formulations are not much faster with it.
+            Default value : 0
+
+        gap (float) : if it is given, the iterative methods ('DR', 'P-PDS', 'PF-PDS' and 'CD') stop when the relative
+        duality gap of their iterate is smaller than gap, instead of using their default stopping rule.
+        The gap is checked every few iterations only, because it costs a product with the matrix.
+            Default value : None
+
+        max_iter (int) : maximum number of iterations of the iterative methods for each lambda.
+            Default value : 500000
+
+        max_time (float) : maximum running time in seconds of the iterative methods. When one of these budgets runs out,
+        the last iterate is returned instead of raising an error, and the solution is marked as not converged.
+            Default value : None (no time limit)
+
     """
 
     def __init__(self, method="not specified"):
@@ -472,6 +506,12 @@ class PATHparameters:
         self.lambdas = None
         self.plot_sigma = True
         self.rescaled_lam = True
+        self.screening = False
+        self.working_set = False
+        self.anderson = 0
+        self.gap = None
+        self.max_iter = 500000
+        self.max_time = None
 
     def __repr__(self):
         if self.lambdas is not None:
@@ -490,6 +530,16 @@ class PATHparameters:
         string += "\n     " + typ
         if self.n_active > 0:
             string += "\n     maximum active variables = " + str(self.n_active)
+        if self.screening:
+            string += "\n     with screening"
+        if self.working_set:
+            string += "\n     with working set"
+        if self.anderson > 0:
+            string += "\n     Anderson acceleration with memory " + str(self.anderson)
+        if self.gap is not None:
+            string += "\n     stops at the relative duality gap " + str(self.gap)
+        if self.max_time is not None:
+            string += "\n     time budget = " + str(self.max_time) + "s"
 
         return string
 
@@ -501,7 +551,7 @@ class ALOparameters:
     Attributes:
         numerical_method (str) : name of the numerical method that is used, it can be :
             'Path-Alg' (path algorithm) , 'P-PDS' (Projected primal-dual splitting method),
-            'PF-PDS' (Projection-free primal-dual splitting method) or 'DR' (Douglas-Rachford-type splitting method).
+            'PF-PDS' (Projection-free primal-dual splitting method) , 'DR' (Douglas-Rachford-type splitting method) or 'CD' (coordinate descent, for R1, R2 and C1).
             Default value : 'not specified', which means that the function :func:`choose_numerical_method` will choose it accordingly to the formulation
 
         n_active (int): if it is higher than 0, then the algo stops computing the path when n_active variables are active.
@@ -569,7 +619,7 @@ class CVparameters:
 
         numerical_method (str) : name of the numerical method that is used, can be :
             'Path-Alg' (path algorithm) , 'P-PDS' (Projected primal-dual splitting method),
-            'PF-PDS' (Projection-free primal-dual splitting method) or 'DR' (Douglas-Rachford-type splitting method).
+            'PF-PDS' (Projection-free primal-dual splitting method) , 'DR' (Douglas-Rachford-type splitting method) or 'CD' (coordinate descent, for R1, R2 and C1).
             Default value : 'not specified', which means that the function :func:`choose_numerical_method` will choose it accordingly to the formulation.
 
         lambdas (numpy.ndarray) : list of rescaled lambdas for computing lasso-path.
@@ -590,6 +640,17 @@ class CVparameters:
         Nsubset (int): number of subset in the cross validation method.
             Default value : 5
 
+        n_jobs (int): number of processes that compute the folds in parallel, each with one BLAS thread.
+        If set to None or -1, all the cores are used. The results are the same as the sequential ones.
+        As the processes are started with 'spawn', a script that uses it must be protected by if __name__ == '__main__'.
+            Default value : 1 (sequential)
+
+        adaptive (bool): if set to True, the lambdas are not all evaluated : the folds are first evaluated
+        on one lambda out of 4 of :attr:`lambdas`, from the largest one, until the validation error has clearly
+        risen past its minimum, then on all the lambdas around the selected ones.
+        The attributes of :class:`solution_CV` (xGraph, yGraph...) are then on the lambdas evaluated.
+            Default value : False
+
     """
 
     def __init__(self, method="not specified"):
@@ -602,6 +663,8 @@ class CVparameters:
         self.logscale = True
         self.lambdas = None
         self.oneSE = True
+        self.n_jobs = 1
+        self.adaptive = False
 
     def __repr__(self):
         if self.lambdas is not None:
@@ -617,6 +680,10 @@ class CVparameters:
         string = "\n     numerical_method : " + str(self.numerical_method)
         string += "\n     one-SE method : " + str(self.oneSE)
         string += "\n     Nsubset = " + str(self.Nsubset)
+        if self.n_jobs != 1:
+            string += "\n     n_jobs = " + str(self.n_jobs)
+        if self.adaptive:
+            string += "\n     adaptive grid of lambdas"
         string += "\n     lamin = " + str(self.lamin)
         string += "\n     Nlam = " + str(self.Nlam)
         string += "\n     " + typ
@@ -634,7 +701,7 @@ class StabSelparameters:
             Default value : 123
 
         numerical_method (str) : name of the numerical method that is used, can be :
-            'Path-Alg' (path algorithm) , 'P-PDS' (Projected primal-dual splitting method) , 'PF-PDS' (Projection-free primal-dual splitting method) or 'DR' (Douglas-Rachford-type splitting method).
+            'Path-Alg' (path algorithm) , 'P-PDS' (Projected primal-dual splitting method) , 'PF-PDS' (Projection-free primal-dual splitting method) , 'DR' (Douglas-Rachford-type splitting method) or 'CD' (coordinate descent, for R1, R2 and C1).
             Default value : 'not specified', which means that the function :func:`choose_numerical_method` will choose it accordingly to the formulation.
 
         lam (float or str) : (only used if :obj:`method` = 'lam') lam for which the lasso should be computed.
@@ -720,7 +787,7 @@ class LAMfixedparameters:
 
     Attributes:
         numerical_method (str) : name of the numerical method that is used, can be :
-            'Path-Alg' (path algorithm) , 'P-PDS' (Projected primal-dual splitting method) , 'PF-PDS' (Projection-free primal-dual splitting method) or 'DR' (Douglas-Rachford-type splitting method).
+            'Path-Alg' (path algorithm) , 'P-PDS' (Projected primal-dual splitting method) , 'PF-PDS' (Projection-free primal-dual splitting method) , 'DR' (Douglas-Rachford-type splitting method) or 'CD' (coordinate descent, for R1, R2 and C1).
             Default value : 'not specified', which means that the function :func:`choose_numerical_method` will choose it accordingly to the formulation
 
         lam (float or str) : lam for which the lasso should be computed.
@@ -736,6 +803,23 @@ class LAMfixedparameters:
         threshold (float) : Threshold such that the parameters i selected or the ones such as the absolute value of beta[i] is greater than the threshold.
             If None, then it will be set to the average of the absolute value of beta.
             Default value : None
+
+        anderson (int) : if it is higher than 0, the iterations of 'DR', 'P-PDS' and 'PF-PDS' are accelerated
+        with an Anderson acceleration that uses the anderson last iterates (10 is a good value on poorly conditioned problems).
+        It is mostly useful for R1 and R2 : the iterations of the concomitant formulations are not much faster with it.
+            Default value : 0
+
+        gap (float) : if it is given, the iterative methods ('DR', 'P-PDS', 'PF-PDS' and 'CD') stop when the relative
+        duality gap of their iterate is smaller than gap, instead of using their default stopping rule.
+        The gap is checked every few iterations only, because it costs a product with the matrix.
+            Default value : None
+
+        max_iter (int) : maximum number of iterations of the iterative methods for each lambda.
+            Default value : 500000
+
+        max_time (float) : maximum running time in seconds of the iterative methods. When one of these budgets runs out,
+        the last iterate is returned instead of raising an error, and the solution is marked as not converged.
+            Default value : None (no time limit)
     """
 
     def __init__(self, method="not specified"):
@@ -745,10 +829,20 @@ class LAMfixedparameters:
         self.rescaled_lam = True
         self.theoretical_lam = 0.0
         self.threshold = None
+        self.anderson = 0
+        self.gap = None
+        self.max_iter = 500000
+        self.max_time = None
 
     def __repr__(self):
         string = "\n     numerical_method = " + str(self.numerical_method)
         string += "\n     rescaled lam : " + str(self.rescaled_lam)
+        if self.anderson > 0:
+            string += "\n     Anderson acceleration with memory " + str(self.anderson)
+        if self.gap is not None:
+            string += "\n     stops at the relative duality gap " + str(self.gap)
+        if self.max_time is not None:
+            string += "\n     time budget = " + str(self.max_time) + "s"
         if self.threshold is None:
             string += "\n     threshold : average of the absolute value of beta"
         else:
@@ -803,9 +897,13 @@ class solution_PATH:
     which also contains representation method that plot the graphic of this lasso-path.
 
     Attributes:
-        BETAS (numpy.ndarray) : array of size Npath x d with the solution beta for each lambda on each row.
+        path (sparse_path) : solution path stored with its breaking points and only the nonzero coefficients.
+        BETAS (numpy.ndarray) : array of size Npath x d with the solution beta for each lambda on each row, computed from path when asked.
         SIGMAS (numpy.ndarray) : array of size Npath with the solution sigma for each lambda when the formulation of the problem is R2 or R4.
         LAMBDAS (numpy.ndarray) : array of size Npath with the lambdas (real lambdas, not divided by lambda_max) for which the solution is computed.
+        GAPS (numpy.ndarray) : array of size Npath with the relative duality gap of the solution for each lambda, computed when asked.
+        converged (bool) : False if the iterative method was stopped by its iteration or time budget (see PATHparameters).
+        iterations (int) : number of iterations of the iterative method.
         logscale (bool): whether or not the path should be plotted with a logscale.
         method (str) : name of the numerical method that has been used. It can be 'Path-Alg', 'P-PDS' , 'PF-PDS' or 'DR'.
         save (bool or str) : if it is a str, then it gives the name of the file where the graphics has been/will be saved (after using print(solution) ).
@@ -842,6 +940,7 @@ class solution_PATH:
 
         self.logscale = param.logscale
 
+        budget = solver_budget(param.max_iter, param.max_time)
         out = pathlasso(
             matrices,
             lambdas=param.lambdas,
@@ -855,13 +954,30 @@ class solution_PATH:
             w=param.formulation.w,
             intercept=param.formulation.intercept,
             true_lam=not param.rescaled_lam,
+            sparse=True,
+            screening=param.screening,
+            working_set=param.working_set,
+            anderson=param.anderson,
+            gap=param.gap,
+            budget=budget,
         )
         if formulation.concomitant:
-            self.BETAS, self.LAMBDAS, self.SIGMAS = out
+            self.path, self.LAMBDAS, self.SIGMAS = out
         else:
-            self.BETAS, self.LAMBDAS = out
+            self.path, self.LAMBDAS = out
             self.SIGMAS = "not computed"
+        self.converged, self.iterations = budget.converged, budget.iterations
 
+        self.gap = partial(
+            solution_gap,
+            matrices,
+            typ=name_formulation,
+            rho=rho,
+            e=e,
+            rho_classification=rho_classification,
+            w=param.formulation.w,
+            intercept=param.formulation.intercept,
+        )
         self.formulation = formulation
         self.plot_sigma = param.plot_sigma
         self.method = numerical_method
@@ -869,15 +985,26 @@ class solution_PATH:
         self.label = label
         self.time = time() - t0
 
+    @property
+    def BETAS(self):
+        return self.path.evaluate(self.LAMBDAS)
+
+    @property
+    def GAPS(self):
+        return np.array(
+            [self.gap(beta, lamb) for beta, lamb in zip(self.BETAS, self.LAMBDAS)]
+        )
+
     def __repr__(self):
 
         string = "\n PATH COMPUTATION : "
-        d = len(self.BETAS[0])
+        BETAS = self.BETAS
+        d = len(BETAS[0])
 
         if (
             d > 20
         ):  # this trick is to plot only the biggest value, excluding the intercept
-            avg_betas = np.mean(abs(np.array(self.BETAS)), axis=0)
+            avg_betas = np.mean(abs(np.array(BETAS)), axis=0)
             if self.formulation.intercept:
                 avg_betas[0] = 0  # trick to exclude intercept in the graph
                 string += "\n   There is also an intercept.  "
@@ -898,7 +1025,7 @@ class solution_PATH:
             xlabel = PATH_beta_path["xlabel"]
         plt.figure(figsize=(10, 3), dpi=80)
         affichage(
-            self.BETAS[:, top],
+            BETAS[:, top],
             xGraph,
             labels=self.label[top],
             naffichage=5,
@@ -922,6 +1049,8 @@ class solution_PATH:
                 plt.savefig(self.save + "Sigma-path")
             plt.show(block=False)
 
+        if not self.converged:
+            string += "\n   Stopped by the budget before convergence"
         string += "\n   Running time :  " + str(round(self.time, 3)) + "s"
         return string
 
@@ -933,7 +1062,7 @@ class solution_CV:
     that plot the selected parameters and the solution of the not-sparse problem on the selected variables set.
 
     Attributes:
-        xGraph (numpy.ndarray) : array of size Nlam of the lambdas / lambda_max.
+        xGraph (numpy.ndarray) : array of size Nlam of the lambdas / lambda_max (the lambdas evaluated if :attr:`CVparameters.adaptive`).
         yGraph (numpy.ndarray) : array of size Nlam of the average validation residual (over the K subsets).
         standard_error (numpy.ndarray) : array of size Nlam of the standard error of the validation residual (over the K subsets).
         logscale (bool): whether or not the path should be plotted with a logscale.
@@ -982,7 +1111,7 @@ class solution_CV:
         self.logscale = param.logscale
 
         # Compute the solution and is the formulation is concomitant, it also compute sigma
-        (out, self.yGraph, self.standard_error, self.index_min, self.index_1SE,) = CV(
+        result = CV(
             matrices,
             param.Nsubset,
             typ=name_formulation,
@@ -995,11 +1124,15 @@ class solution_CV:
             e=e,
             w=param.formulation.w,
             intercept=param.formulation.intercept,
+            n_jobs=param.n_jobs,
+            adaptive=param.adaptive,
         )
+        out, self.yGraph, self.standard_error, self.index_min, self.index_1SE = result[:5]
 
-        self.xGraph = param.lambdas
-        self.lambda_1SE = param.lambdas[self.index_1SE]
-        self.lambda_min = param.lambdas[self.index_min]
+        # with an adaptive grid, only the lambdas evaluated are kept
+        self.xGraph = result[5] if param.adaptive else param.lambdas
+        self.lambda_1SE = self.xGraph[self.index_1SE]
+        self.lambda_min = self.xGraph[self.index_min]
         self.formulation = param.formulation
 
         if self.formulation.concomitant:
@@ -1129,7 +1262,8 @@ class solution_ALO:
     which also contains representation method that plot the graphic of this lasso-path.
 
     Attributes:
-        BETAS (numpy.ndarray) : array of size Npath x d with the solution beta for each lambda on each row.
+        path (sparse_path) : solution path stored with its breaking points and only the nonzero coefficients.
+        BETAS (numpy.ndarray) : array of size Npath x d with the solution beta for each lambda on each row, computed from path when asked.
         SIGMAS (numpy.ndarray) : array of size Npath with the solution sigma for each lambda when the formulation of the problem is R2 or R4.
         LAMBDAS (numpy.ndarray) : array of size Npath with the lambdas (real lambdas, not divided by lambda_max) for which the solution is computed.
         logscale (bool): whether or not the path should be plotted with a logscale.
@@ -1181,11 +1315,12 @@ class solution_ALO:
             w=param.formulation.w,
             intercept=param.formulation.intercept,
             true_lam=not param.rescaled_lam,
+            sparse=True,
         )
         if formulation.concomitant:
-            self.BETAS, self.LAMBDAS, self.SIGMAS = out
+            self.path, self.LAMBDAS, self.SIGMAS = out
         else:
-            self.BETAS, self.LAMBDAS = out
+            self.path, self.LAMBDAS = out
             self.SIGMAS = "not computed"
 
         self.formulation = formulation
@@ -1202,17 +1337,18 @@ class solution_ALO:
         if formulation.concomitant:
             raise ValueError("ALO is not implemented for R3 and R4.")
 
+        BETAS = self.BETAS
         self.alo, self.df = alo_classo_risk(
             X,
             C,
             y,
-            self.BETAS,
+            BETAS,
             huber=formulation.huber,
             intercept=self.formulation.intercept,
             classification=formulation.classification,
         )
         self.imin = np.argmin(self.alo)
-        self.beta = self.BETAS[self.imin]
+        self.beta = BETAS[self.imin]
         self.selected_param = (
             abs(self.beta) > 1e-5
         )  # boolean array, false iff beta_i = 0
@@ -1222,6 +1358,10 @@ class solution_ALO:
 
         self.time = time() - t0
 
+    @property
+    def BETAS(self):
+        return self.path.evaluate(self.LAMBDAS)
+
     def __repr__(self):
 
         string = "\n ALO COMPUTATION : "
@@ -1283,6 +1423,9 @@ class solution_StabSel:
         selected_param (numpy.ndarray) : boolean arrays of size d with True when the variable is selected.
         to_label (numpy.ndarray) : boolean arrays of size d with True when the name of the variable should be seen on the graph.
         refit (numpy.ndarray) : solution beta after solving unsparse problem over the set of selected variables.
+        gap (float) : relative duality gap of the solution beta.
+        converged (bool) : False if the iterative method was stopped by its iteration or time budget (see LAMfixedparameters).
+        iterations (int) : number of iterations of the iterative method.
         formulation (Formulation) : object containing the info about the formulation of the minimization problem we solve.
         time (float) : running time of this action.
 
@@ -1529,6 +1672,7 @@ class solution_LAMfixed:
         self.rescaled_lam = param.rescaled_lam
 
         # Compute the solution and is the formulation is concomitant, it also compute sigma
+        budget = solver_budget(param.max_iter, param.max_time)
         out = Classo(
             matrices,
             self.lam,
@@ -1541,18 +1685,34 @@ class solution_LAMfixed:
             rho_classification=rho_classification,
             w=param.formulation.w,
             intercept=param.formulation.intercept,
+            anderson=param.anderson,
+            gap=param.gap,
+            budget=budget,
         )
 
         if param.formulation.concomitant:
             self.lambdamax, self.beta, self.sigma = out
         else:
             self.lambdamax, self.beta = out
+        self.converged, self.iterations = budget.converged, budget.iterations
 
         if param.rescaled_lam:
             self.lamb = self.lambdamax * self.lam
         else:
             self.lamb = self.lam
 
+        self.gap = solution_gap(
+            matrices,
+            self.beta,
+            self.lamb,
+            typ=name_formulation,
+            rho=rho,
+            e=e,
+            rho_classification=rho_classification,
+            w=param.formulation.w,
+            intercept=param.formulation.intercept,
+        )
+
         if param.threshold is None:
             param.threshold = np.mean(abs(self.beta))
 
@@ -1599,6 +1759,8 @@ class solution_LAMfixed:
         for i in np.where(self.selected_param)[0]:
             string += self.label[i] + "    "
 
+        if not self.converged:
+            string += "\n   Stopped by the budget before convergence"
         string += "\n   Running time :  " + str(round(self.time, 3)) + "s"
         return string
 
@@ -1608,11 +1770,14 @@ def choose_numerical_method(method, model, formulation, StabSelmethod=None, lam=
     In general, it will choose one of the possible optimization scheme for a given formulation.
     When several computation modes are possible, the rules are as follow :
 
-    If possible, always use "Path-Alg", except for fixed lambdas smaller than 0.05
-    and for R4 where Path-Alg does not compute the path (paradoxically).
+    If possible, always use "Path-Alg", except for fixed lambdas smaller than 0.05.
+    For R4, "Path-Alg" solves each lambda of the path exactly (there is no piecewise linear path),
+    which is still faster than the warm started "DR".
 
     Else, it uses "DR".
 
+    The coordinate descent "CD" is kept when it is given, for R1, R2 and C1.
+
     Args:
         method (str) : input method that is possibly wrong and should be changed.
         If the method is valid for this formulation, it will not be changed.
@@ -1622,11 +1787,13 @@ def choose_numerical_method(method, model, formulation, StabSelmethod=None, lam=
         lam (float, optional) : value of lam (fractional L1 penalty).
 
     Returns :
-        str : method that should be used. Can be "Path-Alg", "DR", "P-PDS" or "PF-PDS"
+        str : method that should be used. Can be "Path-Alg", "DR", "P-PDS", "PF-PDS" or "CD"
 
     """
 
     if formulation.classification:
+        if method == "CD" and not formulation.huber:
+            return "CD"
         return "Path-Alg"
 
     # cases where we use classo at a fixed lambda
@@ -1640,7 +1807,7 @@ def choose_numerical_method(method, model, formulation, StabSelmethod=None, lam=
                     return "DR"
 
         else:
-            if method not in ["Path-Alg", "DR", "P-PDS", "PF-PDS"]:
+            if method not in ["Path-Alg", "DR", "P-PDS", "PF-PDS", "CD"]:
                 if lam > 0.05:
                     return "Path-Alg"
                 else:
@@ -1654,13 +1821,10 @@ def choose_numerical_method(method, model, formulation, StabSelmethod=None, lam=
 
         elif formulation.concomitant:
             if method not in ["Path-Alg", "DR"]:
-                if formulation.huber:
-                    return "DR"
-                else:
-                    return "Path-Alg"
+                return "Path-Alg"
 
         else:
-            if method not in ["Path-Alg", "DR", "P-PDS", "PF-PDS"]:
+            if method not in ["Path-Alg", "DR", "P-PDS", "PF-PDS", "CD"]:
                 return "Path-Alg"
 
     return method
@@ -8,7 +8,7 @@ from ..compact_func import pathlasso, Classo
 from ..solve_R1 import problem_R1, Classo_R1
 from ..solve_R2 import problem_R2, Classo_R2
 from ..solve_R3 import problem_R3, Classo_R3, pathlasso_R3
-from ..solve_R4 import problem_R4, Classo_R4
+from ..solve_R4 import problem_R4, Classo_R4, prox_phi_2, find_sigmax
 
 from ..misc_functions import random_data
 
@@ -126,6 +126,30 @@ def test_Classo_R4_all_methods_match():
     # assert  np.sum(abs(beta_ref-beta))  /  np.sum(abs(beta_ref)) < tol
 
 
+def test_prox_phi_2_componentwise():
+    np.random.seed(1)
+    n, gamma, rho = 200, 0.5, 1.345
+    sig, u = 2 * np.random.randn(n), 4 * np.random.randn(n)
+    u[:10] = 0.0
+    p, q, root = prox_phi_2(sig, u, gamma, np.zeros(n), rho)
+
+    for i in range(n):
+        pi, qi, ri = prox_phi_2(sig[i : i + 1], u[i : i + 1], gamma, [0.0], rho)
+        assert_allclose([p[i], q[i], root[i]], [pi[0], qi[0], ri[0]], rtol=1e-12)
+
+    newton = root != 0.0
+    a, b = 2 * sig[newton] / (2 * gamma) + 1, 2 * abs(u[newton]) / (2 * gamma)
+    assert_allclose(root[newton] ** 3 + a * root[newton] - b, 0.0, atol=1e-6)
+
+
+def test_find_sigmax_fixed_point():
+    np.random.seed(2)
+    yy, rho = 3 * np.random.randn(100), 1.345
+    s = find_sigmax(yy, rho, 100)
+    F = yy <= rho * s
+    assert_allclose(s, np.linalg.norm(yy[F]) / np.sqrt(100 - np.sum(~F) * rho ** 2))
+
+
 def test_Classo_lam_null():
     lam = 0.0
     rho = 1.345
@@ -1,9 +1,11 @@
+from itertools import product
+
 import numpy as np
 from numpy.testing import assert_allclose
 
-from ..compact_func import pathlasso, Classo
+from ..compact_func import pathlasso, Classo, lambda_max, solution_gap
 
-from ..misc_functions import random_data
+from ..misc_functions import random_data, solver_budget
 
 tol = 1e-2
 
@@ -59,18 +61,130 @@ def test_Classo_C2_is_C1_for_high_rho():
     assert_allclose(beta1, beta2, rtol=tol, atol=tol)
 
 
+def test_Classo_anderson():
+    for typ, meths in [
+        ("R1", ["DR", "P-PDS", "PF-PDS"]),
+        ("R2", ["DR", "P-PDS", "PF-PDS"]),
+        ("R3", ["DR"]),
+        ("R4", ["DR"]),
+    ]:
+        beta = Classo((X, C, y), 0.1, typ=typ, meth="Path-Alg", return_sigm=False)
+        for meth in meths:
+            beta2 = Classo(
+                (X, C, y), 0.1, typ=typ, meth=meth, return_sigm=False, anderson=10
+            )
+            assert_allclose(beta2, beta, rtol=1e-2, atol=1e-2)
+
+
+def test_Classo_CD():
+    C2 = np.random.RandomState(0).randn(2, d)
+    # with an intercept, Path-Alg is not as accurate for R2 and C1
+    for typ, yy, intercepts in [
+        ("R1", y, [False, True]),
+        ("R2", y, [False]),
+        ("C1", np.sign(y), [False]),
+    ]:
+        for CC in [C, C2]:
+            for intercept in intercepts:
+                beta = Classo(
+                    (X, CC, yy), 0.1, typ=typ, meth="Path-Alg", intercept=intercept
+                )
+                beta2 = Classo(
+                    (X, CC, yy), 0.1, typ=typ, meth="CD", intercept=intercept
+                )
+                assert_allclose(beta2, beta, rtol=tol, atol=tol)
+
+    beta = Classo((X, C, y), 0.1, typ="R2", meth="P-PDS", intercept=True)
+    beta2 = Classo((X, C, y), 0.1, typ="R2", meth="CD", intercept=True)
+    assert_allclose(beta2, beta, rtol=tol, atol=tol)
+
+
+def test_Classo_gap():
+    for typ, meths in [
+        ("R1", ["DR", "P-PDS", "PF-PDS", "CD"]),
+        ("R2", ["DR", "P-PDS", "PF-PDS", "CD"]),
+        ("R4", ["DR"]),
+        ("C1", ["CD"]),
+    ]:
+        matrix = (X, C, np.sign(y)) if typ == "C1" else (X, C, y)
+        for meth, intercept, lam in product(meths, [False, True], [0.99, 0.3]):
+            lambdamax, beta = Classo(
+                matrix,
+                lam,
+                typ=typ,
+                meth=meth,
+                get_lambdamax=True,
+                return_sigm=False,
+                intercept=intercept,
+                gap=1e-6,
+            )[:2]
+            gap = solution_gap(
+                matrix, beta, lam * lambdamax, typ=typ, intercept=intercept
+            )
+            assert -1e-12 < gap < 2e-6
+
+
+def test_Classo_budget():
+    for typ, meth in [("R1", "DR"), ("R2", "PF-PDS"), ("R3", "DR"), ("C1", "CD")]:
+        matrix = (X, C, np.sign(y)) if typ == "C1" else (X, C, y)
+        budget = solver_budget(max_iter=5)
+        beta = Classo(
+            matrix, 0.1, typ=typ, meth=meth, return_sigm=False, budget=budget
+        )
+        assert not budget.converged
+        assert budget.iterations == 5
+        assert_allclose(C.dot(beta), 0.0, atol=1e-10)
+
+    budget = solver_budget()
+    Classo((X, C, y), 0.1, typ="R1", meth="DR", budget=budget)
+    assert budget.converged
+
+
+def test_pathlasso_time_budget():
+    budget = solver_budget(max_time=0.0)
+    BETAS, LAMBDAS = pathlasso(
+        (X, C, y), lambdas=np.linspace(1.0, 0.1, 5), meth="DR", budget=budget
+    )
+    assert not budget.converged
+    assert len(BETAS) == 5
+
+
 """
 Test of pathlasso
 """
 
 
+def test_pathlasso_guide():
+    lambdas = np.linspace(1.0, 0.05, 20)
+    for meth in ["DR", "PF-PDS"]:
+        guide = []
+        pathlasso((X, C, y), lambdas=lambdas, meth=meth, intercept=True, states=guide)
+        assert len(guide) == len(lambdas) + 1
+
+        # path on a subset of the samples, warm started along the path of the whole data
+        budgets = [solver_budget(), solver_budget()]
+        BETAS = [
+            pathlasso(
+                (X[5:], C, y[5:]),
+                lambdas=lambdas,
+                meth=meth,
+                intercept=True,
+                budget=budget,
+                guide=g,
+            )[0]
+            for budget, g in zip(budgets, [None, guide])
+        ]
+        assert_allclose(BETAS[0], BETAS[1], rtol=tol, atol=tol)
+        assert budgets[1].iterations < budgets[0].iterations
+
+
 def test_pathlasso_R1():
-    for meth in ["Path-Alg", "DR", "P-PDS", "PF-PDS"]:
+    for meth in ["Path-Alg", "DR", "P-PDS", "PF-PDS", "CD"]:
         aux_test_pathlasso((X, C, y), "R1", meth)
 
 
 def test_pathlasso_R2():
-    for meth in ["Path-Alg", "DR", "P-PDS", "PF-PDS"]:
+    for meth in ["Path-Alg", "DR", "P-PDS", "PF-PDS", "CD"]:
         aux_test_pathlasso((X, C, y), "R2", meth, tole=1e-1)
 
 
@@ -80,11 +194,36 @@ def test_pathlasso_R3():
 
 
 def test_pathlasso_R4():
-    aux_test_pathlasso((X, C, y), "R4", "DR")
+    for meth in ["Path-Alg", "DR"]:
+        aux_test_pathlasso((X, C, y), "R4", meth, tole=1e-2)
+
+
+def test_pathlasso_R4_pathalg_is_DR():
+    lambdas = np.linspace(1.0, 0.05, 10)
+    for intercept in [False, True]:
+        betas, _, sigmas = pathlasso(
+            (X, C, y),
+            lambdas=lambdas,
+            typ="R4",
+            meth="Path-Alg",
+            intercept=intercept,
+            return_sigm=True,
+        )
+        betas2, _, sigmas2 = pathlasso(
+            (X, C, y),
+            lambdas=lambdas,
+            typ="R4",
+            meth="DR",
+            intercept=intercept,
+            return_sigm=True,
+        )
+        assert_allclose(betas, betas2, rtol=1e-1, atol=1e-1)
+        assert_allclose(sigmas, sigmas2, rtol=1e-2, atol=1e-2)
 
 
 def test_pathlasso_C1():
-    aux_test_pathlasso((X, C, np.sign(y)), "C1", "Path-Alg")
+    for meth in ["Path-Alg", "CD"]:
+        aux_test_pathlasso((X, C, np.sign(y)), "C1", meth)
 
 
 def test_pathlasso_C2():
@@ -113,3 +252,56 @@ def test_pathlasso_R2_nactive():
         betas, lambdas = pathlasso((X, C, y), typ="R2", meth=meth, n_active=5)
         beta = betas[-1]
         assert sum(abs(beta) >= 1e-2) <= 6
+
+
+def test_pathlasso_sparse():
+    for typ in ["R1", "R2", "C1"]:
+        matrix = (X, C, np.sign(y)) if typ == "C1" else (X, C, y)
+        for intercept in [False, True]:
+            betas, lambdas = pathlasso(matrix, typ=typ, intercept=intercept, w=w)
+            path, lambdas2 = pathlasso(
+                matrix, typ=typ, intercept=intercept, w=w, sparse=True
+            )
+            assert_allclose(lambdas, lambdas2)
+            assert_allclose(path.evaluate(lambdas), betas, rtol=1e-8, atol=1e-8)
+
+
+def test_pathlasso_screening():
+    for typ in ["R1", "R2", "R3", "C1", "C2"]:
+        matrix = (X, C, np.sign(y)) if typ in ["C1", "C2"] else (X, C, y)
+        intercept = typ in ["R1", "R3"]
+        betas, lambdas = pathlasso(matrix, typ=typ, intercept=intercept, w=w)
+        betas2, lambdas2 = pathlasso(
+            matrix, typ=typ, intercept=intercept, w=w, screening=True
+        )
+        assert_allclose(lambdas, lambdas2)
+        assert_allclose(betas2, betas, rtol=1e-5, atol=1e-5)
+
+
+def test_pathlasso_working_set():
+    for typ in ["R1", "R2", "R3", "R4", "C1", "C2"]:
+        matrix = (X, C, np.sign(y)) if typ in ["C1", "C2"] else (X, C, y)
+        intercept = typ in ["R1", "R3"]
+        betas, lambdas = pathlasso(matrix, typ=typ, intercept=intercept, w=w)
+        betas2, lambdas2 = pathlasso(
+            matrix, typ=typ, intercept=intercept, w=w, working_set=True
+        )
+        assert_allclose(lambdas, lambdas2)
+        assert_allclose(betas2, betas, rtol=1e-5, atol=1e-5)
+
+    lambdas = np.linspace(1.0, 0.1, 10)
+    for meth in ["DR", "P-PDS", "CD"]:
+        betas = pathlasso((X, C, y), lambdas=lambdas, meth=meth)[0]
+        betas2 = pathlasso((X, C, y), lambdas=lambdas, meth=meth, working_set=True)[0]
+        assert_allclose(betas2, betas, rtol=tol, atol=tol)
+
+
+def test_lambda_max():
+    for typ in ["R1", "R2", "R3", "R4", "C1", "C2"]:
+        matrix = (X, C, np.sign(y)) if typ in ["C1", "C2"] else (X, C, y)
+        for intercept in [False, True]:
+            betas, lambdas = pathlasso(
+                matrix, lambdas=[1.0], typ=typ, intercept=intercept, e=20.0
+            )
+            lambdamax = lambda_max(matrix, typ=typ, intercept=intercept, e=20.0)
+            assert_allclose(lambdamax, lambdas[0], rtol=1e-12)
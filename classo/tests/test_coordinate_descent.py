@@ -0,0 +1,47 @@
+import numpy as np
+from numpy.testing import assert_allclose
+
+from ..coordinate_descent import coordinate_descent, pair_step, pathlasso_CD
+from ..compact_func import Classo, pathlasso
+from ..misc_functions import random_data
+
+tol = 1e-2
+
+m, d, d_nonzero, k, sigma = 30, 20, 5, 1, 0.5
+(X, C, y), sol = random_data(m, d, d_nonzero, k, sigma, zerosum=True, seed=42)
+
+
+def test_pair_step():
+    np.random.seed(1)
+    ts = np.linspace(-6, 6, 12001)
+    for _ in range(200):
+        bi, bj, grad = np.random.randn(3)
+        wi, wj = np.random.rand(2)
+        L = np.random.rand() + 0.1
+        t = pair_step(bi, bj, wi, wj, grad, L)
+        f = grad * ts + L / 2 * ts ** 2 + wi * abs(bi + ts) + wj * abs(bj - ts)
+        f_t = grad * t + L / 2 * t ** 2 + wi * abs(bi + t) + wj * abs(bj - t)
+        assert f_t <= np.min(f) + 1e-10
+
+
+def test_coordinate_descent_structures():
+    groups = np.arange(d) % 3
+    C_blocks = np.array([(groups == g).astype(float) for g in range(3)])
+    C_dense = np.random.RandomState(0).randn(2, d)
+    for CC, kind in [(C, "zero-sum"), (C_blocks, "blocks"), (C_dense, "dense")]:
+        cd = coordinate_descent((X, CC, y), "R1")
+        assert cd.Proj.kind == kind
+        assert cd.lagrangian == (kind == "dense")
+
+        lambdamax, beta = Classo((X, CC, y), 0.2, meth="Path-Alg", get_lambdamax=True)
+        beta2 = cd.solve(0.2 * lambdamax)
+        assert_allclose(CC.dot(beta2), 0.0, atol=1e-4)
+        assert_allclose(beta2, beta, rtol=tol, atol=tol)
+
+
+def test_pathlasso_CD():
+    lambdas = np.linspace(1.0, 0.1, 10)
+    betas, real_path = pathlasso((X, C, y), lambdas=lambdas, meth="Path-Alg")
+    cd = coordinate_descent((X, C, y), "R1")
+    betas2 = pathlasso_CD(cd, lambdas, real_path[0] / lambdas[0])
+    assert_allclose(betas2, betas, rtol=tol, atol=tol)
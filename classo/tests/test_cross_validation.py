@@ -8,10 +8,14 @@ from ..cross_validation import (
     train_test_CV,
     train_test_i,
     average_test,
+    full_path,
     accuracy_func,
+    accuracy_path,
     misclassification_rate,
     CV,
 )
+from ..misc_functions import gram_products
+from ..compact_func import Classo
 
 
 def test_train_test_CV_non_divisible():
@@ -63,6 +67,22 @@ def test_accuracy_func():
     assert np.isclose(result, exp)
 
 
+def test_accuracy_path():
+    np.random.seed(2)
+    A, BETAS = np.random.randn(12, 4), np.random.randn(6, 5)
+    y = np.random.randn(12)
+    for typ in ["R1", "R2", "R3", "C1"]:
+        yy = np.sign(y) if typ == "C1" else y
+        result = accuracy_path(A, yy, BETAS, typ, rho=0.5, intercept=True)
+        exp = [accuracy_func(A, yy, b, typ, rho=0.5, intercept=True) for b in BETAS]
+        assert np.allclose(result, exp)
+
+    # Huber function of the residuals, by samples
+    r = A.dot(BETAS[0, 1:]) + BETAS[0, 0] - y
+    exp = np.mean([x ** 2 if abs(x) < 0.5 else 0.5 * (2 * abs(x) - 0.5) for x in r])
+    assert np.isclose(accuracy_path(A, y, BETAS, "R2", 0.5, intercept=True)[0], exp)
+
+
 def test_misclassification_rate():
     A = np.diag([2, 5, -0.4, -2.0, -6.0, -1])
     y = np.array([1, -1, 1, -1, 1, -1])
@@ -89,3 +109,78 @@ def test_CV():
     print(out, MSE[i])
     print(i, i_1SE)
     assert i == len(lambdas) - 1
+
+
+def test_CV_parallel():
+    np.random.seed(3)
+    X, y = np.random.randn(40, 8), np.random.randn(40)
+    matrices = (X, np.ones((1, 8)), y)
+    lambdas = np.linspace(1.0, 0.05, 10)
+
+    out1, MSE1, SE1, i1, i1_1SE = CV(matrices, 4, lambdas=lambdas, intercept=True)
+    out2, MSE2, SE2, i2, i2_1SE = CV(
+        matrices, 4, lambdas=lambdas, intercept=True, n_jobs=2
+    )
+    # bit-identical
+    assert np.array_equal(MSE1, MSE2) and np.array_equal(SE1, SE2)
+    assert np.array_equal(out1, out2)
+    assert (i1, i1_1SE) == (i2, i2_1SE)
+
+
+def test_average_test_products():
+    np.random.seed(4)
+    X, y = np.random.randn(60, 8), np.random.randn(60)
+    matrices = (X, np.ones((1, 8)), y)
+    lambdas = np.linspace(1.0, 0.05, 10)
+    SUBLIST = train_test_CV(60, 4)
+    for typ, meth in [("R1", "Path-Alg"), ("R1", "P-PDS"), ("R3", "Path-Alg")]:
+        args = (matrices, typ, meth, SUBLIST, 1.345, -1.0, None, lambdas, None, True)
+        MSE1, SE1 = average_test(*args)
+        # products of the training sets downdated from the products of the whole data
+        MSE2, SE2 = average_test(*args, products=gram_products(X, y))
+        assert np.allclose(MSE1, MSE2) and np.allclose(SE1, SE2)
+
+
+def test_CV_adaptive():
+    np.random.seed(5)
+    X, y = np.random.randn(50, 10), np.random.randn(50)
+    y = y + X[:, 0] - X[:, 1]
+    matrices = (X, np.ones((1, 10)), y)
+    lambdas = 1e-3 ** (np.arange(60) / 59)
+
+    out1, MSE1, SE1, i1, i1_1SE = CV(matrices, 5, lambdas=lambdas, intercept=True)
+    out2, MSE2, SE2, i2, i2_1SE, lambdas2 = CV(
+        matrices, 5, lambdas=lambdas, intercept=True, adaptive=True
+    )
+    idx = np.searchsorted(-lambdas, -lambdas2)
+    assert np.array_equal(lambdas[idx], lambdas2) and len(idx) < len(lambdas)
+    assert np.all(np.diff(idx) > 0)
+    # same folds and same path : the errors are the ones of the full grid
+    assert np.allclose(MSE1[idx], MSE2) and np.allclose(SE1[idx], SE2)
+    assert idx[i2_1SE] == i1_1SE
+    assert np.allclose(out1, out2)
+
+
+def test_CV_full_path():
+    np.random.seed(6)
+    X, y = np.random.randn(60, 10), np.random.randn(60)
+    y = y + X[:, 0] - X[:, 1]
+    matrices = (X, np.ones((1, 10)), y)
+    lambdas = np.linspace(1.0, 0.05, 15)
+    SUBLIST = train_test_CV(60, 5)
+    for meth in ["DR", "PF-PDS"]:
+        # folds warm started along the path on the whole data
+        BETA, guide = full_path(
+            matrices, "R1", meth, 1.345, -1.0, None, lambdas, None, True
+        )
+        args = (matrices, "R1", meth, SUBLIST, 1.345, -1.0, None, lambdas, None, True)
+        MSE1, SE1 = average_test(*args)
+        MSE2, SE2 = average_test(*args, guide=guide)
+        assert np.allclose(MSE1, MSE2, rtol=1e-2)
+
+        # the output is the solution of the path on the whole data
+        out, MSE, SE, i, i_1SE = CV(
+            matrices, 5, num_meth=meth, lambdas=lambdas, intercept=True
+        )
+        beta = Classo(matrices, lambdas[i_1SE], meth=meth, intercept=True)
+        assert np.allclose(out, beta, rtol=1e-2, atol=1e-2)
@@ -14,6 +14,18 @@ from ..misc_functions import (
     check_size,
     random_data,
     clr,
+    proj_c,
+    ker_projector,
+    dr_resolvent,
+    mean_shift_matrix,
+    mean_shift_resolvent,
+    anderson,
+    duality_gap,
+    solver_budget,
+    soft_thresholding,
+    workspace,
+    gram_products,
+    guided_state,
 )
 
 from ..path_alg import next_idr2, next_idr1
@@ -236,3 +248,199 @@ def test_next_idr2():
     mat[exp, exp] = 0.0
     value = next_idr2(l, mat)
     assert exp == value
+
+
+def test_ker_projector():
+    np.random.seed(2)
+    d = 12
+    x = np.random.randn(d)
+    groups = np.arange(d) % 3
+    blocks = np.array([(groups == g).astype(float) for g in range(3)])
+    blocks[2, 2] = 0.0
+    constraints = [
+        ("zero-sum", np.ones((1, d))),
+        ("blocks", 2.0 * blocks),
+        ("none", np.zeros((2, d))),
+        ("dense", np.random.randn(3, d)),
+    ]
+    for kind, C in constraints:
+        proj = ker_projector(C)
+        assert proj.kind == kind
+        assert_allclose(proj.dot(x), proj_c(C, d).dot(x), atol=1e-12)
+        out = np.empty(d)
+        assert proj.dot(x, out=out) is out
+        assert_allclose(out, proj_c(C, d).dot(x), atol=1e-12)
+
+    C = np.random.randn(2, d)
+    C = np.vstack([C, C[0] + C[1]])
+    px = ker_projector(C).dot(x)
+    assert_allclose(C.dot(px), 0.0, atol=1e-12)
+    assert_allclose(ker_projector(C).dot(px), px, atol=1e-12)
+
+
+def test_dr_resolvent():
+    np.random.seed(4)
+    for n, d in [(8, 20), (20, 8)]:
+        A, coef = np.random.randn(n, d), 0.7
+        Q1 = coef * A.T.dot(np.linalg.inv(2 * np.eye(n) + coef * A.dot(A.T)))
+        Q2 = np.linalg.inv(2 * np.eye(d) + coef * A.T.dot(A))
+        Q = dr_resolvent(coef, A)
+        u, x = np.random.randn(n), np.random.randn(d)
+        assert Q.wide == (n <= d)
+        assert_allclose(Q.q1(u), Q1.dot(u), atol=1e-12)
+        assert_allclose(Q.qa(x), Q1.dot(A).dot(x), atol=1e-12)
+        assert_allclose(Q.q2(x), Q2.dot(x), atol=1e-12)
+        # the same operators written in given arrays
+        out = np.empty(d)
+        assert Q.q1(u, out=out) is out
+        assert_allclose(out, Q1.dot(u), atol=1e-12)
+        assert_allclose(Q.qa(x, out=out), Q1.dot(A).dot(x), atol=1e-12)
+        assert_allclose(Q.q2(x, out=out), Q2.dot(x), atol=1e-12)
+
+
+def test_mean_shift_matrix_and_resolvent():
+    np.random.seed(5)
+    for (n, d), centered in [((8, 20), False), ((8, 20), True), ((20, 8), True)]:
+        A, r, coef = np.random.randn(n, d), 0.7, 1.3
+        E = np.eye(n)
+        if centered:
+            A, E = A - np.mean(A, axis=0), E - 1.0 / n
+        dense = np.concatenate([A, r * E], axis=1)
+        M = mean_shift_matrix(A, r, centered=centered)
+        x, u = np.random.randn(d + n), np.random.randn(n)
+        assert M.shape == dense.shape
+        assert_allclose(M.dot(x), dense.dot(x), atol=1e-12)
+        assert_allclose(M.T.dot(u), dense.T.dot(u), atol=1e-12)
+
+        Q, Q_dense = mean_shift_resolvent(coef, M), dr_resolvent(coef, dense)
+        assert_allclose(Q.q1(u), Q_dense.q1(u), atol=1e-12)
+        assert_allclose(Q.q2(x), Q_dense.q2(x), atol=1e-12)
+        out = np.empty(d + n)
+        assert_allclose(Q.q2(x, out=out), Q_dense.q2(x), atol=1e-12)
+
+
+def test_soft_thresholding():
+    np.random.seed(8)
+    b, w = np.random.randn(50), np.append(np.zeros(5), np.random.rand(45))
+    expected = np.sign(b) * np.maximum(abs(b) - w, 0.0)
+    out = np.empty(50)
+    assert soft_thresholding(b, w, out=out) is out
+    assert_allclose(out, expected)
+    assert_allclose(soft_thresholding(b, 0.3), np.sign(b) * np.maximum(abs(b) - 0.3, 0.0))
+
+
+def test_workspace():
+    work = workspace()
+    u = work.get("u", 10)
+    assert work.get("u", 10) is u
+    assert len(work.get("u", 5)) == 5
+    init = (1.0, np.zeros(3))
+    s, x = work.state(init)
+    x += 1.0
+    assert s == 1.0
+    assert_allclose(init[1], 0.0)
+
+
+def test_gram_products():
+    np.random.seed(7)
+    A, y = np.random.randn(30, 6), np.random.randn(30) + 2.0
+    w, r = np.linspace(0.5, 2.0, 6), 0.7
+    test = np.arange(0, 30, 4)
+    train = np.setdiff1d(np.arange(30), test)
+    products = gram_products(A, y).downdate(A[test], y[test])
+    A, y = A[train], y[train]
+    assert products.n == len(train)
+    assert_allclose(products.AtA, A.T.dot(A))
+    assert_allclose(products.Aty, A.T.dot(y))
+
+    products = products.centered().scaled(w=w, r=r)
+    A, y = r * (A - np.mean(A, axis=0)) / w, r * (y - np.mean(y))
+    assert_allclose(products.AtA, A.T.dot(A), atol=1e-12)
+    assert_allclose(products.Aty, A.T.dot(y), atol=1e-12)
+    assert_allclose(products.Asum, 0.0, atol=1e-12)
+
+
+def test_guided_state():
+    state = (1.0, np.zeros(3), np.zeros(5))
+    previous = (0.0, np.ones(3), np.zeros(4))
+    current = (0.5, 2 * np.ones(3), np.ones(4))
+    s, x, r = guided_state(state, previous, current)
+    # the residual, of another size, is not moved
+    assert s == 1.5
+    assert_allclose(x, 1.0)
+    assert r is state[2]
+    # states of different structures are not moved
+    assert guided_state(state, previous, current[:2]) is state
+
+
+def test_anderson():
+    # linear contraction with slow modes : T(z) = M.z + c, where z = (x, s) with s a float
+    np.random.seed(6)
+    U = np.linalg.qr(np.random.randn(30, 30))[0]
+    M = U.dot(np.diag(np.linspace(0.0, 0.99, 30))).dot(U.T)
+    c = np.random.randn(30)
+    sol = np.linalg.solve(np.eye(30) - M, c)
+
+    def iterations(acc):
+        x, s = np.zeros(29), 0.0
+        for i in range(5000):
+            Mz = M.dot(np.append(x, s)) + c
+            Tz = (Mz[:-1], float(Mz[-1]))
+            if np.linalg.norm(Mz - np.append(x, s)) < 1e-10:
+                return Tz, i
+            x, s = Tz if acc is None else acc.step((x, s), Tz)
+        return Tz, i
+
+    (x, s), n_plain = iterations(None)
+    (x2, s2), n_acc = iterations(anderson(5))
+
+    assert type(s2) == float
+    assert n_acc < n_plain / 5
+    assert_allclose(np.append(x2, s2), sol, atol=1e-8)
+
+
+def test_duality_gap():
+    np.random.seed(7)
+    m, d = 30, 12
+    A, y = np.random.randn(m, d), np.random.randn(m)
+    C = np.ones((1, d))
+    lamb = 0.3 * np.max(abs(A.T.dot(y - np.mean(y)))) * 2
+    for typ in ["R1", "R2", "R3", "R4", "C1", "C2"]:
+        yy = np.sign(y) if typ in ["C1", "C2"] else y
+        rho = -0.5 if typ == "C2" else 1.345
+        for intercept in [False, True]:
+            # weak duality, at random feasible points
+            for i in range(5):
+                beta = np.random.randn(d)
+                beta = beta - np.mean(beta)
+                if intercept:
+                    beta = np.append(np.random.randn(), beta)
+                gap = duality_gap(
+                    (A, C, yy), beta, lamb, typ, rho, intercept=intercept
+                )
+                assert gap >= -1e-12
+
+    # at the solution : 0 at lambdamax, and the constrained least squares for a tiny lambda
+    beta = np.zeros(d)
+    lambdamax = 2 * np.max(abs(A.T.dot(y) - np.mean(A.T.dot(y))))
+    assert abs(duality_gap((A, C, y), beta, lambdamax, "R1")) < 1e-12
+
+    AtA, Aty = A.T.dot(A), A.T.dot(y)
+    K = np.block([[AtA, C.T], [C, np.zeros((1, 1))]])
+    beta = np.linalg.solve(K, np.append(Aty, 0.0))[:d]
+    assert abs(duality_gap((A, C, y), beta, 1e-10, "R1")) < 1e-8
+
+
+def test_solver_budget():
+    budget = solver_budget(max_iter=10)
+    assert not budget.out_of_time()
+    assert budget.converged
+    assert str(budget) == "converged after 0 iterations"
+
+    budget = solver_budget(max_time=0.0)
+    assert budget.out_of_time()
+    assert not budget.converged
+    budget.max_time = None
+    budget.start()
+    assert not budget.out_of_time()
+    assert budget.converged
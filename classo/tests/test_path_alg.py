@@ -0,0 +1,180 @@
+import numpy as np
+from numpy.testing import assert_allclose
+
+from ..path_alg import (
+    active_factor,
+    active_rows,
+    activity_steps,
+    chol_update,
+    first_switch,
+    gram_columns,
+    h_lambdamax,
+    parameters_for_update,
+    solve_path,
+    sparse_path,
+    to_sparse_path,
+)
+
+tol = 1e-8
+
+np.random.seed(3)
+A = np.random.randn(40, 15)
+M = A.T.dot(A) + 1e-3 * np.eye(15)
+
+
+def gram(rows, cols):
+    return M[np.ix_(rows, cols)]
+
+
+def test_chol_update_and_downdate():
+    L = np.linalg.cholesky(M)
+    x = np.random.randn(15)
+
+    assert chol_update(L, x)
+    assert_allclose(L.dot(L.T), M + np.outer(x, x), rtol=tol, atol=tol)
+
+    assert chol_update(L, x, sign=-1.0)
+    assert_allclose(L.dot(L.T), M, rtol=tol, atol=tol)
+
+
+def test_chol_downdate_not_positive():
+    L = np.linalg.cholesky(M)
+    x = np.zeros(15)
+    x[0] = 2 * np.sqrt(M[0, 0])
+
+    assert not chol_update(L, x, sign=-1.0)
+
+
+def test_active_factor_add_remove():
+    fact = active_factor(gram, [3])
+    for i in [7, 0, 12, 5]:
+        fact.add(i)
+    fact.remove(0)
+    fact.remove(12)
+    fact.add(9)
+
+    assert fact.order == [3, 7, 5, 9]
+    assert_allclose(
+        fact.L.dot(fact.L.T), gram(fact.order, fact.order), rtol=tol, atol=tol
+    )
+
+
+def test_active_factor_solve():
+    order = [1, 4, 6, 10, 11]
+    fact = active_factor(gram, order)
+    C = np.ones((1, len(order)))
+    s = np.random.randn(len(order))
+
+    x, v = fact.solve(s, C)
+
+    assert_allclose(gram(order, order).dot(x) + C.T.dot(v), s, rtol=tol, atol=tol)
+    assert_allclose(C.dot(x), 0.0, rtol=tol, atol=tol)
+
+
+def test_activity_steps_and_first_switch():
+    d, lam, lambdamax = 30, 0.5, 3.0
+    activity = list(np.random.rand(d) < 0.3)
+    beta = np.random.randn(d) * np.array(activity)
+    beta_dot = np.random.randn(d) * np.array(activity)
+    lam_s_dot = np.random.uniform(-2, 2, d)
+    s = np.random.uniform(-1, 1, d)
+    skip = abs(lam_s_dot - s) < 1e-10
+
+    L = activity_steps(activity, beta, beta_dot, lam_s_dot, s, lam, lambdamax, skip)
+
+    for i in range(d):
+        bi, di, e, s0 = beta[i], beta_dot[i], lam_s_dot[i], s[i]
+        if activity[i]:
+            expected = bi / (di * lambdamax) if bi * di > 1e-10 else lam
+        elif e > s0:
+            expected = (1 + s0) / (1 + e) * lam
+        else:
+            expected = (1 - s0) / (1 - e) * lam
+        assert_allclose(L[i], expected, rtol=tol)
+
+    assert first_switch(np.array([np.inf, 0.3, 0.1, 0.1]), 0.2) == (2, 0.1)
+    assert first_switch(np.array([np.inf, 0.3]), 0.2) == (None, 0.2)
+
+
+def test_active_rows():
+    groups = np.arange(15) % 4
+    C = np.array([(groups == g).astype(float) for g in range(4)])
+    C = np.vstack([C, C[0] + C[1]])
+    rows = active_rows(C)
+
+    for i in [0, 1, 4, 5, 2]:
+        rows.add(i)
+    assert rows.rows == [0, 1, 2]
+    rows.remove(4)
+    rows.remove(0)
+    assert rows.rows == [1, 2]
+
+    for j in range(len(C)):
+        restricted = C[rows.rows][:, rows.order]
+        if not rows.idr[j]:
+            proj = np.linalg.lstsq(restricted.T, C[j, rows.order], rcond=None)[0]
+            assert_allclose(restricted.T.dot(proj), C[j, rows.order], atol=tol)
+    assert_allclose(
+        rows.Q.dot(rows.R), C[rows.rows][:, rows.order].T, rtol=tol, atol=tol
+    )
+
+
+def test_gram_columns():
+    F = np.random.rand(40) < 0.7
+    Abar = np.mean(A[F], axis=0)
+    P = A[F] - Abar
+    dense = 2 * P.T.dot(P) + 2e-3 * np.eye(15)
+    gram = gram_columns(A, F, 1e-3, AbarF=Abar, cache_size=3)
+    v = np.zeros(15)
+    v[[2, 5]] = np.random.randn(2)
+
+    assert_allclose(gram.block([0, 2, 5], [2, 5]), dense[np.ix_([0, 2, 5], [2, 5])])
+    assert_allclose(gram.dot(v), dense.dot(v))
+    assert_allclose(gram.dot(np.ones(15)), dense.dot(np.ones(15)))
+
+    u = np.random.randn(15)
+    gram.update(u, -1.0, AbarF=Abar)
+    assert_allclose(gram.dot(v), (dense - np.outer(u, u)).dot(v))
+
+
+def test_solve_path_lazy_gram():
+    y = A.dot(np.concatenate([np.ones(3), np.zeros(12)])) + 0.1 * np.random.randn(40)
+    C = np.ones((1, 15))
+    for typ, yy in [("R1", y), ("R2", y), ("C1", np.sign(y))]:
+        dense = solve_path((A, C, yy), 0.05, False, 1.345, typ, intercept=True)
+        lazy = solve_path(
+            (A, C, yy), 0.05, False, 1.345, typ, intercept=True, lazy_gram=True
+        )
+        assert_allclose(lazy[1], dense[1], rtol=1e-6, atol=1e-6)
+
+
+def test_h_lambdamax_and_given_state():
+    y = A.dot(np.concatenate([np.ones(3), np.zeros(12)])) + 0.1 * np.random.randn(40)
+    C = np.ones((1, 15))
+    for typ, yy, rho in [("R2", y, 1.345), ("C2", np.sign(y), -1.0)]:
+        param = parameters_for_update((A, C, yy), 0.0, rho, typ, intercept=True)
+        assert h_lambdamax((A, C, yy), rho, typ, intercept=True) == param.lambdamax
+
+        out = solve_path((A, C, yy), 0.1, False, rho, typ, intercept=True)
+        out2 = solve_path(
+            (A, C, yy), 0.1, False, rho, typ, intercept=True, param=param
+        )
+        assert_allclose(out2[1], out[1])
+
+
+def test_sparse_path_evaluate():
+    path = sparse_path(4, intercept=True)
+    path.append(np.zeros(4), 1.0, 0.5)
+    path.append(np.array([0.0, 2.0, 0.0, 0.0]), 0.5, 1.0)
+    path.append(np.array([0.0, 4.0, 0.0, -2.0]), 0.5, 1.0)
+    path.append(np.array([1.0, 6.0, 0.0, -4.0]), 0.25, 2.0)
+
+    BETAS = path.evaluate([2.0, 0.75, 0.5, 0.375, 0.1])
+
+    assert_allclose(BETAS[0], [0.5, 0.0, 0.0, 0.0, 0.0])
+    assert_allclose(BETAS[1], [0.75, 0.0, 1.0, 0.0, 0.0])
+    assert_allclose(BETAS[2], [1.0, 0.0, 2.0, 0.0, 0.0])
+    assert_allclose(BETAS[3], [1.5, 0.5, 5.0, 0.0, -3.0])
+    assert_allclose(BETAS[4], path.beta(3))
+    path = to_sparse_path(BETAS, [2.0, 0.75, 0.5, 0.375, 0.1], intercept=True)
+    assert_allclose(path.to_dense(), BETAS)
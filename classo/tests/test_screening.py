@@ -0,0 +1,63 @@
+import numpy as np
+from numpy.testing import assert_allclose
+
+from ..compact_func import pathlasso
+from ..misc_functions import random_data
+from ..screening import (
+    gap_safe_R1,
+    kkt_correlations,
+    kkt_violations,
+    loss_residual,
+    restrict_constraint,
+    strong_rule,
+)
+
+tol = 1e-6
+
+m, d, d_nonzero, k, sigma = 30, 40, 5, 1, 0.5
+(X, C, y), sol = random_data(m, d, d_nonzero, k, sigma, zerosum=True, seed=4)
+lambdas = [0.8, 0.5, 0.3]
+
+
+def test_kkt_correlations_at_solution():
+    betas, real = pathlasso((X, C, y), lambdas=lambdas, typ="R1")
+    for beta, lamb in zip(betas, real):
+        u = loss_residual((X, C, y), beta, "R1")
+        c, lam = kkt_correlations((X, C, y), u, beta)
+        active = beta != 0
+
+        assert_allclose(lam, lamb / 2, rtol=1e-4)
+        assert_allclose(abs(c[active]), lam, rtol=1e-4)
+        assert np.all(abs(c[~active]) <= lam * (1 + 1e-4))
+        assert not np.any(kkt_violations(c, lam, active))
+
+
+def test_strong_rule_and_gap_safe_R1():
+    betas, real = pathlasso((X, C, y), lambdas=lambdas, typ="R1")
+    for i in range(len(lambdas) - 1):
+        u = loss_residual((X, C, y), betas[i], "R1")
+        c, lam = kkt_correlations((X, C, y), u, betas[i])
+        kept = strong_rule(c, lam, lambdas[i + 1], lambdas[i], betas[i])
+        kept &= gap_safe_R1((X, C, y), betas[i], 2 * c, real[i + 1])
+
+        assert np.all(kept[betas[i + 1] != 0])
+        assert np.sum(kept) < d
+
+
+def test_restrict_constraint():
+    groups = np.arange(d) % 4
+    C2 = np.array([(groups == g).astype(float) for g in range(4)])
+    C2 = np.vstack([C2, C2[0] + C2[1]])
+    kept = groups != 2
+
+    reduced = restrict_constraint(C2, kept)
+    assert np.linalg.matrix_rank(reduced) == len(reduced) == 3
+    # the two constraint matrices have the same kernel
+    proj = np.linalg.lstsq(reduced.T, C2[:, kept].T, rcond=None)[0]
+    assert_allclose(reduced.T.dot(proj), C2[:, kept].T, atol=tol)
+
+    assert_allclose(restrict_constraint(C2, groups == 2), C2[2:3, groups == 2])
+    assert_allclose(
+        restrict_constraint(np.zeros((1, d)), kept), np.zeros((1, np.sum(kept)))
+    )
+
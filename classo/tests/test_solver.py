@@ -339,6 +339,62 @@ def aux_test_solve_StabSel_LAMfixed(mode, close_window=True):
         plt.close("all")
 
 
+def test_solve_gap():
+    pb = classo_problem(X, y, C=C)
+    pb.formulation.concomitant = False
+    pb.formulation.intercept = True
+    pb.model_selection.PATH = True
+    pb.model_selection.StabSel = False
+    pb.model_selection.LAMfixed = True
+    selection = pb.model_selection
+    for param in [selection.PATHparameters, selection.LAMfixedparameters]:
+        param.numerical_method = "P-PDS"
+        param.gap = 1e-6
+    selection.PATHparameters.Nlam = 10
+    pb.solve()
+
+    assert 0.0 <= pb.solution.LAMfixed.gap < 2e-6
+    gaps = pb.solution.PATH.GAPS
+    assert gaps.shape == (10,)
+    assert np.all(gaps < 2e-6)
+
+
+def test_solve_budget():
+    pb = classo_problem(X, y, C=C)
+    pb.formulation.concomitant = False
+    pb.model_selection.PATH = True
+    pb.model_selection.StabSel = False
+    pb.model_selection.LAMfixed = True
+    selection = pb.model_selection
+    for param in [selection.PATHparameters, selection.LAMfixedparameters]:
+        param.numerical_method = "DR"
+        param.max_iter = 3
+    pb.solve()
+
+    assert not pb.solution.LAMfixed.converged
+    assert not pb.solution.PATH.converged
+    assert "Stopped by the budget" in str(pb.solution.LAMfixed)
+
+
+def test_solve_CV_adaptive():
+    pb = classo_problem(X, y, C=C)
+    pb.formulation.concomitant = False
+    pb.model_selection.CV = True
+    pb.model_selection.PATH = False
+    pb.model_selection.StabSel = False
+    pb.model_selection.LAMfixed = False
+    param = pb.model_selection.CVparameters
+    param.adaptive = True
+    param.numerical_method = "P-PDS"
+    pb.solve()
+
+    solution = pb.solution.CV
+    assert len(solution.xGraph) < param.Nlam
+    assert len(solution.yGraph) == len(solution.xGraph)
+    assert solution.lambda_1SE == solution.xGraph[solution.index_1SE]
+    assert "adaptive" in str(param)
+
+
 def test_choose_numerical_method_R4DR():
     formulation = Formulation()
     formulation.huber = True
@@ -347,6 +403,22 @@ def test_choose_numerical_method_R4DR():
         assert value == "DR"
 
 
+def test_choose_numerical_method_CD():
+    formulation = Formulation()
+    formulation.concomitant = False
+    for model in ["PATH", "StabSel", "CV"]:
+        assert choose_numerical_method("CD", model, formulation) == "CD"
+        formulation.classification = True
+        assert choose_numerical_method("CD", model, formulation) == "CD"
+        formulation.huber = True
+        assert choose_numerical_method("CD", model, formulation) == "Path-Alg"
+        formulation.classification = False
+        formulation.concomitant = True
+        assert choose_numerical_method("CD", model, formulation) == "Path-Alg"
+        formulation.huber, formulation.concomitant = False, False
+    assert choose_numerical_method("CD", "LAM", formulation, lam=0.1) == "CD"
+
+
 def test_choose_numerical_method_2():
     formulation = Formulation()
 